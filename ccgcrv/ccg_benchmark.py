@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4
+
+"""
+Benchmarks for the time consuming parts of the curve fitting/filtering.
+
+Times ccgFilter construction, _filter_data(), _lin_interp() with and without
+a gap value, stats(), getMonthlyMeans() and the ccgcrv.py exports at sample
+and equally spaced dates, for synthetic series of increasing size.
+
+Every run first checks the output of ccgcrv.py for the repository's test data
+(tests/test_data/mlotestdata.txt) against its expected results, as in tests/test_curvefitting.py.
+
+The outputs for the synthetic series can be saved as a reference and checked against it later,
+so that a change can be timed and checked for differences in one run, e.g.
+
+	python -m ccgcrv.ccg_benchmark --save before.npz
+	(make changes)
+	python -m ccgcrv.ccg_benchmark --check before.npz
+
+Exits with status 1 if any output differs from the expected results or the reference.
+"""
+from __future__ import print_function
+
+import io
+import os
+import re
+import sys
+import timeit
+import argparse
+import tempfile
+import contextlib
+
+import numpy
+
+from ccgcrv.ccg_filter import ccgFilter
+from ccgcrv.ccgcrv import ccgcrv, _ccgcrv_parser, export_dates
+
+SIZES = [1000, 10000, 100000, 1000000]
+
+# largest number of values of each output kept in the reference
+MAXKEEP = 5000
+
+# options used for the export benchmarks
+EXPORT_OPTIONS = ['--orig', '--func', '--poly', '--smooth', '--trend', '--detrend',
+				'--smcycle', '--harm', '--res', '--gr', '--showheader']
+
+# test data of the repository, and the expected output of ccgcrv.py for it
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests', 'test_data')
+EXPECTED_INPUT = os.path.join(TEST_DATA_DIR, 'mlotestdata.txt')
+EXPECTED_OUTPUT = os.path.join(TEST_DATA_DIR, 'expected_curvefit_results.txt')
+
+# options that made the expected output, as in tests/test_curvefitting.py
+EXPECTED_OPTIONS = {'npoly': 2, 'nharm': 2, 'equal': '', 'showheader': '', 'func': '', 'poly': '',
+				'trend': '', 'res': '', 'stats': '', 'amp': '', 'mm': '', 'annual': ''}
+
+
+#########################################################################
+def synthetic_series(n, seed=0):
+	""" Daily data for n days starting in 1900, with a trend, seasonal cycle and noise.
+	About 10% of the days are missing at random, and 30 days are missing every 2000 days.
+	"""
+
+	rng = numpy.random.default_rng(seed)
+	days = numpy.arange(int(n*1.12) + 100)
+	keep = (rng.random(days.size) > 0.1) & (days % 2000 < 1970)
+	days = days[keep][:n]
+
+	x = 1900 + days/365.0
+	t = x - 1900
+	y = 300 + 0.5*t + 0.01*t*t + 3*numpy.sin(2*numpy.pi*x) + numpy.cos(4*numpy.pi*x) + rng.normal(0, 0.5, x.size)
+
+	return x, y
+
+
+#########################################################################
+def _thin(values):
+	""" At most MAXKEEP evenly spaced values of an array, along the first axis """
+
+	values = numpy.asarray(values, dtype=float)
+	if values.shape[0] <= MAXKEEP:
+		return values
+
+	return values[numpy.linspace(0, values.shape[0]-1, MAXKEEP).astype(int)]
+
+
+#########################################################################
+def _text_numbers(text):
+	""" All of the numbers in a block of text, for comparing formatted output """
+
+	return numpy.array(re.findall(r"[-+]?\d+\.?\d*(?:[eE][-+]?\d+)?", text), dtype=float)
+
+
+#########################################################################
+def _export(filt, sample):
+	""" Output of ccgcrv.py export_dates() at the sample dates,
+	or at equally spaced dates in calendar format.
+	"""
+
+	if sample:
+		args = EXPORT_OPTIONS + ['--sample']
+		x = filt.xp
+	else:
+		args = EXPORT_OPTIONS + ['--equal', '--cal']
+		x = filt.xinterp
+	options = _ccgcrv_parser().parse_args(args)
+
+	fp = io.StringIO()
+	export_dates(options, fp, filt, x)
+	return fp.getvalue()
+
+
+#########################################################################
+def run_benchmarks(n, repeat=3):
+	""" Time each benchmark for a series of n points.
+	Returns a list of (name, best time in seconds) and a dict of outputs.
+	"""
+
+	x, y = synthetic_series(n)
+	filt = ccgFilter(x, y)
+	work = filt.xp - filt.timezero
+
+	cases = [
+		("ccgFilter", lambda: ccgFilter(x, y)),
+		("_filter_data", lambda: filt._filter_data(filt.gap)),
+		("_lin_interp", lambda: filt._lin_interp(work, filt.resid, 0)),
+		("_lin_interp gap", lambda: filt._lin_interp(work, filt.resid, 10)),
+		("stats", filt.stats),
+		("getMonthlyMeans", filt.getMonthlyMeans),
+		("export sample", lambda: _export(filt, True)),
+		("export equal cal", lambda: _export(filt, False)),
+	]
+
+	times = []
+	for name, func in cases:
+		t = timeit.repeat(func, number=1, repeat=repeat)
+		times.append((name, min(t)))
+
+	outputs = {
+		"params": filt.params,
+		"smooth": _thin(filt.smooth),
+		"trend": _thin(filt.trend),
+		"deriv": _thin(filt.deriv),
+		"interp": _thin(filt._lin_interp(work, filt.resid, 10)[1]),
+		"stats": _text_numbers(filt.stats()),
+		"mm": _thin(filt.getMonthlyMeans()),
+		"export sample": _thin(_text_numbers(_export(filt, True))),
+		"export equal cal": _thin(_text_numbers(_export(filt, False))),
+	}
+
+	return times, outputs
+
+
+#########################################################################
+def compare_outputs(outputs, reference, rtol=1e-6, atol=1e-9):
+	""" Names of the outputs that differ from the reference values """
+
+	differ = []
+	for name, values in outputs.items():
+		ref = reference.get(name)
+		if ref is None or ref.shape != values.shape or not numpy.allclose(values, ref, rtol=rtol, atol=atol):
+			differ.append(name)
+
+	return differ
+
+
+#########################################################################
+def _read_columns(filename):
+	""" Columns of a whitespace separated table with a header line, as a dict of name: values """
+
+	with open(filename) as f:
+		names = f.readline().split()
+	values = numpy.loadtxt(filename, skiprows=1, ndmin=2)
+
+	return dict(zip(names, values.T))
+
+
+#########################################################################
+def check_expected_results(rtol=1e-6, input_file=EXPECTED_INPUT, expected_file=EXPECTED_OUTPUT):
+	""" Run ccgcrv.py for the repository's test data, and compare its output with the expected results.
+	Returns the names of the columns that differ (every column, if the columns or numbers of rows differ).
+	"""
+
+	expected = _read_columns(expected_file)
+	with tempfile.TemporaryDirectory() as td:
+		options = dict(EXPECTED_OPTIONS, file=os.path.join(td, 'output.txt'))
+		# the statistics printed by ccgcrv.py are not part of the comparison
+		with contextlib.redirect_stdout(io.StringIO()):
+			ccgcrv(options, input_file)
+		output = _read_columns(options['file'])
+
+	if list(output) != list(expected) or any(output[name].shape != expected[name].shape for name in expected):
+		return sorted(set(output) | set(expected))
+
+	return [name for name in expected if not numpy.allclose(output[name], expected[name], rtol=rtol, atol=0)]
+
+
+#########################################################################
+def _benchmark_parser():
+	parser = argparse.ArgumentParser(description="Time the curve fitting/filtering for synthetic series, "
+												"and optionally check the results against a reference.")
+
+	parser.add_argument('--sizes', nargs='+', type=int, default=SIZES,
+						help="Number of points in each synthetic series. Default is %s." % " ".join(str(s) for s in SIZES))
+	parser.add_argument('--repeat', type=int, default=3,
+						help="Number of times to run each benchmark; the shortest time is shown. Default is 3.")
+	group = parser.add_mutually_exclusive_group()
+	group.add_argument('--save', help="Save the outputs to this .npz file, for use as a reference.")
+	group.add_argument('--check', help="Check the outputs against a reference .npz file made with --save.")
+	parser.add_argument('--rtol', type=float, default=1e-6,
+						help="Relative tolerance for --check and for the expected results. Default is 1e-6.")
+
+	return parser
+
+
+#########################################################################
+def _main(options, fp=sys.stdout):
+	""" Check the expected results, run the benchmarks and print a table of times.
+	Returns the number of outputs that differ.
+	"""
+
+	reference = None
+	if options.check:
+		with numpy.load(options.check) as f:
+			reference = dict(f)
+
+	differ = check_expected_results(options.rtol)
+	if differ:
+		print("%s: output differs from %s: %s" % (os.path.basename(EXPECTED_INPUT),
+				os.path.basename(EXPECTED_OUTPUT), ", ".join(differ)), file=fp)
+	else:
+		print("%s: output matches %s" % (os.path.basename(EXPECTED_INPUT), os.path.basename(EXPECTED_OUTPUT)), file=fp)
+	ndiffer = len(differ)
+
+	saved = {}
+	print("%10s  %-18s %12s" % ("points", "benchmark", "seconds"), file=fp)
+	for n in options.sizes:
+		times, outputs = run_benchmarks(n, options.repeat)
+		for name, t in times:
+			print("%10d  %-18s %12.6f" % (n, name, t), file=fp)
+
+		if options.save:
+			saved.update(("%d/%s" % (n, name), values) for name, values in outputs.items())
+		if reference is not None:
+			ref = {name.split("/", 1)[1]: values for name, values in reference.items() if name.startswith("%d/" % n)}
+			differ = compare_outputs(outputs, ref, options.rtol)
+			if differ:
+				print("%10d  outputs differ from reference: %s" % (n, ", ".join(differ)), file=fp)
+			else:
+				print("%10d  outputs match reference" % n, file=fp)
+			ndiffer += len(differ)
+
+	if options.save:
+		numpy.savez(options.save, **saved)
+
+	return ndiffer
+
+
+if __name__ == "__main__":
+	sys.exit(1 if _main(_benchmark_parser().parse_args()) else 0)
@@ -261,10 +261,144 @@ def dateFromDecimalDate(dd) -> datetime.date:
 def dec2date(dd) -> np.ndarray:
 	"""Decimal date array to array of tuples"""
 
-	a = np.empty((dd.size, 6))
 	# dd is a numpy array of decimal dates
-	for i in range(dd.size):
-		yr, mon, dy, hr, mn, sc = calendarDate(dd[i])
-		a[i] = (yr, mon, dy, hr, mn, sc)
+	return np.column_stack(calendarDateArray(np.asarray(dd, dtype=float).ravel())).astype(float)
 
-	return a
+
+###################################################
+# Array versions of the routines above.
+# These give the same results as the scalar routines, element by element.
+###################################################
+def _isLeapArray(year) -> np.ndarray:
+	return ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+
+
+###################################################
+def datesOkArray(year, month, day, hour=0, minute=0, second=0) -> bool:
+	"""Check if all values are appropriate for real dates """
+
+	for name, values, lo, hi in (("Month", month, 1, 12),
+								 ("Day", day, 1, 31),
+								 ("Hour", hour, 0, 23),
+								 ("Minute", minute, 0, 59),
+								 ("Second", second, 0, 59)):
+		values = np.asarray(values)
+		if np.any((values < lo) | (values > hi)):
+			raise ValueError("%s is out of range" % name)
+
+	return True
+
+
+###################################################
+def dayOfYearArray(year, month, day) -> np.ndarray:
+	""" Day of year for arrays of year, month, day """
+
+	year = np.asarray(year, dtype=np.int64)
+	month = np.asarray(month, dtype=np.int64)
+	day = np.asarray(day, dtype=np.int64)
+	datesOkArray(year, month, day)
+
+	mona = np.array([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334])
+
+	x = mona[month-1] + day
+	x = x + (_isLeapArray(year) & (month > 2))
+
+	return x
+
+
+###################################################
+def decimalDateArray(year, month, day, hour=0, minute=0, second=0) -> np.ndarray:
+	""" Convert arrays of date and time components to fractional years. """
+
+	year = np.asarray(year, dtype=np.int64)
+	hour = np.asarray(hour, dtype=np.int64)
+	minute = np.asarray(minute, dtype=np.int64)
+	second = np.asarray(second, dtype=np.int64)
+	datesOkArray(year, month, day, hour, minute, second)
+
+	doy = dayOfYearArray(year, month, day)
+	soy = (doy-1)*86400 + hour*3600 + minute*60 + second
+
+	dd = np.where(_isLeapArray(year), year + soy/3.16224e7, year + soy/3.1536e7)
+
+	return dd
+
+
+###################################################
+def calendarDateArray(decyear) -> tuple:
+	""" Convert an array of decimal dates to arrays of
+	year, month, day, hour, minute, second.
+
+	Uses the same (year % 4) leap year rule as calendarDate().  A date that rounds
+	up to the end of a year is returned as January 1 of the next year.
+	"""
+
+	decyear = np.asarray(decyear, dtype=float)
+
+	dyr = np.trunc(decyear).astype(np.int64)
+	fyr = decyear - dyr
+
+	leap = dyr % 4 == 0
+	nsec = np.round(fyr * np.where(leap, 366*86400, 365*86400))
+
+	ndays = np.trunc(nsec / 86400).astype(np.int64)
+	doy = ndays + 1
+
+	# a day of year past the end of the year rolls over to the next year
+	over = doy > np.where(leap, 366, 365)
+	dyr = dyr + over
+	doy = np.where(over, 1, doy)
+	leap = dyr % 4 == 0
+
+	# cumulative days at the end of each month
+	mona = np.array([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334, 365])
+	monl = mona + (np.arange(13) >= 2)
+	month = np.where(leap, np.searchsorted(monl, doy), np.searchsorted(mona, doy))
+	day = doy - np.where(leap, monl[month-1], mona[month-1])
+
+	nsecs = np.round(nsec - (ndays*86400))
+	hour = np.trunc(nsecs / 3600).astype(np.int64)
+	minute = np.trunc((nsecs - (hour*3600)) / 60).astype(np.int64)
+	seconds = np.round(nsecs - (hour * 3600.0) - (minute * 60.0)).astype(np.int64)
+
+	return dyr, month, day, hour, minute, seconds
+
+
+###################################################
+def datetime64Components(dt) -> tuple:
+	""" Split an array of numpy.datetime64 into arrays of
+	year, month, day, hour, minute, second.  Fractions of a second are dropped.
+	"""
+
+	dt = np.asarray(dt, dtype='datetime64[s]')
+
+	years = dt.astype('datetime64[Y]')
+	months = dt.astype('datetime64[M]')
+	days = dt.astype('datetime64[D]')
+	sod = (dt - days).astype(np.int64)
+
+	year = years.astype(np.int64) + 1970
+	month = (months - years).astype(np.int64) + 1
+	day = (days - months).astype(np.int64) + 1
+
+	return year, month, day, sod // 3600, (sod % 3600) // 60, sod % 60
+
+
+###################################################
+def decimalDateFromDatetime64(dt) -> np.ndarray:
+	""" Array version of decimalDateFromDatetime, for numpy.datetime64 (or pandas DatetimeIndex) values """
+
+	return decimalDateArray(*datetime64Components(dt))
+
+
+###################################################
+def datetime64FromDecimalDate(dd) -> np.ndarray:
+	""" Array version of datetimeFromDecimalDate, returns numpy.datetime64[s] values """
+
+	yr, mon, dy, hr, mn, sc = calendarDateArray(dd)
+
+	dt = (yr - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (mon - 1).astype('timedelta64[M]')
+	dt = dt.astype('datetime64[D]') + (dy - 1).astype('timedelta64[D]')
+	dt = dt.astype('datetime64[s]') + (hr*3600 + mn*60 + sc).astype('timedelta64[s]')
+
+	return dt
@@ -100,6 +100,100 @@ def partial(n, x, numpoly):
 	return p
 
 
+#--------------------------------------------------
+def _average_interval(xp):
+	""" Average interval in days between sorted times xp that are at least 1 day apart,
+	rounded to whole days if more than 1 day.
+	"""
+
+	sd = 0
+	sdiff = 0
+	tx = xp[0]
+	for i in range(1, len(xp)):
+		if xp[i]-tx > 0.002739:
+			diff = xp[i]-tx
+			sdiff += diff
+			sd += 1
+		tx = xp[i]
+
+	avginterval = sdiff/sd * 365
+
+	if avginterval > 1:
+		return round(avginterval, 0)
+
+	return avginterval
+
+
+#--------------------------------------------------
+def _design_matrix(x, numpoly, numharm):
+	""" Vectorized version of partial(), the partial derivatives of the function
+	with respect to each parameter at times x, one column per parameter.
+	Without any parameters, the matrix has no columns.
+	"""
+
+	pi2 = 2*pi*x
+	columns = [numpy.ones_like(x)] if numpoly > 0 else []
+	columns += [numpy.power(x, float(n)) for n in range(1, numpoly)]
+	for i in range(1, numharm+1):
+		columns += [numpy.sin(i*pi2), numpy.cos(i*pi2)]
+
+	if not columns:
+		return numpy.zeros((numpy.size(x), 0))
+	return numpy.column_stack(columns)
+
+
+#--------------------------------------------------
+def _calendar_year_month(decyear):
+	""" Vectorized year and month of decimal dates, computed the same way as ccgFilter.calendarDate """
+
+	dyr = decyear.astype(int)
+	fyr = decyear - dyr
+
+	ndays = numpy.where(dyr % 4 == 0, 366, 365)
+	nsec = numpy.round(fyr * (ndays*86400))
+
+	days = numpy.floor(nsec / 86400).astype('timedelta64[D]')
+	dt = (dyr - 1970).astype('datetime64[Y]').astype('datetime64[D]') + days
+
+	months = dt.astype('datetime64[M]').astype(int)
+	return months // 12 + 1970, months % 12 + 1
+
+
+#--------------------------------------------------
+def _run_starts(codes):
+	""" Indices where each run of equal consecutive values in codes begins """
+
+	return numpy.flatnonzero(numpy.concatenate(([True], codes[1:] != codes[:-1])))
+
+
+#--------------------------------------------------
+def _grouped_mean_std(y, starts):
+	""" Mean, standard deviation (ddof=1) and count of y for contiguous groups beginning at starts.
+	Groups with a single point get a standard deviation of 0.
+	"""
+
+	n = numpy.diff(numpy.append(starts, y.size))
+	mean = numpy.add.reduceat(y, starts) / n
+	ss = numpy.add.reduceat((y - numpy.repeat(mean, n))**2, starts)
+	with numpy.errstate(invalid='ignore', divide='ignore'):
+		std = numpy.where(n > 1, numpy.sqrt(ss / (n - 1)), 0.0)
+
+	return mean, std, n
+
+
+#--------------------------------------------------
+def _first_index_in_group(mask, group, ngroups):
+	""" Index of the first True value of mask in each group """
+
+	idx = numpy.flatnonzero(mask)
+	g = group[idx]
+	keep = numpy.concatenate(([True], g[1:] != g[:-1]))
+	first = numpy.full(ngroups, -1)
+	first[g[keep]] = idx[keep]
+
+	return first
+
+
 #--------------------------------------------------
 class ccgFilter():
 	"""
@@ -243,6 +337,14 @@ class ccgFilter():
 	  Get the dates when the smoothed curve crosses the trend curve.
 	  That is, when the detrended smooth seasonal cycle crosses 0.
 
+	update(xp, yp)
+	  Add data points after the last existing point, updating the fit and
+	  filtering only the end of the data.
+
+	getResult(curves=True)
+	  Return a compact ccgFilterResult that can be saved to a file, and
+	  evaluated at any time without the input data.
+
 	"""
 
 	def __init__(self, xp, yp, shortterm=80, longterm=667, sampleinterval=0, numpolyterms=3, numharmonics=4, timezero=-1, gap=0, use_gain_factor=False, debug=False):
@@ -255,13 +357,14 @@ class ccgFilter():
 			a = numpy.array(xp)
 		else:
 			# for some reason, doing an assignment causes problems later in polyval, i.e. a = xp doesn't work.
-			a = numpy.array(xp.tolist())
+			# Copy as float64 directly; going through tolist() is very slow for large or memory mapped arrays.
+			a = numpy.array(xp, dtype=float)
 		c = numpy.argsort(a)
 		self.xp = a[c]
 		if isinstance(yp, list):
 			b = numpy.array(yp)
 		else:
-			b = numpy.array(yp.tolist())
+			b = numpy.array(yp, dtype=float)
 		self.yp = b[c]
 	#	self.xp = numpy.array(xp)
 	#	self.yp = numpy.array(yp)
@@ -270,24 +373,7 @@ class ccgFilter():
 		# Calculate the average time interval between data points.
 		# Set the sampleinterval variable if not set on the command line.
 		if sampleinterval == 0:
-
-			# calculate the average interval between samples that are at least 1 day apart
-			sd = 0
-			sdiff = 0
-			tx = self.xp[0]
-			for i in range(1, self.np):
-				if self.xp[i]-tx > 0.002739:
-					diff = self.xp[i]-tx
-					sdiff += diff
-					sd += 1
-				tx = self.xp[i]
-
-			avginterval = sdiff/sd * 365
-
-			if avginterval > 1:
-				self.sampleinterval = round(avginterval, 0)
-			else:
-				self.sampleinterval = avginterval
+			self.sampleinterval = _average_interval(self.xp)
 			if debug:
 				print("changed sampleinterval to ", self.sampleinterval)
 		else:
@@ -317,7 +403,9 @@ class ccgFilter():
 		else:
 			self.timezero = timezero
 		self.debug = debug
+		self.gap = gap
 		self.numpm = self.numpoly + 2*self.numharm
+		self._qr = None		# triangular factor of the function fit, created by update()
 
 		# apply filter to data
 		self._filter_data(gap)
@@ -337,6 +425,141 @@ class ccgFilter():
 		if self.debug:
 			print("Total time elapsed: ", t1-t0)
 
+	#------------------------------------------------------------
+	def update(self, xp, yp):
+		""" Add new data points that come after the existing data, and update the curves.
+
+		The function coefficients are updated from a QR factorization of the fit that is
+		kept between calls, so the fit is not repeated for the existing data.
+		The residuals are filtered again only for a tail window that starts 3 long term
+		cutoffs before the previous last point. Values of the smooth and trend curves more than
+		2 long term cutoffs before the previous last point are kept (adjusted for the new
+		coefficients), and the two are blended linearly in between.
+
+		The sample interval, number of harmonics and timezero are those of the original fit.
+		Compared with a full refit of all the data with the same settings, the coefficients agree
+		to within the convergence tolerance of the full fit, and for regularly sampled data
+		getSmoothValue() and getTrendValue() agree to within about 0.02 times the standard
+		deviation of the residuals from the function (rsd1). Across long gaps in the earlier
+		data, which are filled by interpolation, the difference can reach about 0.1*rsd1,
+		because the values there are kept from the previous fit.
+		When the amplitude gain factor is used the function is not linear,
+		and a full refit is done instead.
+		"""
+
+		xnew = numpy.array(xp, dtype=float)
+		ynew = numpy.array(yp, dtype=float)
+		c = numpy.argsort(xnew)
+		xnew = xnew[c]
+		ynew = ynew[c]
+		if xnew.size == 0:
+			return
+		if xnew[0] <= self.xp[-1]:
+			raise ValueError("New data must come after the last existing data point %f" % self.xp[-1])
+
+		if self.use_gain_factor:
+			self.__init__(numpy.concatenate((self.xp, xnew)), numpy.concatenate((self.yp, ynew)),
+						self.shortterm, self.longterm, self.sampleinterval, self.numpoly, self.numharm,
+						self.timezero, self.gap, self.use_gain_factor, self.debug)
+			return
+
+		numpm = self.numpm
+		oldfunc = self.getFunctionValue(self.xinterp)
+		oldpoly = self.getPolyValue(self.xinterp)
+
+		# update the triangular factor of [A | y] with the new rows, and solve for the coefficients
+		if self._qr is None:
+			work = self.xp - self.timezero
+			self._qr = numpy.linalg.qr(numpy.column_stack((_design_matrix(work, self.numpoly, self.numharm), self.yp)), mode='r')
+		work = xnew - self.timezero
+		rows = numpy.column_stack((_design_matrix(work, self.numpoly, self.numharm), ynew))
+		self._qr = numpy.linalg.qr(numpy.vstack((self._qr, rows)), mode='r')
+		r = self._qr[:numpm, :numpm]
+		self.params = numpy.linalg.solve(r, self._qr[:numpm, numpm])
+
+		self.xp = numpy.concatenate((self.xp, xnew))
+		self.yp = numpy.concatenate((self.yp, ynew))
+		self.np = self.xp.size
+		work = self.xp - self.timezero
+
+		#  calculate residuals from fit
+		self.resid = self.yp - fitFunc(self.params, work, self.numpoly, self.numharm)
+		self.rsd1 = numpy.std(self.resid, ddof=1)
+		self.chisq = numpy.sum(self.resid*self.resid)/(self.np - numpm)	# reduced chi square
+		try:
+			self.covar = numpy.linalg.inv(numpy.dot(r.T, r)) * self.chisq * self.chisq
+		except numpy.linalg.LinAlgError:
+			self.covar = numpy.zeros((numpm, numpm))
+		self.funcvar = self._varnce()
+		self.polyvar = self._varnce(poly=True)
+
+		# equally spaced times for all of the data, the same as _lin_interp() would produce
+		nold = self.ninterp - 1		# last previous point can be off the regular spacing
+		xinterp = numpy.arange(work[0], work[-1]+self.dinterval/2, self.dinterval)
+		xinterp[-1] = work[-1]
+		xinterp = xinterp + self.timezero
+
+		# keep the smoothed curves for the previous data, adjusted for the new coefficients
+		dfunc = oldfunc[:nold] - self.getFunctionValue(xinterp[:nold])
+		dpoly = oldpoly[:nold] - self.getPolyValue(xinterp[:nold])
+		yinterp = numpy.concatenate((self.yinterp[:nold] + dfunc, numpy.zeros(xinterp.size - nold)))
+		smooth = numpy.concatenate((self.smooth[:nold] + dfunc, numpy.zeros(xinterp.size - nold)))
+		trend = numpy.concatenate((self.trend[:nold] + dpoly, numpy.zeros(xinterp.size - nold)))
+
+		# filter the residuals in the tail window
+		nc = int(round(self.longterm / self.sampleinterval))
+		ws = max(nold - 3*nc, 0)
+		xw = xinterp[ws:] - self.timezero
+		i = numpy.searchsorted(work, work[numpy.searchsorted(work, xw[0], side='right') - 1])
+		ends = self._adjustend(work, self.resid, self.longterm)
+		xw, yw, sw, tw = self._filter_resid(work[i:], self.resid[i:], self.gap, xw, ends, nc if ws > 0 else 0)
+
+		# blend from previous values to the tail window values
+		w = numpy.ones(xw.size)
+		if ws > 0:
+			w[:nc] = 0
+			w[nc:2*nc] = numpy.linspace(0, 1, nc+2)[1:-1]
+		yinterp[ws:] = (1-w)*yinterp[ws:] + w*yw
+		smooth[ws:] = (1-w)*smooth[ws:] + w*sw
+		trend[ws:] = (1-w)*trend[ws:] + w*tw
+
+		self.xinterp = xinterp
+		self.ninterp = xinterp.size
+		self.yinterp = yinterp
+		self.smooth = smooth
+		self.trend = trend
+
+		self._compute_deriv()
+
+		# standard deviation of residuals about smooth curve
+		r = self.yp - self.getSmoothValue(self.xp)
+		self.rsd2 = numpy.std(r, ddof=1)
+		self.rmean = numpy.mean(r)
+
+	#------------------------------------------------------------
+	def refilter(self, shortterm=None, longterm=None):
+		""" Filter the residuals again with different short and/or long term cutoffs.
+		The function fit does not depend on the cutoffs and is kept, so the results are
+		the same as a new ccgFilter with these cutoffs, without repeating the fit.
+		"""
+
+		if shortterm is not None:
+			self.shortterm = shortterm
+		if longterm is not None:
+			self.longterm = longterm
+
+		work = self.xp - self.timezero
+		self.xinterp, self.yinterp, self.smooth, self.trend = self._filter_resid(work, self.resid, self.gap)
+		self.ninterp = len(self.xinterp)
+		self.xinterp = self.xinterp + self.timezero
+
+		self._compute_deriv()
+
+		# standard deviation of residuals about smooth curve
+		r = self.yp - self.getSmoothValue(self.xp)
+		self.rsd2 = numpy.std(r, ddof=1)
+		self.rmean = numpy.mean(r)
+
 	#------------------------------------------------------------
 	def _filter_data(self, gap):
 		""" Perform the curve fitting/filtering """
@@ -390,36 +613,64 @@ class ccgFilter():
 			print("  Function variance is", self.funcvar)
 
 
+		# smooth the residuals at evenly spaced intervals
+		self.xinterp, self.yinterp, self.smooth, self.trend = self._filter_resid(work, self.resid, gap)
+		self.ninterp = len(self.xinterp)
+
+		# add timezero back in to interpolated values
+		self.xinterp = self.xinterp + self.timezero
+
+	#------------------------------------------------------------
+	def _filter_resid(self, work, resid, gap, xi=None, ends=None, taper=0):
+		""" Apply the short and long term filters to the residuals from the function fit.
+		resid can have more than one dimension, with time as the last axis, if ends is given.
+		input:
+			work - time values relative to timezero
+			resid - residuals from the function at work
+			gap - gap value in days, see _lin_interp()
+			xi - equally spaced times to use, see _lin_interp()
+			ends - intercept and slope of line to remove from the residuals, default is from _adjustend()
+			taper - number of equally spaced values at the start to taper linearly to 0 before the fft
+		returns:
+			equally spaced times (relative to timezero), interpolated residuals,
+			short term and long term filtered residuals
+		"""
+
 		# fit linear line to ends of residual data
 		# subtract this from residuals so ends are ~ near 0
-		ca, cb = self._adjustend(work, self.resid, self.longterm)
-		resid = self.resid - (ca + cb*work)
+		if ends is None:
+			ca, cb = self._adjustend(work, resid, self.longterm)
+		else:
+			ca, cb = ends
+		resid = resid - (ca + cb*work)
 		if self.debug:
 			print("  Finished adjustend")
 			print("    ca = %e, cb = %e" % (ca, cb))
-			print("    x[0] = %e, x[%d] = %e" % (work[0], self.np, work[-1]))
-			print("    resid[0] = %e, resid[%d] = %e" % (resid[0], self.np, resid[-1]))
+			print("    x[0] = %e, x[%d] = %e" % (work[0], work.size, work[-1]))
+			print("    resid[0] = %e, resid[%d] = %e" % (resid[..., 0].max(), work.size, resid[..., -1].max()))
 
 
 		# Interpolate data at evenly spaced intervals (self.sampleinterval)
-		self.xinterp, yinterp = self._lin_interp(work, resid, gap)
-		self.ninterp = len(self.xinterp)
+		xinterp, yinterp = self._lin_interp(work, resid, gap, xi)
 
 		if self.debug:
 			print("  Interpolated points.")
-			print("    Number of interpolated points: %d" % (self.ninterp))
-			print("    xinterp[np-1] = %e, x[0] = %e" % (self.xinterp[-1], self.xinterp[0]))
-			print("    yinterp[np-1] = %e, y[0] = %e" % (yinterp[-1], yinterp[0]))
+			print("    Number of interpolated points: %d" % (xinterp.size))
+			print("    xinterp[np-1] = %e, x[0] = %e" % (xinterp[-1], xinterp[0]))
+			print("    yinterp[np-1] = %e, y[0] = %e" % (yinterp[..., -1].max(), yinterp[..., 0].max()))
 
 
+		if taper:
+			yinterp[..., :taper] *= numpy.linspace(0, 1, taper)
+
 		# do fft on interpolated data
 		# we'll zero pad the data to an even power of 2
 		# This makes it the same method used in c version.
-		n2 = int(pow(2, ceil(log(yinterp.size, 2))))
-		zzz = numpy.zeros(n2)
-		nstart = int((n2 - yinterp.size)/2)
-		nend = nstart + yinterp.size
-		zzz[nstart:nend] = yinterp
+		n2 = int(pow(2, ceil(log(xinterp.size, 2))))
+		zzz = numpy.zeros(yinterp.shape[:-1] + (n2,))
+		nstart = int((n2 - xinterp.size)/2)
+		nend = nstart + xinterp.size
+		zzz[..., nstart:nend] = yinterp
 
 		fft = fftpack.rfft(zzz)
 
@@ -428,7 +679,7 @@ class ccgFilter():
 			print("  Do short term filter, cutoff = ", self.shortterm)
 		a = self._freq_filter(fft, self.dinterval, self.shortterm)
 		yfilt = fftpack.irfft(a)
-		self.smooth = yfilt[nstart:nend] + ca + cb*self.xinterp
+		smooth = yfilt[..., nstart:nend] + ca + cb*xinterp
 
 
 		# do long term filter
@@ -436,12 +687,11 @@ class ccgFilter():
 			print("  Do long term filter, cutoff = ", self.longterm)
 		a = self._freq_filter(fft, self.dinterval, self.longterm)
 		yfilt = fftpack.irfft(a)
-		self.trend = yfilt[nstart:nend] + ca + cb*self.xinterp
+		trend = yfilt[..., nstart:nend] + ca + cb*xinterp
 
 
-		# add linear fit and timezero back in to interpolated values
-		self.yinterp = yinterp + ca + cb*self.xinterp
-		self.xinterp = self.xinterp + self.timezero
+		# add linear fit back in to interpolated values
+		return xinterp, yinterp + ca + cb*xinterp, smooth, trend
 
 
 	#------------------------------------------------------------
@@ -461,63 +711,42 @@ class ccgFilter():
 		return intercept, slope
 
 	#------------------------------------------------------------
-	def _lin_interp(self, x, y, gap):
+	def _lin_interp(self, x, y, gap, xi=None):
 		""" Linear interpolate between input data to get equally spaced values
 		at every sample interval.
+		If xi is given, interpolate to those times instead, which must be within x.
+		y can have more than one dimension, with time as the last axis.
 		"""
 
 		# calculate the x values for evenly spaced data at the specified sampling interval
-		xi = numpy.arange(x[0], x[-1]+self.dinterval/2, self.dinterval)
-		xi[-1] = x[-1]		# make sure last point is equal to last data point
+		if xi is None:
+			xi = numpy.arange(x[0], x[-1]+self.dinterval/2, self.dinterval)
+			xi[-1] = x[-1]		# make sure last point is equal to last data point
 
 		# if there are multiple y data points at a single x value, then average them
 		# to get only 1 y data point for each x
-		xx = []
-		yy = []
-		xt = x[0]
-		ys = y[0]
-		ns = 1
-		for xp, yp in zip(x[1:], y[1:]):
-			if xp == xt:
-				ys += yp
-				ns += 1
-			else:
-				ya = ys/ns
-				xx.append(xt)
-				yy.append(ya)
-				ys = yp
-				ns = 1
-			xt = xp
-		ya = ys/ns
-		xx.append(xt)
-		yy.append(ya)
+		# The sums are accumulated in input order, one pass for each position within a group,
+		# so the result is the same as adding the values one at a time.
+		starts = _run_starts(x)
+		ns = numpy.diff(numpy.append(starts, x.size))
+		xx = x[starts]
+		ys = y[..., starts].astype(float)
+		for k in range(1, ns.max()):
+			w = ns > k
+			ys[..., w] += y[..., starts[w] + k]
+		yy = ys / ns
 
 		# calculate interpolation values at each x point
 		f = interpolate.interp1d(xx, yy)
+		yi = f(xi)
 
 		# if a gap setting was not made, use normal linear interpolation
 		# to get equally space points.
 		# Otherwise, fill in gaps using the function value (0) instead.
-		if gap == 0:
-			yi = f(xi)
-
-		else:
-			n = len(xx)
-			ni = len(xi)
-			yi = numpy.zeros((ni))
-			j = 0
-			for i in range(ni):
-				while xi[i] >= xx[j]:
-					j += 1
-					if j >= n-1:
-						break
-
-				j -= 1
-				if (xx[j+1] - xx[j]) > gap/365.0: #  8*self.dinterval:
-					yi[i] = 0
-				else:
-					yi[i] = f(xi[i])
-
+		if gap != 0:
+			# index of the unique x value at or before each xi, limited so that xx[j+1] exists
+			j = numpy.minimum(numpy.searchsorted(xx, xi, side='right'), xx.size-1) - 1
+			yi[..., (xx[j+1] - xx[j]) > gap/365.0] = 0
 
 		return xi, yi
 
@@ -532,7 +761,7 @@ class ccgFilter():
 			cutoff - cutoff value in days
 		"""
 
-		n2 = len(fft)
+		n2 = fft.shape[-1]
 		cf = cutoff/365.0	# convert cutoff to years
 		cutoff2 = 1.0/cf	# change to cycles/year
 
@@ -805,29 +1034,24 @@ class ccgFilter():
 		# added short term smoothed data
 		ycycle = ycycle + self.smooth - self.trend
 
-		# Find max and min values of the seasonal cycle
-		tyear = int(self.xinterp[0])
-		amps = []
-		amax = -9999
-		amin = 9999
-		dmax = -9999
-		dmin = 9999
-		for x, y in zip(self.xinterp, ycycle):
-			year = int(x)
-			if year != tyear:
-				t = (tyear, amax - amin, dmax, amax, dmin, amin)
-				amps.append(t)
-				amax = -9999
-				amin = 9999
-				dmax = 0
-				dmin = 0
-				tyear = year
-			if y > amax:
-				amax = y
-				dmax = x
-			if y < amin:
-				amin = y
-				dmin = x
+		# Find max and min values of the seasonal cycle for each run of points in the same year.
+		# The last year is not included, as it is not closed by a change of year.
+		years = self.xinterp.astype(int)
+		runs = _run_starts(years)
+		if runs.size < 2:
+			return []
+		starts = runs[:-1]
+		group = numpy.repeat(numpy.arange(starts.size), numpy.diff(runs))
+		y = ycycle[:runs[-1]]
+
+		amax = numpy.maximum.reduceat(y, starts)
+		amin = numpy.minimum.reduceat(y, starts)
+
+		# index of the first occurrence of the max and min within each year
+		dmax = self.xinterp[_first_index_in_group(y == amax[group], group, starts.size)]
+		dmin = self.xinterp[_first_index_in_group(y == amin[group], group, starts.size)]
+
+		amps = list(zip(years[starts].tolist(), (amax - amin).tolist(), dmax.tolist(), amax.tolist(), dmin.tolist(), amin.tolist()))
 
 		return amps
 
@@ -960,36 +1184,16 @@ class ccgFilter():
 		if xdata is None:
 			xdata = self.xinterp
 
-		a = []
-		data = []
-		tyear = 0
-		tmonth = 0
-		for x, y in zip(xdata, ysmooth):
-			dt = self.calendarDate(x)
-
-			if dt.year != tyear or dt.month != tmonth:
-				if a:
-					if len(a) > 1:
-						mean = numpy.mean(a)
-						std = numpy.std(a, ddof=1)
-					else:
-						mean = a[0]
-						std = 0.0
-					data.append((tyear, tmonth, mean, std, len(a)))
-					a = []
-
-			a.append(y)
-			tyear = dt.year
-			tmonth = dt.month
-
-		if a:
-			if len(a) > 1:
-				mean = numpy.mean(a)
-				std = numpy.std(a, ddof=1)
-			else:
-				mean = a[0]
-				std = 0.0
-			data.append((dt.year, dt.month, mean, std, len(a)))
+		ysmooth = numpy.asarray(ysmooth, dtype=float)
+		if ysmooth.size == 0:
+			return []
+
+		# integer year*12 + month code for each point, grouped by runs of the same month
+		year, month = _calendar_year_month(numpy.asarray(xdata, dtype=float))
+		starts = _run_starts(year*12 + month)
+		mean, std, n = _grouped_mean_std(ysmooth, starts)
+
+		data = list(zip(year[starts].tolist(), month[starts].tolist(), mean.tolist(), std.tolist(), n.tolist()))
 
 		return data
 
@@ -1011,15 +1215,27 @@ class ccgFilter():
 		if x is None:
 			x = self.xinterp
 
+		x = numpy.asarray(x, dtype=float)
+		ysmooth = numpy.asarray(ysmooth, dtype=float)
+
 		firstyear = int(x[0])
 		lastyear = int(x[-1])
+		nyears = lastyear - firstyear + 1
+
+		# Points are assigned to a year bin, and sums are accumulated for each bin.
+		code = numpy.floor(x).astype(int) - firstyear
+		w = (code >= 0) & (code < nyears)
+		code = code[w]
+		y = ysmooth[w]
 
-		data = []
-		for year in range(firstyear, lastyear+1):
-			w = numpy.where((x >= float(year)) & (x < float(year+1)))
-			mean = numpy.mean(ysmooth[w])
-			std = numpy.std(ysmooth[w], ddof=1)
-			data.append((year, mean, std, len(w[0])))
+		n = numpy.bincount(code, minlength=nyears)
+		with numpy.errstate(invalid='ignore', divide='ignore'):
+			mean = numpy.bincount(code, weights=y, minlength=nyears) / n
+			ss = numpy.bincount(code, weights=(y - mean[code])**2, minlength=nyears)
+			std = numpy.sqrt(ss / (n - 1))
+		std[n < 2] = numpy.nan
+
+		data = list(zip(range(firstyear, lastyear+1), mean.tolist(), std.tolist(), n.tolist()))
 
 		return data
 
@@ -1036,19 +1252,97 @@ class ccgFilter():
 		# added short term smoothed data
 		ycycle = ycycle + self.smooth - self.trend
 
-		tcup = []
-		tcdown = []
-		ty = ycycle[0]
-		for x, y in zip(self.xinterp, ycycle):
+		# Compare each point with the previous one to find where the sign changes
+		prev = ycycle[:-1]
+		curr = ycycle[1:]
+		x = self.xinterp[1:]
+		tcup = x[(prev < 0.0) & (curr >= 0.0)].tolist()
+		tcdown = x[(prev > 0.0) & (curr <= 0.0)].tolist()
 
-			if ty < 0.0 and y >= 0.0:
-				tcup.append(x)
-			if ty > 0.0 and y <= 0.0:
-				tcdown.append(x)
+		return (tcup, tcdown)
 
-			ty = y
+	#------------------------------------------------------------
+	def getBootstrapBands(self, nsamples=200, percentiles=(2.5, 50, 97.5), blocksize=1, seed=0, chunksize=100):
+		""" Estimate the uncertainty of the mean monthly seasonal cycle, the trend and the growth rate
+		by fitting resampled data.
 
-		return (tcup, tcdown)
+		Each sample is the smooth curve at the data times plus residuals about the smooth curve,
+		drawn with replacement in blocks of blocksize consecutive points (blocksize > 1 keeps
+		some of the autocorrelation of the residuals). The samples are fit together, chunksize
+		at a time, with ccgFilterBatch using the same settings as this filter.
+		Results are reproducible for a given seed; use seed=None for a different draw each time.
+		The amplitude gain factor is not used for the samples.
+
+		Returns
+		--------
+		A dict with
+		  'percentiles' - the percentiles
+		  'month' - months 1 to 12
+		  'cycle' - percentiles of the mean detrended seasonal cycle (harmonics + smooth - trend)
+		            for each month, shape (len(percentiles), 12)
+		  'xinterp' - times of the trend and growth rate
+		  'trend', 'growth_rate' - percentiles of the trend and growth rate curves,
+		            shape (len(percentiles), ninterp)
+		"""
+
+		if self.np < 2:
+			raise ValueError("Not enough data points for bootstrap samples.")
+
+		rng = numpy.random.default_rng(seed)
+		ysmooth = self.getSmoothValue(self.xp)
+		resid = self.yp - ysmooth
+
+		# one column for each calendar month, for averaging the seasonal cycle
+		month = _calendar_year_month(self.xinterp)[1]
+		onehot = (month[:, None] == numpy.arange(1, 13)).astype(float)
+		with numpy.errstate(invalid='ignore', divide='ignore'):
+			onehot = onehot / onehot.sum(axis=0)
+
+		blocksize = max(min(int(blocksize), self.np), 1)
+		nblocks = int(ceil(self.np / blocksize))
+		offsets = numpy.arange(blocksize)
+
+		cycle = []
+		trend = []
+		deriv = []
+		for n in range(0, nsamples, chunksize):
+			ns = min(chunksize, nsamples - n)
+			starts = rng.integers(0, self.np - blocksize + 1, size=(ns, nblocks))
+			idx = (starts[..., None] + offsets).reshape(ns, -1)[:, :self.np]
+			batch = ccgFilterBatch(self.xp, ysmooth + resid[idx], self.shortterm, self.longterm, self.sampleinterval,
+								self.numpoly, self.numharm, self.timezero, self.gap)
+			cycle.append(numpy.dot(batch.getSmoothCycle(), onehot))
+			trend.append(batch.getTrendValue(batch.xinterp))
+			deriv.append(batch.deriv)
+
+		pct = numpy.asarray(percentiles, dtype=float)
+		bands = {
+			'percentiles': pct,
+			'month': numpy.arange(1, 13),
+			'cycle': numpy.percentile(numpy.concatenate(cycle), pct, axis=0),
+			'xinterp': batch.xinterp,
+			'trend': numpy.percentile(numpy.concatenate(trend), pct, axis=0),
+			'growth_rate': numpy.percentile(numpy.concatenate(deriv), pct, axis=0),
+		}
+
+		return bands
+
+	#------------------------------------------------------------
+	def getResult(self, curves=True):
+		""" Get a compact ccgFilterResult with the coefficients of the fit,
+		and if curves is True, the smooth and trend curves of the residuals.
+		"""
+
+		if curves:
+			smooth = self.smooth.copy()
+			trend = self.trend.copy()
+		else:
+			smooth = None
+			trend = None
+
+		return ccgFilterResult(self.params.copy(), self.timezero, self.numpoly, self.numharm,
+							self.shortterm, self.longterm, self.sampleinterval, self.xp[0], self.xp[-1],
+							smooth, trend, self.rsd1, self.rsd2)
 
 
 	#------------------------------------------------------------
@@ -1068,3 +1362,569 @@ class ccgFilter():
 		dt = datetime.datetime(dyr, 1, 1) + datetime.timedelta(seconds=nsec)
 
 		return dt
+
+
+#--------------------------------------------------
+class ccgFilterBatch():
+	"""
+	Curve fitting/filtering of many series that share the same times,
+	e.g. model output extracted at several stations, or ensemble members.
+
+	Each series gets the same results as ccgFilter with the same arguments, to within the
+	convergence tolerance of the ccgFilter function fit. The function is fit to all of the
+	series with a single QR factorization of the design matrix, and the residuals of all
+	series are filtered with one 2-D fft. The amplitude gain factor is not available,
+	and yp must not contain NaN values.
+
+	Input Parameters
+	----------
+	xp : list or numpy array
+	    time values shared by all of the series
+	yp : 2d numpy array
+	    dependent values, one row for each series, one column for each value of xp
+	The other parameters are the same as for ccgFilter.
+
+	Attributes
+	----------
+	The same as for ccgFilter, except that the values for each series are
+	stacked in the first dimension:
+	yp, resid : numpy array (nseries, np)
+	params : numpy array (nseries, numpm)
+	covar : numpy array (nseries, numpm, numpm)
+	yinterp, smooth, trend, deriv : numpy array (nseries, ninterp)
+	rsd1, rsd2, chisq, funcvar, polyvar : numpy array (nseries)
+	xp and xinterp are shared by all series.
+
+	Methods
+	-------
+	getFunctionValue(x), getPolyValue(x), getHarmonicValue(x), getSmoothValue(x),
+	getTrendValue(x) and getGrowthRateValue(x) are the same as for ccgFilter,
+	and return an array with one row for each series.
+
+	getSmoothCycle()
+	  Smoothed, detrended seasonal cycle at xinterp, i.e. harmonics + smooth - trend
+
+	getResult(i, curves=True)
+	  ccgFilterResult for series i
+	"""
+
+	# these work with any number of series
+	_lin_interp = ccgFilter._lin_interp
+	_filter_resid = ccgFilter._filter_resid
+	_freq_filter = ccgFilter._freq_filter
+	_vfilt = ccgFilter._vfilt
+
+	def __init__(self, xp, yp, shortterm=80, longterm=667, sampleinterval=0, numpolyterms=3, numharmonics=4, timezero=-1, gap=0):
+
+		a = numpy.array(xp, dtype=float)
+		b = numpy.atleast_2d(numpy.array(yp, dtype=float))
+		if b.ndim != 2 or b.shape[1] != a.size:
+			raise ValueError("yp must have shape (number of series, %d), not %s" % (a.size, b.shape))
+		if not numpy.all(numpy.isfinite(b)):
+			raise ValueError("yp must not contain NaN or infinite values")
+
+		# make sure data is sorted by x values
+		c = numpy.argsort(a)
+		self.xp = a[c]
+		self.yp = b[:, c]
+		self.np = a.size
+		self.nseries = b.shape[0]
+
+		if sampleinterval == 0:
+			self.sampleinterval = _average_interval(self.xp)
+		else:
+			self.sampleinterval = sampleinterval
+		self.dinterval = self.sampleinterval/365.0
+
+		nh = int(365.0/(self.sampleinterval*2))
+		self.numharm = min(nh, numharmonics)
+
+		self.shortterm = shortterm
+		self.longterm = longterm
+		self.numpoly = numpolyterms
+		self.timezero = int(a[0]) if timezero < 0 else timezero
+		self.gap = gap
+		self.debug = False
+		self.numpm = self.numpoly + 2*self.numharm
+
+		work = self.xp - self.timezero
+
+		# Fit the function to all of the data with the same factorization
+		dm = _design_matrix(work, self.numpoly, self.numharm)
+		q, r = numpy.linalg.qr(dm)
+		self.params = numpy.linalg.solve(r, numpy.dot(q.T, self.yp.T)).T
+
+		#  calculate residuals from fit
+		self.resid = self.yp - numpy.dot(self.params, dm.T)
+		self.rsd1 = numpy.std(self.resid, axis=1, ddof=1)
+		self.chisq = numpy.sum(self.resid*self.resid, axis=1)/(self.np - self.numpm)	# reduced chi square
+
+		# covariance scaled the same way as in ccgFilter
+		rinv = numpy.linalg.inv(r)
+		self.covar = numpy.dot(rinv, rinv.T) * (self.chisq * self.chisq)[:, None, None]
+
+		# variance of function fit at mean time
+		dfdp = _design_matrix(numpy.array([numpy.mean(work)]), self.numpoly, self.numharm)[0]
+		self.funcvar = numpy.einsum('j,ijk,k->i', dfdp, self.covar, dfdp)
+		n = self.numpoly
+		self.polyvar = numpy.einsum('j,ijk,k->i', dfdp[:n], self.covar[:, :n, :n], dfdp[:n])
+
+		# filter the residuals of all series together
+		ca, cb = self._adjustend(work, self.resid, self.longterm)
+		self.xinterp, self.yinterp, self.smooth, self.trend = self._filter_resid(work, self.resid, gap, ends=(ca, cb))
+		self.ninterp = self.xinterp.size
+		self.xinterp = self.xinterp + self.timezero
+
+		# derivative of trend, plus derivative of polynomial part of the function
+		spline = interpolate.make_interp_spline(self.xinterp, self.trend, k=3, axis=1)
+		self.deriv = spline.derivative()(self.xinterp)
+		xi = self.xinterp - self.timezero
+		for k in range(1, self.numpoly):
+			self.deriv += k * self.params[:, k:k+1] * numpy.power(xi, k-1)
+
+		# standard deviation of residuals about smooth curve
+		r = self.yp - self.getSmoothValue(self.xp)
+		self.rsd2 = numpy.std(r, axis=1, ddof=1)
+		self.rmean = numpy.mean(r, axis=1)
+
+	#------------------------------------------------------------
+	def _adjustend(self, x, y, cutoff):
+		""" Same as ccgFilter._adjustend() for each row of y, with time as the last axis of y.
+		Returns intercepts and slopes with a last axis of length 1.
+		"""
+
+		zero = numpy.zeros(y.shape[:-1] + (1,))
+		if x[-1] - x[0] < cutoff/365.0:
+			return zero, zero
+
+		c = cutoff/365.0/4.0
+		z = (x <= x[0]+c) | (x >= x[-1]-c)
+
+		xz = x[z] - numpy.mean(x[z])
+		yz = y[..., z]
+		slope = numpy.dot(yz, xz) / numpy.dot(xz, xz)
+		intercept = numpy.mean(yz, axis=-1) - slope*numpy.mean(x[z])
+		return intercept[..., None], slope[..., None]
+
+	#------------------------------------------------------------
+	def getFunctionValue(self, x):
+		""" Value of the function at times x, one row for each series """
+
+		xa = numpy.atleast_1d(numpy.asarray(x, dtype=float)) - self.timezero
+		return numpy.dot(self.params, _design_matrix(xa, self.numpoly, self.numharm).T)
+
+	#------------------------------------------------------------
+	def getPolyValue(self, x):
+		""" Value of the polynomial part of the function at times x, one row for each series """
+
+		xa = numpy.atleast_1d(numpy.asarray(x, dtype=float)) - self.timezero
+		n = self.numpoly
+		return numpy.dot(self.params[:, :n], _design_matrix(xa, n, 0).T)
+
+	#------------------------------------------------------------
+	def getHarmonicValue(self, x):
+		""" Value of the harmonic part of the function at times x, one row for each series """
+
+		xa = numpy.atleast_1d(numpy.asarray(x, dtype=float)) - self.timezero
+		n = self.numpoly
+		return numpy.dot(self.params[:, n:], _design_matrix(xa, 0, self.numharm).T)
+
+	#------------------------------------------------------------
+	def getSmoothValue(self, x):
+		""" Function plus the smoothed residuals at times x, one row for each series """
+
+		ysmooth = self.getFunctionValue(self.xinterp) + self.smooth
+		f = interpolate.interp1d(self.xinterp, ysmooth, bounds_error=False)
+		return f(x)
+
+	#------------------------------------------------------------
+	def getTrendValue(self, x):
+		""" Polynomial plus the long term filtered residuals at times x, one row for each series """
+
+		ytrend = self.getPolyValue(self.xinterp) + self.trend
+		f = interpolate.interp1d(self.xinterp, ytrend, bounds_error=False)
+		return f(x)
+
+	#------------------------------------------------------------
+	def getGrowthRateValue(self, x):
+		""" Derivative of the trend at times x, one row for each series """
+
+		f = interpolate.interp1d(self.xinterp, self.deriv)
+		return f(x)
+
+	#------------------------------------------------------------
+	def getSmoothCycle(self):
+		""" Smoothed, detrended seasonal cycle at xinterp, one row for each series """
+
+		return self.getHarmonicValue(self.xinterp) + self.smooth - self.trend
+
+	#------------------------------------------------------------
+	def getResult(self, i, curves=True):
+		""" Get a ccgFilterResult for series i """
+
+		if curves:
+			smooth = self.smooth[i].copy()
+			trend = self.trend[i].copy()
+		else:
+			smooth = None
+			trend = None
+
+		return ccgFilterResult(self.params[i].copy(), self.timezero, self.numpoly, self.numharm,
+							self.shortterm, self.longterm, self.sampleinterval, self.xp[0], self.xp[-1],
+							smooth, trend, self.rsd1[i], self.rsd2[i])
+
+
+#--------------------------------------------------
+class ccgFilterWindows():
+	"""
+	Curve fitting/filtering in sliding time windows, for following how the
+	seasonal cycle changes over time, e.g. the amplitude at a station decade by decade.
+
+	The data are sorted and interpolated to equally spaced times once, and each window
+	is a run of those equally spaced values. The function is fit to all of the windows
+	(and all of the series) with one batch of QR factorizations, and the residuals are filtered
+	with one fft, in the same way as ccgFilter. Because the fit is made to the equally spaced
+	values, the results for a window are the same as ccgFilter of that window only when the
+	data are equally spaced at the sample interval. The amplitude gain factor is not available,
+	and yp must not contain NaN values.
+
+	Input Parameters
+	----------
+	xp : list or numpy array
+	    time values shared by all of the series
+	yp : list or numpy array
+	    dependent values, either one series, or a 2d array with one row for each series
+	window : float
+	    length of each window in years. Default is 10.
+	stride : float
+	    time in years between the start of consecutive windows. Default is 1.
+	The other parameters are the same as for ccgFilter. The timezero of each window is
+	the integer year of its first value, so the harmonic coefficients of all windows have the same phase.
+	If gap is given, equally spaced values in gaps are left out of the function fit,
+	and their residuals are set to 0, as in ccgFilter.
+
+	Attributes
+	----------
+	xinterp : numpy array
+	    equally spaced times of all of the data
+	start, end : numpy array (nwindows)
+	    index into xinterp of the first and last+1 value of each window
+	xstart, xend, xcenter : numpy array (nwindows)
+	    first, last and middle time of each window
+	timezero : numpy array (nwindows)
+	    timezero of the function fit for each window
+	params : numpy array (nseries, nwindows, numpm)
+	rsd1, rsd2 : numpy array (nseries, nwindows)
+	    standard deviation of the equally spaced values about the function and about the smooth curve
+	smooth, trend : numpy array (nseries, nwindows, window length)
+	    short term and long term filtered residuals of each window
+	cyclex : numpy array (ncycle)
+	    fraction of the year at the middle of each bin of the mean cycle
+	cycle : numpy array (nseries, nwindows, ncycle)
+	    mean seasonal cycle of each window, the average of the smoothed, detrended
+	    seasonal cycle (harmonics + smooth - trend) in bins of the fraction of the year,
+	    one bin for each sample interval. Empty bins are NaN.
+	amplitude : numpy array (nseries, nwindows)
+	    peak to peak amplitude of the mean cycle
+	maxphase, minphase : numpy array (nseries, nwindows)
+	    fraction of the year of the maximum and minimum of the mean cycle
+
+	Methods
+	-------
+	getResult(i, k, curves=True)
+	  ccgFilterResult for series i in window k
+	"""
+
+	_lin_interp = ccgFilter._lin_interp
+	_filter_resid = ccgFilter._filter_resid
+	_freq_filter = ccgFilter._freq_filter
+	_vfilt = ccgFilter._vfilt
+	_adjustend = ccgFilterBatch._adjustend
+
+	def __init__(self, xp, yp, window=10, stride=1, shortterm=80, longterm=667, sampleinterval=0, numpolyterms=3, numharmonics=4, gap=0):
+
+		a = numpy.array(xp, dtype=float)
+		b = numpy.atleast_2d(numpy.array(yp, dtype=float))
+		if b.ndim != 2 or b.shape[1] != a.size:
+			raise ValueError("yp must have shape (number of series, %d), not %s" % (a.size, b.shape))
+		if not numpy.all(numpy.isfinite(b)):
+			raise ValueError("yp must not contain NaN or infinite values")
+		if stride <= 0:
+			raise ValueError("stride must be greater than 0")
+
+		# make sure data is sorted by x values
+		c = numpy.argsort(a)
+		x = a[c]
+		y = b[:, c]
+		self.nseries = b.shape[0]
+
+		if sampleinterval == 0:
+			self.sampleinterval = _average_interval(x)
+		else:
+			self.sampleinterval = sampleinterval
+		self.dinterval = self.sampleinterval/365.0
+
+		nh = int(365.0/(self.sampleinterval*2))
+		self.numharm = min(nh, numharmonics)
+
+		self.shortterm = shortterm
+		self.longterm = longterm
+		self.numpoly = numpolyterms
+		self.gap = gap
+		self.debug = False
+		self.numpm = self.numpoly + 2*self.numharm
+		self.window = window
+		self.stride = stride
+
+		# Interpolate all of the data to equally spaced times, once for all windows
+		self.xinterp, yinterp = self._lin_interp(x, y, 0)
+		if gap != 0:
+			valid = self._lin_interp(x, numpy.ones(x.size), gap)[1] != 0
+		else:
+			valid = numpy.ones(self.xinterp.size, dtype=bool)
+
+		m = int(round(window/self.dinterval))
+		if m <= self.numpm or m > self.xinterp.size:
+			raise ValueError("window of %g years does not fit the %g years of data" % (window, x[-1]-x[0]))
+		nwin = int((self.xinterp.size - m) * self.dinterval / stride) + 2
+		self.start = numpy.round(numpy.arange(nwin) * stride / self.dinterval).astype(int)
+		self.start = self.start[self.start + m <= self.xinterp.size]
+		self.end = self.start + m
+		self.nwindows = self.start.size
+
+		idx = self.start[:, None] + numpy.arange(m)
+		xw = self.xinterp[idx]
+		self.xstart = xw[:, 0]
+		self.xend = xw[:, -1]
+		self.xcenter = (self.xstart + self.xend) / 2
+		self.timezero = self.xstart.astype(int)
+		work = xw - self.timezero[:, None]
+
+		# Design matrices of all windows. With an integer timezero, the harmonic columns
+		# are the same for every window, so they are computed once for all of the data.
+		harm = _design_matrix(self.xinterp, 0, self.numharm)
+		dm = numpy.concatenate((numpy.power(work[..., None], numpy.arange(self.numpoly)), harm[idx]), axis=-1)
+		w = valid[idx]
+		dm = dm * w[..., None]
+		yw = yinterp[:, idx] * w
+
+		q, r = numpy.linalg.qr(dm)
+		qty = numpy.einsum('wmp,swm->swp', q, yw)
+		self.params = numpy.linalg.solve(r, qty.transpose(1, 2, 0)).transpose(2, 0, 1)
+
+		# residuals from fit, 0 in gaps
+		fit = numpy.einsum('wmp,swp->swm', dm, self.params)
+		resid = yw - fit
+		nvalid = numpy.sum(w, axis=1)
+		mean = numpy.sum(resid, axis=-1) / nvalid
+		self.rsd1 = numpy.sqrt(numpy.sum(((resid - mean[..., None]) * w)**2, axis=-1) / (nvalid - 1))
+
+		# filter the residuals of all windows together
+		u = work[0] - work[0, 0]
+		ends = self._adjustend(u, resid, self.longterm)
+		xi, yi, self.smooth, self.trend = self._filter_resid(u, resid, 0, u, ends)
+
+		r = resid - self.smooth
+		mean = numpy.sum(r * w, axis=-1) / nvalid
+		self.rsd2 = numpy.sqrt(numpy.sum(((r - mean[..., None]) * w)**2, axis=-1) / (nvalid - 1))
+
+		# mean seasonal cycle in bins of the fraction of the year
+		ncycle = max(int(1/self.dinterval), 1)
+		self.cyclex = (numpy.arange(ncycle) + 0.5) / ncycle
+		bins = numpy.minimum(((self.xinterp - numpy.floor(self.xinterp)) * ncycle).astype(int), ncycle-1)
+		ycycle = numpy.einsum('wmp,swp->swm', dm[..., self.numpoly:], self.params[..., self.numpoly:]) + self.smooth - self.trend
+		group = (numpy.arange(self.nwindows)[:, None] * ncycle + bins[idx]).ravel()
+		ngroups = self.nwindows * ncycle
+		counts = numpy.bincount(group, minlength=ngroups).reshape(self.nwindows, ncycle)
+		sums = numpy.stack([numpy.bincount(group, weights=ys.ravel(), minlength=ngroups) for ys in ycycle])
+		with numpy.errstate(invalid='ignore', divide='ignore'):
+			self.cycle = sums.reshape(self.nseries, self.nwindows, ncycle) / counts
+
+		filled = numpy.where(numpy.isnan(self.cycle), numpy.nanmean(self.cycle, axis=-1, keepdims=True), self.cycle)
+		self.amplitude = numpy.nanmax(self.cycle, axis=-1) - numpy.nanmin(self.cycle, axis=-1)
+		self.maxphase = self.cyclex[numpy.argmax(filled, axis=-1)]
+		self.minphase = self.cyclex[numpy.argmin(filled, axis=-1)]
+
+	#------------------------------------------------------------
+	def getResult(self, i, k, curves=True):
+		""" Get a ccgFilterResult for series i in window k """
+
+		if curves:
+			smooth = self.smooth[i, k].copy()
+			trend = self.trend[i, k].copy()
+		else:
+			smooth = None
+			trend = None
+
+		return ccgFilterResult(self.params[i, k].copy(), int(self.timezero[k]), self.numpoly, self.numharm,
+							self.shortterm, self.longterm, self.sampleinterval, self.xstart[k], self.xend[k],
+							smooth, trend, self.rsd1[i, k], self.rsd2[i, k])
+
+
+#--------------------------------------------------
+class ccgFilterResult():
+	"""
+	Compact results of a ccgFilter fit, usually created with ccgFilter.getResult().
+
+	Only the function coefficients and, optionally, the smooth and trend curves of the
+	residuals are kept. The equally spaced times of the curves are computed again from
+	the first and last data dates and the sample interval, the same way ccgFilter does.
+
+	Attributes
+	----------
+	params : numpy array
+	    Parameters (coefficients) for the function fit
+	timezero, numpoly, numharm, shortterm, longterm, sampleinterval :
+	    Same as for ccgFilter
+	xfirst, xlast : float
+	    Dates of the first and last data points
+	smooth, trend : numpy array or None
+	    Short and long term filtered residuals, equally spaced at xinterp
+	rsd1, rsd2 : float
+	    Standard deviation of residuals about function and smooth curve
+
+	Methods
+	-------
+	getFunctionValue(x), getPolyValue(x), getHarmonicValue(x) are available from the
+	coefficients alone. getSmoothValue(x), getTrendValue(x) and getGrowthRateValue(x)
+	also need the smooth and trend curves.
+
+	save(filename)
+	  Save to a numpy .npz file, or a NetCDF file if filename ends with '.nc'.
+
+	ccgFilterResult.load(filename)
+	  Create a ccgFilterResult from a file written by save().
+	"""
+
+	__slots__ = ('params', 'timezero', 'numpoly', 'numharm', 'shortterm', 'longterm', 'sampleinterval',
+				'xfirst', 'xlast', 'smooth', 'trend', 'rsd1', 'rsd2', '_deriv')
+
+	# attributes saved to file as single values
+	_scalars = ('timezero', 'numpoly', 'numharm', 'shortterm', 'longterm', 'sampleinterval',
+				'xfirst', 'xlast', 'rsd1', 'rsd2')
+
+	def __init__(self, params, timezero, numpoly, numharm, shortterm, longterm, sampleinterval,
+				xfirst, xlast, smooth=None, trend=None, rsd1=numpy.nan, rsd2=numpy.nan):
+
+		self.params = numpy.asarray(params, dtype=float)
+		self.timezero = timezero
+		self.numpoly = int(numpoly)
+		self.numharm = int(numharm)
+		self.shortterm = shortterm
+		self.longterm = longterm
+		self.sampleinterval = sampleinterval
+		self.xfirst = float(xfirst)
+		self.xlast = float(xlast)
+		self.smooth = None if smooth is None else numpy.asarray(smooth, dtype=float)
+		self.trend = None if trend is None else numpy.asarray(trend, dtype=float)
+		self.rsd1 = float(rsd1)
+		self.rsd2 = float(rsd2)
+		self._deriv = None
+
+	#------------------------------------------------------------
+	@property
+	def xinterp(self):
+		""" Equally spaced times of the smooth and trend curves """
+
+		x0 = self.xfirst - self.timezero
+		x1 = self.xlast - self.timezero
+		dinterval = self.sampleinterval/365.0
+		xi = numpy.arange(x0, x1+dinterval/2, dinterval)
+		xi[-1] = x1
+		return xi + self.timezero
+
+	#------------------------------------------------------------
+	def _check_curves(self):
+		if self.smooth is None or self.trend is None:
+			raise ValueError("Smooth and trend curves are not included in this result.")
+
+	#------------------------------------------------------------
+	def getFunctionValue(self, x):
+		""" Determine the value of the function at time x """
+
+		return fitFunc(self.params, numpy.asarray(x)-self.timezero, self.numpoly, self.numharm)
+
+	#------------------------------------------------------------
+	def getPolyValue(self, x):
+		""" Get the values of the polynomial part of the function time x """
+
+		return numpy.polyval(self.params[self.numpoly-1::-1], numpy.asarray(x)-self.timezero)
+
+	#------------------------------------------------------------
+	def getHarmonicValue(self, x):
+		""" Get the values of the harmonic part of the function time x """
+
+		return harmonics(self.params, numpy.asarray(x)-self.timezero, self.numpoly, self.numharm)
+
+	#------------------------------------------------------------
+	def getSmoothValue(self, x):
+		""" Return the function plus the smoothed residuals at time x """
+
+		self._check_curves()
+		xinterp = self.xinterp
+		f = interpolate.interp1d(xinterp, self.getFunctionValue(xinterp) + self.smooth, bounds_error=False)
+		return f(x)
+
+	#------------------------------------------------------------
+	def getTrendValue(self, x):
+		""" Return the polynomial plus the long term filtered residuals at time x """
+
+		self._check_curves()
+		xinterp = self.xinterp
+		f = interpolate.interp1d(xinterp, self.getPolyValue(xinterp) + self.trend, bounds_error=False)
+		return f(x)
+
+	#------------------------------------------------------------
+	def getGrowthRateValue(self, x):
+		""" Get the values of the derivative of the trend at time x """
+
+		self._check_curves()
+		xinterp = self.xinterp
+		if self._deriv is None:
+			# same as ccgFilter._compute_deriv()
+			tck = interpolate.splrep(xinterp, self.trend, s=0.0)
+			poly = numpy.poly1d(self.params[self.numpoly-1::-1])
+			self._deriv = interpolate.splev(xinterp, tck, der=1) + numpy.polyder(poly)(xinterp - self.timezero)
+
+		f = interpolate.interp1d(xinterp, self._deriv)
+		return f(x)
+
+	#------------------------------------------------------------
+	def save(self, filename):
+		""" Save to a numpy .npz file, or a NetCDF file if filename ends with '.nc'.
+		The file is written under the given name, even without a '.npz' extension.
+		"""
+
+		scalars = {name: getattr(self, name) for name in self._scalars}
+		curves = {}
+		if self.smooth is not None and self.trend is not None:
+			curves = {'smooth': self.smooth, 'trend': self.trend}
+
+		if filename.endswith('.nc'):
+			import xarray
+
+			data_vars = {'params': ('param', self.params)}
+			data_vars.update({k: ('interp', v) for k, v in curves.items()})
+			xarray.Dataset(data_vars, attrs=scalars).to_netcdf(filename)
+		else:
+			# Writing through a file object keeps numpy from appending '.npz' to the name.
+			with open(filename, 'wb') as f:
+				numpy.savez(f, params=self.params, **curves, **scalars)
+
+	#------------------------------------------------------------
+	@classmethod
+	def load(cls, filename):
+		""" Create a ccgFilterResult from a file written by save() """
+
+		if filename.endswith('.nc'):
+			import xarray
+
+			with xarray.open_dataset(filename) as ds:
+				values = {k: ds[k].values for k in ds.data_vars}
+				values.update({k: ds.attrs[k] for k in cls._scalars})
+		else:
+			with numpy.load(filename) as npz:
+				values = {k: npz[k] for k in npz.files}
+		values.update({k: numpy.asarray(values[k]).item() for k in cls._scalars})
+
+		return cls(**values)
@@ -3,7 +3,12 @@
 Program for applying curve fitting/filtering of time series data and
 printing results.
 
+Many input files can be fitted in one invocation with the batch subcommand,
+e.g. ccgcrv.py batch --outdir out/ --workers 8 --trend --smooth data/*.txt
+
 Takes an input file containing two columns of data, a decimal date and value.
+The input can also be a numpy .npy file of shape (n, 2), or with --binary a
+raw file of float64 (date, value) pairs; both are memory mapped.
 Applies curve fitting algorithm to the data, and depending on options,
 prints results to stdout (default) or to files if specified.
 
@@ -16,14 +21,23 @@ ccgg python requirements:
 """
 from __future__ import print_function
 
+import os
+import io
 import sys
+import copy
+import glob
 import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy
 
 from dateutil.parser import parse
 from dateutil.rrule import rrule, DAILY
 
 from ccgcrv.ccg_filter import ccgFilter
-from ccgcrv.ccg_dates import calendarDate, decimalDateFromDatetime, datetimeFromDecimalDate
+from ccgcrv.ccg_dates import calendarDate, calendarDateArray, decimalDateFromDatetime64, datetimeFromDecimalDate
 
 from co2_diag.formatters.args import options_to_args
 
@@ -79,16 +93,17 @@ def export_data(options, filt):
 			# Create a new list of dates at sample interval to give to export_dates().
 			# Not quite the same as filt.xinterp because it takes into account leap years
 			dates = rrule(DAILY, interval=int(filt.sampleinterval), dtstart=options.startdate, until=options.lastdate)
-			xdates = [decimalDateFromDatetime(dt) for dt in dates]
+			xdates = decimalDateFromDatetime64(numpy.array(list(dates), dtype='datetime64[s]'))
 			if xdates[-1] > filt.xp[-1]:
 				xdates[-1] = filt.xp[-1]  # avoid problems with rounding and interpolation in ccgfilt
 			if xdates[0] < filt.xp[0]:
 				xdates[0] = filt.xp[0]  # avoid problems with rounding and interpolation in ccgfilt
 
 		else:
-			f = open(options.user)
-			xdates = [float(line.split()[0]) for line in f]
-			f.close()
+			try:
+				xdates = numpy.loadtxt(options.user, usecols=0, ndmin=1)
+			except (IOError, ValueError) as e:
+				sys.exit("Cannot read user dates file. %s" % e)
 
 
 		export_dates(options, fp, filt, xdates)
@@ -106,38 +121,67 @@ def export_dates(options, fp, filt, x):
 
 	frmt = "%13.6e"
 
+	x = numpy.asarray(x, dtype=float)
+	n = x.size
+
 	h = filt.getHarmonicValue(x)	# harmonics
 	p = filt.getPolyValue(x)	# poly
 	s = filt.getSmoothValue(x)	# function + short term smoothing
 	t = filt.getTrendValue(x)	# poly + long term smoothing
 	g = filt.getGrowthRateValue(x)	# growth rate, derivative of trend
 	f = filt.getFunctionValue(x)    # function, poly + harmonics
-
-	for i, xp in enumerate(x):
-		if options.cal:
-			(yr, mon, dy, hr, mn, sec) = calendarDate(xp)
-			if options.hour:
-				print("%4d %02d %02d %2d" % (yr, mon, dy, hr), end='', file=fp)
-			else:
-				print("%4d %02d %02d" % (yr, mon, dy), end='', file=fp)
+	# original data, only meaningful at sample dates. Other dates can outnumber the data.
+	y = numpy.full(n, numpy.nan)
+	y[:filt.np] = filt.yp[:n]
+
+	if options.cal:
+		(yr, mon, dy, hr, mn, sec) = calendarDateArray(x)
+		if options.hour:
+			rowfmt = "%4d %02d %02d %2d"
+			columns = [yr, mon, dy, hr]
 		else:
-			print("%13.8f" % xp, end='', file=fp)
+			rowfmt = "%4d %02d %02d"
+			columns = [yr, mon, dy]
+	else:
+		rowfmt = "%13.8f"
+		columns = [x]
+
+	# make sure these are in same order as in export_header()
+	# Each column is only computed if it is selected.
+	for flag, values in (
+		(options.sample and options.orig,    lambda: y),
+		(options.func,                       lambda: f),
+		(options.poly,                       lambda: p),
+		(options.smooth,                     lambda: s),
+		(options.trend,                      lambda: t),
+		(options.sample and options.detrend, lambda: y - t),
+		(options.smcycle,                    lambda: s - t),
+		(options.harm,                       lambda: h),
+		(options.sample and options.res,     lambda: y - f),
+		(options.smres,                      lambda: s - f),
+		(options.trres,                      lambda: t - p),
+		(options.sample and options.ressm,   lambda: y - s),
+		(options.gr,                         lambda: g),
+	):
+		if flag:
+			rowfmt += frmt
+			columns.append(values())
+
+	write_columns(fp, rowfmt, columns)
 
-		if options.sample and options.orig:    print(frmt % filt.yp[i], end='', file=fp)
-		if options.func:                       print(frmt % f[i], end='', file=fp)
-		if options.poly:                       print(frmt % p[i], end='', file=fp)
-		if options.smooth:                     print(frmt % s[i], end='', file=fp)
-		if options.trend:                      print(frmt % (t[i]), end='', file=fp)
-		if options.sample and options.detrend: print(frmt % (filt.yp[i] - t[i]), end='', file=fp)
-		if options.smcycle:                    print(frmt % (s[i] - t[i]), end='', file=fp)
-		if options.harm:                       print(frmt % (h[i]), end='', file=fp)
-		if options.sample and options.res:     print(frmt % (filt.yp[i] - f[i]), end='', file=fp)
-		if options.smres:                      print(frmt % (s[i] - f[i]), end='', file=fp)
-		if options.trres:                      print(frmt % (t[i] - p[i]), end='', file=fp)
-		if options.sample and options.ressm:   print(frmt % (filt.yp[i] - s[i]), end='', file=fp)
-		if options.gr:                         print(frmt % (g[i]), end='', file=fp)
 
-		print(file=fp)
+##########################################################################
+def write_columns(fp, rowfmt, columns, blocksize=100000):
+	""" Write columns of equal length to file pointer fp, one row per line.
+	Rows are formatted with the printf style rowfmt a block at a time,
+	which is much faster than formatting each value separately.
+	"""
+
+	data = numpy.column_stack(columns)
+	rowfmt += "\n"
+	for i in range(0, data.shape[0], blocksize):
+		block = data[i:i+blocksize]
+		fp.write((rowfmt * block.shape[0]) % tuple(block.ravel().tolist()))
 
 
 ##########################################################################
@@ -167,34 +211,38 @@ def export_header(options, fp):
 	print(file=fp)
 
 #########################################################################
-def read_data(filename=None):
+def read_data(filename=None, binary=False):
 	"""
 	# Read in the input data file.
 	# Format is always two columns,
 	# the first column a decimal date value, (e.g. 2010.5 is halfway through 2010)
 	# the second column is the corrsponding measurement value.
+	#
+	# Text files are read in one pass with numpy.loadtxt.
+	# Files ending in '.npy' must hold an (n, 2) array, and with binary=True the
+	# file is raw float64 (date, value) pairs. Both of these are memory mapped.
 	"""
 
-	if filename is None:
-		fp = sys.stdin
-	else:
-		try:
-			fp = open(filename)
-		except IOError as e:
-			sys.exit("Cannot open input file. %s" % e)
-
-
-	x = []
-	y = []
-	for line in fp:
-		(xv, yv) = line.split()
-		x.append(float(xv))
-		y.append(float(yv))
-
-	fp.close()
+	try:
+		if binary:
+			if filename is None:
+				data = numpy.frombuffer(sys.stdin.buffer.read(), dtype=numpy.float64)
+			else:
+				data = numpy.memmap(filename, dtype=numpy.float64, mode='r')
+			data = data.reshape(-1, 2)
+		elif filename is not None and filename.endswith('.npy'):
+			data = numpy.load(filename, mmap_mode='r')
+		else:
+			data = numpy.loadtxt(sys.stdin if filename is None else filename, dtype=numpy.float64, ndmin=2)
+	except IOError as e:
+		sys.exit("Cannot open input file. %s" % e)
+	except ValueError as e:
+		sys.exit("Cannot read input file. %s" % e)
 
+	if data.ndim != 2 or data.shape[1] != 2:
+		sys.exit("Input data must have two columns, found shape %s" % (data.shape,))
 
-	return x, y
+	return data[:, 0], data[:, 1]
 
 
 #########################################################################
@@ -213,10 +261,10 @@ def _main(options):
 
 	args = options.args
 	if not len(args):
-		xp, yp = read_data()
+		xp, yp = read_data(binary=options.binary)
 	else:
 		inputfile = args[0]
-		xp, yp = read_data(inputfile)
+		xp, yp = read_data(inputfile, options.binary)
 	# if user dates or equal spaced dates aren't specified, use sample dates as default
 	if not options.user and not options.equal:
 		options.sample = True
@@ -282,6 +330,10 @@ def _ccgcrv_parser():
 	group.add_argument('--timez', type=float,
 					   help="Specify time zero for coefficients of function. Default is year of first data point.")
 
+	group = parser.add_argument_group("Input Options")
+	group.add_argument('--binary', action="store_true", default=False,
+					   help="Input file is raw float64 (date, value) pairs instead of text.")
+
 	group = parser.add_argument_group("Output Options")
 	group.add_argument('-f', '--file',
 					   help="Write equally spaced or user spaced output data to file instead of stdout.")
@@ -325,9 +377,126 @@ def _ccgcrv_parser():
 	return parser
 
 
-if __name__ == "__main__":
-	options = _ccgcrv_parser().add_argument('args', nargs=1).parse_args()
-	_main(options)
+def _ccgcrv_batch_parser():
+	parser = _ccgcrv_parser()
+	parser.description = "Apply curve fitting/filtering to many input files and write results for each."
+
+	group = parser.add_argument_group("Batch Options")
+	group.add_argument('inputs', nargs='+', help="Input files, directories or glob patterns.")
+	group.add_argument('--workers', type=int,
+					   help="Number of worker processes. Default is the number of cpus.")
+	group.add_argument('--outdir', help="Write output for each input file to a file of the same name in this directory.")
+	group.add_argument('--suffix', default=".txt", help="File name extension for files written to --outdir.")
+	group.add_argument('--combined', help="Write output for all input files to one table, with the file name as first column.")
+
+	return parser
+
+
+#########################################################################
+def batch_files(inputs):
+	""" Expand a list of files, directories and glob patterns into a sorted list of files. """
+
+	files = []
+	for name in inputs:
+		if os.path.isdir(name):
+			names = [os.path.join(name, f) for f in os.listdir(name)]
+		else:
+			names = glob.glob(name)
+		files.extend(sorted(f for f in names if os.path.isfile(f)))
+
+	return files
+
+
+#########################################################################
+def _fit_file(options, inputfile):
+	""" Run the curve fit for one input file of a batch.
+	Returns the file name, the text that would have been printed to stdout,
+	and an error message, or None if the fit succeeded.
+	"""
+
+	options = copy.copy(options)
+	options.args = [inputfile]
+
+	buf = io.StringIO()
+	try:
+		with contextlib.redirect_stdout(buf):
+			_main(options)
+	except SystemExit as e:
+		return inputfile, buf.getvalue(), str(e)
+	except Exception as e:
+		return inputfile, buf.getvalue(), "%s: %s" % (type(e).__name__, e)
+
+	return inputfile, buf.getvalue(), None
+
+
+#########################################################################
+def _batch_main(options):
+	""" Fit every input file, using a pool of worker processes.
+	Returns the number of files that failed.
+	"""
+
+	if options.file or options.samplefile:
+		sys.exit("Use --outdir or --combined instead of --file or --samplefile in batch mode.")
+	if options.outdir is None and options.combined is None:
+		sys.exit("One of --outdir or --combined is required in batch mode.")
+
+	files = batch_files(options.inputs)
+	if not files:
+		sys.exit("No input files found.")
+
+	labels = [os.path.splitext(os.path.basename(f))[0] for f in files]
+	if options.outdir is not None:
+		if len(set(labels)) != len(labels):
+			sys.exit("Input file names must be unique when using --outdir.")
+		os.makedirs(options.outdir, exist_ok=True)
+
+	combined = None
+	header = None
+	if options.combined is not None:
+		try:
+			combined = open(options.combined, "w")
+		except IOError as e:
+			sys.exit("Can't open file for writing. %s" % e)
+		labelfrmt = "%%-%ds " % max(len(label) for label in labels)
+
+		# the header is written once for the whole table instead of once per file
+		if options.showheader:
+			header_options = copy.copy(options)
+			header_options.sample = options.sample or not (options.user or options.equal)
+			buf = io.StringIO()
+			export_header(header_options, buf)
+			header = buf.getvalue()
+			combined.write(labelfrmt % "file" + header)
+
+	workers = options.workers or os.cpu_count()
+	fit = partial(_fit_file, options)
+
+	nfailed = 0
+	with contextlib.ExitStack() as stack:
+		if workers > 1 and len(files) > 1:
+			pool = stack.enter_context(ProcessPoolExecutor(max_workers=min(workers, len(files))))
+			results = pool.map(fit, files)
+		else:
+			results = map(fit, files)
+
+		for label, (inputfile, text, error) in zip(labels, results):
+			if error is not None:
+				print("%s: %s" % (inputfile, error), file=sys.stderr)
+				nfailed += 1
+				continue
+
+			if options.outdir is not None:
+				with open(os.path.join(options.outdir, label + options.suffix), "w") as fp:
+					fp.write(text)
+
+			if combined is not None:
+				lines = (line for line in text.splitlines(True) if line != header)
+				combined.writelines(labelfrmt % label + line for line in lines)
+
+	if combined is not None:
+		combined.close()
+
+	return nfailed
 
 
 def ccgcrv(options: dict, data_file):
@@ -337,6 +506,15 @@ def ccgcrv(options: dict, data_file):
 	return _main(options)
 
 
+def ccgcrv_batch(options: dict, inputs, workers=1, outdir=None, combined=None):
+	param_argstr = options_to_args(options)
+	options = _ccgcrv_batch_parser().parse_args(param_argstr + list(inputs))
+	options.workers = workers
+	options.outdir = outdir
+	options.combined = combined
+	return _batch_main(options)
+
+
 def validate_options(options):
 	if options.npoly < 0 or options.npoly > 10:
 		sys.exit("Error in --npoly argument: value out of range (0-10) %s" % options.npoly)
@@ -364,3 +542,12 @@ def validate_options(options):
 			sys.exit("Can not get valid date from --date argument '%s': %s" % (options.date, err))
 
 	return startdate
+
+
+if __name__ == "__main__":
+	if sys.argv[1:2] == ['batch']:
+		sys.exit(1 if _batch_main(_ccgcrv_batch_parser().parse_args(sys.argv[2:])) else 0)
+
+	parser = _ccgcrv_parser()
+	parser.add_argument('args', nargs=1)
+	_main(parser.parse_args())
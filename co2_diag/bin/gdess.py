@@ -7,9 +7,13 @@ Example usage:
     >> ./bin/gdess trend raw_data/noaa-obspack/nc/ --figure_savepath ./
     >> ./bin/gdess seasonal --help
     >> ./bin/gdess meridional --help
+    >> ./bin/gdess maps --help
+    >> ./bin/gdess sweep --help
+    >> ./bin/gdess store raw_data/noaa-obspack/nc/ --gvplus_store ./gvplus_store
 """
 from co2_diag.recipe_parsers import add_surface_trends_args_to_parser, add_seasonal_cycle_args_to_parser, \
-    add_meridional_args_to_parser
+    add_meridional_args_to_parser, add_seasonal_maps_args_to_parser, add_seasonal_sweep_args_to_parser, \
+    add_gvplus_store_args_to_parser
 from argparse import ArgumentParser
 import sys
 
@@ -33,6 +37,19 @@ def main(args):
         from co2_diag.recipes import meridional_gradient
         meridional_gradient(args, verbose=verbosity)
 
+    elif recipe_name == 'maps':
+        from co2_diag.recipes import seasonal_maps
+        seasonal_maps(args, verbose=verbosity)
+
+    elif recipe_name == 'sweep':
+        from co2_diag.recipes import seasonal_sweep
+        seasonal_sweep(args, verbose=verbosity)
+
+    elif recipe_name == 'store':
+        from co2_diag.data_source.observations.gvplus_store import build_store
+        build_store(datadir=args.ref_data, store_path=args.gvplus_store, station_codes=args.station_list,
+                    max_workers=args.max_workers, verbose=verbosity)
+
     return 0  # a clean, no-issue, exit
 
 
@@ -64,6 +81,15 @@ def parse_cli():
     #
     subparser_meridional = subparsers.add_parser('meridional', help='generate diagnostics of meridional gradient')
     add_meridional_args_to_parser(subparser_meridional)
+    #
+    subparser_maps = subparsers.add_parser('maps', help='generate maps of seasonal cycle amplitude, phase and growth rate')
+    add_seasonal_maps_args_to_parser(subparser_maps)
+    #
+    subparser_sweep = subparsers.add_parser('sweep', help='evaluate seasonal cycle metrics over a grid of curve fitting parameters')
+    add_seasonal_sweep_args_to_parser(subparser_sweep)
+    #
+    subparser_store = subparsers.add_parser('store', help='build or update a consolidated store of Globalview+ stations')
+    add_gvplus_store_args_to_parser(subparser_store)
 
     # Print the help message if no arguments are supplied at the command line.
     if len(sys.argv) == 1:
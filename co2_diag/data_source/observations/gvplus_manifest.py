@@ -0,0 +1,249 @@
+""" A cached index of the files in a Globalview+ data directory
+
+Listing a directory of thousands of ObsPack files, and matching each name against a pattern,
+is slow on network file systems, and was repeated by every loader.
+The manifest records, for each NetCDF file of a directory, its station code, size, modification time,
+site name, number of observations, their time range, and their mean latitude, longitude, and altitude.
+It is saved as JSON in a cache directory. The first load of a session lists the directory again, in a single scandir,
+and only opens the files that are new or whose size or modification time changed.
+Later loads reuse that manifest from memory, unless a refresh is requested.
+Station metadata (see station_metadata()) is then available without opening any data file.
+"""
+import numpy as np
+import xarray as xr
+import os, re, json, hashlib, logging
+
+_logger = logging.getLogger(__name__)
+
+# Increment this when the contents of the manifest change, so that existing manifests are rebuilt.
+MANIFEST_VERSION = 2
+
+# regex to get the station code from each filename
+station_code_pattern = re.compile(r'co2_([a-zA-Z0-9]*)_.*\.nc$')
+
+# Manifests that were already checked against their data directory in this session, by manifest path
+_manifests = {}
+
+
+def default_cache_dir() -> str:
+    """The directory for cached manifests: $GDESS_CACHE_DIR, or else 'gdess' in the user's cache directory."""
+    return os.environ.get('GDESS_CACHE_DIR',
+                          os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'gdess'))
+
+
+def manifest_path(datadir: str, cache_dir: str = None) -> str:
+    """The path of the cached manifest of a data directory."""
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    datadir = os.path.abspath(datadir)
+    digest = hashlib.sha1(datadir.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"manifest_{os.path.basename(datadir)}_{digest}.json")
+
+
+# Fields of each file entry that are read from the file itself
+file_metadata_fields = ['site_name', 'nobs', 'time_start', 'time_end', 'latitude', 'longitude', 'altitude']
+
+
+def _read_file_metadata(filepath: str) -> dict:
+    """Get the site name, number of observations, first and last observation times (as ISO strings),
+    and mean latitude, longitude, and altitude of an ObsPack file. The values are None if the file can't be read.
+    """
+    metadata = dict.fromkeys(file_metadata_fields)
+    try:
+        with xr.open_dataset(filepath, decode_times=False) as ds:
+            metadata['site_name'] = ds.attrs.get('site_name')
+            metadata['nobs'] = ds.sizes['obs']
+            for name in ['latitude', 'longitude', 'altitude']:
+                if name in ds:
+                    metadata[name] = float(ds[name].mean())
+            time = ds['time']
+            bounds = time.isel(obs=[int(time.argmin()), int(time.argmax())]).load()
+        bounds = xr.decode_cf(bounds.to_dataset())['time'].values
+        metadata['time_start'] = str(np.datetime64(bounds[0], 's'))
+        metadata['time_end'] = str(np.datetime64(bounds[1], 's'))
+    except Exception as e:
+        _logger.debug('Could not read the metadata of <%s>: %s', filepath, e)
+    return metadata
+
+
+def build_manifest(datadir: str, previous: dict = None) -> dict:
+    """Index the NetCDF files of a data directory
+
+    Parameters
+    ----------
+    datadir
+        directory containing the Globalview+ NetCDF files
+    previous
+        an earlier manifest of the directory, whose entries are reused for files that have not changed
+
+    Returns
+    -------
+    dict
+        with, for each file: station code, size, modification time, and the fields of _read_file_metadata()
+    """
+    previous_files = previous['files'] if previous else {}
+    files = {}
+    n_reused = 0
+    with os.scandir(datadir) as entries:
+        for entry in entries:
+            if not (entry.name.endswith('.nc') and entry.is_file()):
+                continue
+            stat = entry.stat()
+            old = previous_files.get(entry.name)
+            if old and (old['size'] == stat.st_size) and (old['mtime_ns'] == stat.st_mtime_ns):
+                files[entry.name] = old
+                n_reused += 1
+                continue
+
+            match = station_code_pattern.match(entry.name)
+            files[entry.name] = {'station': match.group(1) if match else None,
+                                 'size': stat.st_size,
+                                 'mtime_ns': stat.st_mtime_ns,
+                                 **_read_file_metadata(entry.path)}
+
+    _logger.debug('Manifest of <%s>: %d files, %d unchanged', datadir, len(files), n_reused)
+    return {'version': MANIFEST_VERSION, 'datadir': os.path.abspath(datadir), 'files': files}
+
+
+def load_manifest(datadir: str, cache_dir: str = None, refresh: bool = False) -> dict:
+    """Get the manifest of a data directory, updating and saving it if any file was added, removed, or changed
+
+    Every file is checked (by size and modification time, since rewriting a file in place does not change
+    the modification time of its directory) the first time a directory is loaded in a session.
+    Later calls return that manifest from memory, without listing the directory, unless refresh is True.
+
+    Parameters
+    ----------
+    datadir
+        directory containing the Globalview+ NetCDF files
+    cache_dir
+        directory of the cached manifests. Default is default_cache_dir().
+    refresh
+        if True, check the files again even if the directory was already loaded in this session
+
+    Returns
+    -------
+    dict
+        as made by build_manifest()
+    """
+    path = manifest_path(datadir, cache_dir)
+
+    previous = _manifests.get(path)
+    if (previous is not None) and not refresh:
+        return previous
+    if previous is None and os.path.isfile(path):
+        try:
+            with open(path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            _logger.debug('Could not read the manifest <%s>: %s', path, e)
+    if previous and (previous.get('version') != MANIFEST_VERSION):
+        previous = None
+
+    # Entries of unchanged files are reused, so only new or changed files are opened.
+    manifest = build_manifest(datadir, previous=previous)
+    if (previous is None) or (manifest['files'] != previous['files']):
+        try:
+            # The file is written under a temporary name, so that readers never see a partial manifest.
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(manifest, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            _logger.warning('Could not save the manifest <%s>: %s', path, e)
+
+    _manifests[path] = manifest
+    return manifest
+
+
+def files_by_station(datadir: str, cache_dir: str = None, refresh: bool = False) -> dict:
+    """Get the files of every station in a data directory
+
+    Loaders of several stations should get this once and look up each station,
+    instead of calling station_files() for every station.
+
+    Parameters
+    ----------
+    datadir
+    cache_dir
+    refresh
+        see load_manifest()
+
+    Returns
+    -------
+    dict
+        (keys) station codes, and for each station (values) a sorted list of data filepaths
+    """
+    stations = {}
+    for filename, entry in sorted(load_manifest(datadir, cache_dir, refresh)['files'].items()):
+        if entry['station'] is not None:
+            stations.setdefault(entry['station'], []).append(os.path.join(datadir, filename))
+    return stations
+
+
+def station_files(datadir: str, station_code: str) -> list:
+    """Get the sorted list of ObsPack files for one station."""
+    return files_by_station(datadir).get(station_code, [])
+
+
+def metadata_of_files(entries: list) -> dict:
+    """Combine the manifest entries of several files of a station
+
+    Parameters
+    ----------
+    entries
+        manifest entries, as made by build_manifest()
+
+    Returns
+    -------
+    dict
+        name, mean latitude ('lat'), longitude ('lon', from 0 to 360), and altitude ('alts'),
+        first and last observation times, number of files, and number of observations
+    """
+    readable = [e for e in entries if e['nobs']]
+    nobs = sum(e['nobs'] for e in readable)
+
+    def mean_of(field):
+        values = [(e[field], e['nobs']) for e in readable if e[field] is not None]
+        if not values:
+            return None
+        return sum(v * n for v, n in values) / sum(n for _, n in values)
+
+    lon = mean_of('longitude')
+    if (lon is not None) and (lon < 0):
+        lon = lon + 360
+    names = [e['site_name'] for e in entries if e['site_name']]
+    starts = [e['time_start'] for e in entries if e['time_start']]
+    ends = [e['time_end'] for e in entries if e['time_end']]
+
+    return {'name': names[0] if names else None,
+            'lat': mean_of('latitude'),
+            'lon': lon,
+            'alts': mean_of('altitude'),
+            'time_start': min(starts) if starts else None,
+            'time_end': max(ends) if ends else None,
+            'nfiles': len(entries),
+            'nobs': nobs}
+
+
+def station_metadata(datadir: str, cache_dir: str = None, refresh: bool = False) -> dict:
+    """Get the metadata of every station in a data directory, without opening any data file
+    (unless the manifest has to be updated)
+
+    Parameters
+    ----------
+    datadir
+    cache_dir
+    refresh
+        see load_manifest()
+
+    Returns
+    -------
+    dict
+        (keys) station codes, and for each station (values) a dict as made by metadata_of_files()
+    """
+    stations = {}
+    for filename, entry in sorted(load_manifest(datadir, cache_dir, refresh)['files'].items()):
+        if entry['station'] is not None:
+            stations.setdefault(entry['station'], []).append(entry)
+    return {code: metadata_of_files(entries) for code, entries in stations.items()}
@@ -1,6 +1,6 @@
 from co2_diag import load_stations_dict
-import xarray as xr
-import glob, os, re, argparse, shlex
+from co2_diag.data_source.observations.gvplus_manifest import load_manifest, metadata_of_files
+import re, argparse, shlex
 
 # -- Define valid surface station choices --
 station_dict = load_stations_dict()
@@ -39,8 +39,7 @@ def get_dict_of_all_station_filenames(datadir):
     -------
     A dictionary with (keys) three-letter station codes, and for each station (values) a list of data filenames
     """
-    filepath_list = glob.glob(datadir + '*surface*.nc')
-    filenames = [os.path.basename(x) for x in filepath_list]
+    filenames = [f for f in sorted(load_manifest(datadir)['files']) if 'surface' in f]
 
     # regex to get the station code from each filename
     pattern = r"co2_(?P<station_code>.*)_surface.*"
@@ -57,7 +56,19 @@ def get_dict_of_all_station_filenames(datadir):
 
 
 def get_dict_of_station_codes_and_names(datadir):
+    """Get the name of each station, from the cached file metadata (see gvplus_manifest) instead of the files
+
+    Parameters
+    ----------
+    datadir : str
+        the directory containing netcdf files for the station data
+
+    Returns
+    -------
+    A dictionary with (keys) three-letter station codes, and for each station (values) a dict with its 'name'
+    """
     stations_dict = get_dict_of_all_station_filenames(datadir)
-    return {k: {'name': xr.open_dataset(os.path.join(datadir, stations_dict[k][0])).attrs['site_name']}
+    manifest_files = load_manifest(datadir)['files']
+    return {k: {'name': metadata_of_files([manifest_files[f] for f in v])['name']}
             for k, v
             in stations_dict.items()}
\ No newline at end of file
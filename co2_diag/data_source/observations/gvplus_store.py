@@ -0,0 +1,206 @@
+""" A consolidated store of Globalview+ surface station data
+
+Opening and decoding every ObsPack NetCDF file of a station is slow when a station has dozens of files.
+The store holds one NetCDF file per station, with the observations already concatenated, indexed by time
+(as datetime64), with CO2 in ppm, sorted, and without duplicate records.
+Each station file records the source files it was built from, and is rebuilt when they change.
+
+Example usage:
+    >> ./bin/gdess store raw_data/noaa-obspack/nc/ --gvplus_store ./gvplus_store
+"""
+from co2_diag import set_verbose, load_stations_dict, load_config_file
+from co2_diag.data_source.observations.load import dataset_from_filelist, wrangle_station_dataset
+from co2_diag.data_source.observations.gvplus_manifest import files_by_station, station_files
+import numpy as np
+import pandas as pd
+import xarray as xr
+from typing import Union
+import os, json, logging
+
+_logger = logging.getLogger(__name__)
+
+# Increment this when the processing of stored stations changes, so that existing stores are rebuilt.
+STORE_VERSION = 1
+
+# Number of observations per chunk of each stored variable
+CHUNK_SIZE = 4096
+
+
+def source_manifest(file_list: list) -> str:
+    """Describe the source files of a station by name, size, and modification time, as a JSON string."""
+    manifest = []
+    for f in file_list:
+        stat = os.stat(f)
+        manifest.append([os.path.basename(f), stat.st_size, stat.st_mtime_ns])
+    return json.dumps({'version': STORE_VERSION, 'files': manifest})
+
+
+def station_store_path(store_path: str, station_code: str) -> str:
+    return os.path.join(store_path, f"{station_code}.nc")
+
+
+def is_station_current(store_path: str, datadir: str, station_code: str, file_list: list = None) -> bool:
+    """Check whether a station is in the store and was built from the current source files.
+
+    The source files are those of file_list, or else those of station_files().
+    """
+    path = station_store_path(store_path, station_code)
+    if not os.path.isfile(path):
+        return False
+    if file_list is None:
+        file_list = station_files(datadir, station_code)
+    with xr.open_dataset(path) as ds:
+        stored_manifest = ds.attrs.get('gdess_source_files')
+    return stored_manifest == source_manifest(file_list)
+
+
+def drop_duplicate_records(ds: xr.Dataset) -> xr.Dataset:
+    """Remove records that repeat the time, project, and CO2 value of an earlier record
+
+    Parameters
+    ----------
+    ds
+        a station Dataset along the 'time' dimension
+
+    Returns
+    -------
+    An xr.Dataset
+    """
+    key_vars = [v for v in ['time', 'dataset_project', 'co2'] if v in ds.variables]
+    duplicated = pd.DataFrame({v: ds[v].values for v in key_vars}).duplicated().values
+    if duplicated.any():
+        _logger.debug('  dropping %d duplicate records', np.count_nonzero(duplicated))
+        ds = ds.isel(time=np.flatnonzero(~duplicated))
+    return ds
+
+
+def build_station(store_path: str,
+                  datadir: str,
+                  station_code: str,
+                  max_workers: int = 1,
+                  file_list: list = None
+                  ) -> str:
+    """Consolidate the ObsPack files of one station into a single file of the store
+
+    Parameters
+    ----------
+    store_path
+        directory of the store
+    datadir
+        directory containing the Globalview+ NetCDF files
+    station_code
+    max_workers
+        maximum number of source files that are opened at the same time (see load.dataset_from_filelist())
+    file_list
+        the station's source files. Default is station_files(datadir, station_code).
+
+    Returns
+    -------
+    The path of the station's file in the store
+    """
+    if file_list is None:
+        file_list = station_files(datadir, station_code)
+    if not file_list:
+        raise FileNotFoundError(f"no Globalview+ files for station <{station_code}> in <{datadir}>")
+    _logger.info('Building store of station <%s> from %d files..', station_code, len(file_list))
+
+    ds = (dataset_from_filelist(file_list, max_workers=max_workers)
+          .pipe(wrangle_station_dataset)
+          .pipe(drop_duplicate_records))
+    ds.attrs['gdess_source_files'] = source_manifest(file_list)
+
+    encoding = {}
+    for name, var in ds.variables.items():
+        var.encoding = {}
+        if (var.dims == ('time',)) and (var.dtype.kind not in 'SUO'):
+            encoding[name] = {'chunksizes': (max(1, min(CHUNK_SIZE, ds.sizes['time'])),)}
+
+    # The file is written under a temporary name, so that an interrupted build leaves no partial station.
+    os.makedirs(store_path, exist_ok=True)
+    path = station_store_path(store_path, station_code)
+    temp_path = path + '.tmp'
+    ds.to_netcdf(temp_path, encoding=encoding)
+    os.replace(temp_path, path)
+
+    return path
+
+
+def build_store(datadir: str = None,
+                store_path: str = None,
+                station_codes: list = None,
+                max_workers: int = 1,
+                verbose: Union[bool, str] = False
+                ) -> list:
+    """Build or update the consolidated store for a Globalview+ directory
+
+    Parameters
+    ----------
+    datadir
+        directory containing the Globalview+ NetCDF files. Default is the 'NOAA_Globalview' source of the config file.
+    store_path
+        directory of the store. Default is a 'gdess_store' directory inside the datadir.
+    station_codes
+        Default is every station of the stations dictionary that has files in the datadir.
+    max_workers
+        maximum number of source files that are opened at the same time
+    verbose
+        can be either True, False, or a string for level such as "INFO, DEBUG, etc."
+
+    Returns
+    -------
+    The list of stations that were (re)built; stations that were already current are skipped.
+    """
+    set_verbose(_logger, verbose)
+    if not datadir:
+        config = load_config_file()
+        datadir = config.get('NOAA_Globalview', 'source', vars=os.environ)
+    if not store_path:
+        store_path = os.path.join(datadir, 'gdess_store')
+    # The data directory is listed once, and every station's files are then looked up in memory.
+    available = files_by_station(datadir, refresh=True)
+    if not station_codes:
+        station_codes = [k for k in load_stations_dict().keys() if k in available]
+
+    built = []
+    for station_code in station_codes:
+        file_list = available.get(station_code, [])
+        if is_station_current(store_path, datadir, station_code, file_list):
+            _logger.debug('Station <%s> is current.', station_code)
+            continue
+        build_station(store_path, datadir, station_code, max_workers, file_list)
+        built.append(station_code)
+
+    _logger.info('Store <%s>: %d stations built, %d already current.',
+                 store_path, len(built), len(station_codes) - len(built))
+    return built
+
+
+def load_station_from_store(store_path: str,
+                            datadir: str,
+                            station_code: str,
+                            max_workers: int = 1,
+                            file_list: list = None
+                            ) -> xr.Dataset:
+    """Open one station of the store lazily, first (re)building it if its source files have changed
+
+    Parameters
+    ----------
+    store_path
+        directory of the store
+    datadir
+        directory containing the Globalview+ NetCDF files
+    station_code
+    max_workers
+        maximum number of source files that are opened at the same time, if the station is (re)built
+    file_list
+        the station's source files. Default is station_files(datadir, station_code).
+
+    Returns
+    -------
+    An xr.Dataset, as returned by wrangle_station_dataset()
+    """
+    if file_list is None:
+        file_list = station_files(datadir, station_code)
+    if not is_station_current(store_path, datadir, station_code, file_list):
+        build_station(store_path, datadir, station_code, max_workers, file_list)
+    return xr.open_dataset(station_store_path(store_path, station_code))
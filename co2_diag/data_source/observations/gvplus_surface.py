@@ -1,19 +1,25 @@
 from co2_diag import set_verbose, load_stations_dict, load_config_file, benchmark_recipe
-from co2_diag.data_source.observations.load import load_data_with_regex, dataset_from_filelist
+from co2_diag.data_source.observations.load import load_data_with_regex, dataset_from_filelist, \
+    wrangle_station_dataset, qcflag_filter
+from co2_diag.data_source.observations.gvplus_store import load_station_from_store
+from co2_diag.data_source.observations.gvplus_manifest import files_by_station, station_files
+from co2_diag.data_source.observations.ragged import ragged_dataset_from_stations
 from co2_diag.data_source.multiset import Multiset
-from co2_diag.operations.datasetdict import DatasetDict
-from co2_diag.operations.time import select_between, ensure_dataset_datetime64, ensure_datetime64_array
-from co2_diag.operations.convert import co2_molfrac_to_ppm
+from co2_diag.operations.datasetdict import DatasetDict, LazyDatasetDict
+from co2_diag.operations.time import select_between_arrays, monthly_means_and_counts, ensure_datetime64_array
 from co2_diag.graphics.single_source_plots import plot_annual_series
 from co2_diag.graphics.utils import aesthetic_grid_no_spines, mysavefig
-from co2_diag.recipe_parsers import add_shared_arguments_for_recipes, parse_recipe_options
+from co2_diag.recipe_parsers import add_shared_arguments_for_recipes, add_obspack_arguments_for_recipes, \
+    parse_recipe_options
 from co2_diag.formatters import append_before_extension
 import numpy as np
 import pandas as pd
+import xarray as xr
 import matplotlib.pyplot as plt
 from matplotlib.dates import DateFormatter
-from typing import Union
-import os, re, glob, argparse, logging
+from typing import Union, Callable
+from functools import partial
+import os, re, argparse, logging
 
 _logger = logging.getLogger("{0}.{1}".format(__name__, "loader"))
 
@@ -69,7 +75,9 @@ class Collection(Multiset):
 
         # --- Apply diagnostic parameters and prep data for plotting ---
         # Data are formatted into the basic data structure common to various diagnostics.
-        new_self.preprocess(datadir=opts.ref_data, station_name=opts.station_code)
+        new_self.preprocess(datadir=opts.ref_data, station_name=opts.station_code, store_path=opts.gvplus_store,
+                            row_filter=qcflag_filter(opts.qcflags) if opts.qcflags else None,
+                            max_workers=opts.max_workers)
         # Data are resampled
         new_self.df_combined_and_resampled = (new_self
                                               .get_resampled_dataframe(new_self.stepA_original_datasets[opts.station_code],
@@ -115,7 +123,9 @@ class Collection(Multiset):
 
         # --- Apply diagnostic parameters and prep data for plotting ---
         # Data are formatted into the basic data structure common to various diagnostics.
-        new_self.preprocess(datadir=opts.ref_data)
+        new_self.preprocess(datadir=opts.ref_data, store_path=opts.gvplus_store, lazy=True,
+                            row_filter=qcflag_filter(opts.qcflags) if opts.qcflags else None,
+                            max_workers=opts.max_workers)
 
         _logger.info('Applying selected bounds..')
         # Data are resampled
@@ -144,7 +154,13 @@ class Collection(Multiset):
         return new_self
 
     def preprocess(self, datadir: str,
-                   station_name: Union[str, list] = None
+                   station_name: Union[str, list] = None,
+                   store_path: str = None,
+                   lazy: bool = False,
+                   max_loaded: int = None,
+                   vars_to_keep: list = None,
+                   row_filter: Callable[[xr.Dataset], np.ndarray] = None,
+                   max_workers: int = 1
                    ) -> None:
         """Set up the dataset that is common to every diagnostic
 
@@ -152,6 +168,22 @@ class Collection(Multiset):
         ----------
         datadir
         station_name
+        store_path
+            directory of a consolidated station store (see gvplus_store.build_store()).
+            If given, stations are opened lazily from the store, which is first updated for any changed source files.
+        lazy
+            if True, each station is only loaded when it is first accessed in the stepA_original_datasets
+            (and only then are its latitude, longitude, and altitude added to the station_dict).
+        max_loaded
+            with lazy=True, the maximum number of stations kept loaded; the least recently used are dropped.
+        vars_to_keep
+            ObsPack variables to load (see load.dataset_from_filelist()). Not used with a store_path.
+        row_filter
+            a function that selects the observations to load from each file, e.g. load.qcflag_filter('...').
+            With a store_path, it is applied to each station of the store instead.
+        max_workers
+            maximum number of files that are opened at the same time, by worker processes that are shared
+            by every station (see load.dataset_from_filelist()). Default is 1, which opens the files one at a time.
         """
         _logger.debug("Preprocessing...")
         if not station_name:
@@ -169,7 +201,19 @@ class Collection(Multiset):
             datadir = config.get('NOAA_Globalview', 'source', vars=os.environ)
             _logger.debug(f"Loading local Globalview data files from path <{datadir}>..")
 
-        self.stepA_original_datasets = DatasetDict(self._load_stations_by_namedict(stations, datadir))
+        # The files of every station are looked up once, instead of for each station.
+        station_file_lists = files_by_station(datadir)
+        if lazy:
+            loaders = {k: partial(self._load_station, stations, k, datadir, store_path,
+                                  vars_to_keep=vars_to_keep, row_filter=row_filter, max_workers=max_workers,
+                                  file_list=station_file_lists.get(k, []))
+                       for k in stations}
+            self.stepA_original_datasets = LazyDatasetDict(loaders, maxsize=max_loaded)
+        else:
+            self.stepA_original_datasets = DatasetDict(self._load_stations_by_namedict(stations, datadir, store_path,
+                                                                                       vars_to_keep, row_filter,
+                                                                                       max_workers,
+                                                                                       station_file_lists))
         _logger.debug("Preprocessing is done.")
 
     @staticmethod
@@ -188,45 +232,60 @@ class Collection(Multiset):
         -------
         A pandas.DataFrame with columnds of time, original data, and resampled data
         """
+        df_prepd = pd.DataFrame(Collection.get_resampled_arrays(dataset_obs, timestart=timestart, timeend=timeend))
+
+        if not df_prepd.empty:
+            _logger.debug('  First resampled row: %s', df_prepd.iloc[0, :])
+        _logger.debug('Done.')
+
+        return df_prepd
+
+    @staticmethod
+    def get_resampled_arrays(dataset_obs,
+                             timestart,
+                             timeend) -> dict:
+        """Get the original data and their monthly means, aligned along the same times
+
+        The monthly means are computed directly from the sorted time array (see operations.time),
+        instead of selecting, resampling, and merging copies of the data.
+
+        Parameters
+        ----------
+        dataset_obs
+        timestart
+        timeend
+
+        Returns
+        -------
+        dict
+            of numpy.ndarrays: 'time' (every original time, and the first day of each month that has data),
+            'obs_original_resolution' (NaN at the times of monthly means only),
+            and 'obs_resampled_resolution' (NaN except at the first day of each month)
+        """
         _logger.debug('Resampling obspack observations..')
         # --- OBSERVATIONS ---
         # Time period is selected.
-        ds_sub_obs = select_between(dataset=dataset_obs,
-                                    timestart=timestart, timeend=timeend,
-                                    varlist=['time', 'co2'],
-                                    drop_dups=True)
-        # Dataset converted to DataFrame.
-        df_prepd_obs_orig = ds_sub_obs.to_dataframe().reset_index()
-        df_prepd_obs_orig.rename(columns={'co2': 'obs_original_resolution'}, inplace=True)
+        time_orig, co2_orig = select_between_arrays(dataset_obs['time'].values, dataset_obs['co2'].values,
+                                                    timestart=timestart, timeend=timeend)
 
         # --- Resampled observations ---
-        #     ds_resampled = ds_sub_obs.resample(time="1D").interpolate("linear")  # weekly average
-        ds_resampled = ds_sub_obs.resample(time="1MS").mean()  # monthly average
-        # ds_resampled = ds_sub_obs.resample(time="1AS").mean()  # yearly average
-        # ds_resampled = ds_sub_obs.resample(time="Q").mean()  # quarterly average (consecutive three-month periods)
-        # ds_resampled = ds_sub_obs.resample(time="QS-DEC").mean()  # quarterly average (consecutive three-month periods), anchored at December 1st.
-        #
-        # Dataset converted to DataFrame.
-        df_prepd_obs_resamp = (ds_resampled
-                               .dropna(dim=('time'))
-                               .to_dataframe().reset_index()
-                               .rename(columns={'co2': 'obs_resampled_resolution'})
-                               )
+        time_resamp, co2_resamp, _ = monthly_means_and_counts(time_orig, co2_orig)  # monthly average
 
         # --- COMBINED ---
-        df_prepd = (df_prepd_obs_resamp
-                    .merge(df_prepd_obs_orig, on='time', how='outer')
-                    .reset_index()
-                    .loc[:, ['time', 'obs_original_resolution', 'obs_resampled_resolution']]
-                    )
-
-        _logger.debug('  First resampled row: %s', df_prepd.iloc[0, :])
-        _logger.debug('Done.')
+        # Both series are placed along the union of their (sorted and unique) times.
+        time_combined = np.union1d(time_orig, time_resamp)
+        obs_original = np.full(time_combined.shape, np.nan)
+        obs_original[np.searchsorted(time_combined, time_orig)] = co2_orig
+        obs_resampled = np.full(time_combined.shape, np.nan)
+        obs_resampled[np.searchsorted(time_combined, time_resamp)] = co2_resamp
 
-        return df_prepd
+        return {'time': time_combined,
+                'obs_original_resolution': obs_original,
+                'obs_resampled_resolution': obs_resampled}
 
     @staticmethod
     def _load_surface_data(datadir: str,
+                           max_workers: int = 1
                            ) -> DatasetDict:
         """Load into memory the data for surface measurements from Globalview+.
 
@@ -234,6 +293,8 @@ class Collection(Multiset):
         ----------
         datadir
             directory containing the Globalview+ NetCDF files.
+        max_workers
+            maximum number of files that are opened at the same time
 
         Returns
         -------
@@ -242,12 +303,17 @@ class Collection(Multiset):
         """
         # --- Go through files and extract all 'surface' sampled files ---
         p = re.compile(r'co2_([a-zA-Z0-9]*)_surface.*\.nc$')
-        return_value = load_data_with_regex(datadir=datadir, compiled_regex_pattern=p)
+        return_value = load_data_with_regex(datadir=datadir, compiled_regex_pattern=p, max_workers=max_workers)
         return return_value
 
     @staticmethod
     def _load_stations_by_namedict(station_dict: dict,
-                                   datadir: str
+                                   datadir: str,
+                                   store_path: str = None,
+                                   vars_to_keep: list = None,
+                                   row_filter: Callable[[xr.Dataset], np.ndarray] = None,
+                                   max_workers: int = 1,
+                                   station_file_lists: dict = None
                                    ) -> dict:
         """Load into memory the data for surface observing stations from Globalview+.
 
@@ -256,66 +322,124 @@ class Collection(Multiset):
         station_dict
         datadir
             directory containing the Globalview+ NetCDF files.
+        store_path
+            directory of a consolidated station store, from which stations are opened lazily instead.
+        vars_to_keep
+        row_filter
+        max_workers
+            see preprocess()
+        station_file_lists
+            the files of each station, as made by gvplus_manifest.files_by_station(). Default is to look them up.
 
         Returns
         -------
         dict
             Names, latitudes, longitudes, and altitudes of each station
         """
+        if station_file_lists is None:
+            station_file_lists = files_by_station(datadir)
         ds_obs_dict = {}
-        for stationcode, _ in station_dict.items():
-            _logger.debug(stationcode)
-            _logger.debug('data directory: %s', datadir)
+        for i, stationcode in enumerate(station_dict.keys()):
+            ds_obs_dict[stationcode] = Collection._load_station(station_dict, stationcode, datadir, store_path,
+                                                                vars_to_keep, row_filter, max_workers,
+                                                                station_file_lists.get(stationcode, []))
+            if i == 0:
+                _logger.debug("  the first DataSet has a time range of <%s> to <%s>.",
+                              np.datetime_as_string(ds_obs_dict[stationcode]['time'].values[0], unit='D'),
+                              np.datetime_as_string(ds_obs_dict[stationcode]['time'].values[-1], unit='D'))
+
+        return ds_obs_dict
+
+    @staticmethod
+    def _load_station(station_dict: dict,
+                      stationcode: str,
+                      datadir: str,
+                      store_path: str = None,
+                      vars_to_keep: list = None,
+                      row_filter: Callable[[xr.Dataset], np.ndarray] = None,
+                      max_workers: int = 1,
+                      file_list: list = None
+                      ) -> xr.Dataset:
+        """Load the data for one surface observing station from Globalview+.
+
+        The station's mean latitude, longitude, and altitude are added to its entry in the station_dict.
+
+        Parameters
+        ----------
+        station_dict
+        stationcode
+        datadir
+            directory containing the Globalview+ NetCDF files.
+        store_path
+            directory of a consolidated station store, from which the station is opened lazily instead.
+        vars_to_keep
+        row_filter
+        max_workers
+            see preprocess()
+        file_list
+            the station's files. Default is gvplus_manifest.station_files(datadir, stationcode).
 
-            file_list = glob.glob(os.path.join(datadir, f"co2_{stationcode}*.nc"))
+        Returns
+        -------
+        xr.Dataset
+        """
+        _logger.debug(stationcode)
+        _logger.debug('data directory: %s', datadir)
+
+        if file_list is None:
+            file_list = station_files(datadir, stationcode)
+        if store_path:
+            # Stations in the store are already wrangled (see below).
+            ds_obs = load_station_from_store(store_path, datadir, stationcode, max_workers, file_list)
+            if row_filter is not None:
+                ds_obs = ds_obs.isel(time=np.flatnonzero(row_filter(ds_obs)))
+        else:
             # print("files: ")
             # print(*[os.path.basename(x) for x in file_list], sep = "\n")
 
             _logger.debug('Station files: %s', ', '.join([os.path.basename(x) for x in file_list]))
-            ds_obs_dict[stationcode] = dataset_from_filelist(file_list)
+            ds_obs = dataset_from_filelist(file_list, vars_to_keep=vars_to_keep, row_filter=row_filter,
+                                           max_workers=max_workers)
 
-            # Simple unit check - for the Altitude variable
-            check_altitude_unit = ds_obs_dict[stationcode]['altitude'].attrs['units'] == 'm'
-            if not check_altitude_unit:
-                raise ValueError('unexpected altitude units <%s>', ds_obs_dict[stationcode]['altitude'].attrs['units'])
+        # Simple unit check - for the Altitude variable
+        check_altitude_unit = ds_obs['altitude'].attrs['units'] == 'm'
+        if not check_altitude_unit:
+            raise ValueError('unexpected altitude units <%s>', ds_obs['altitude'].attrs['units'])
 
-            lats = ds_obs_dict[stationcode]['latitude'].values
-            lons = ds_obs_dict[stationcode]['longitude'].values
-            alts = ds_obs_dict[stationcode]['altitude'].values
+        lats = ds_obs['latitude'].values
+        lons = ds_obs['longitude'].values
+        alts = ds_obs['altitude'].values
 
-            # Get the latitude and longitude of each station
-            #     different_station_lats = np.unique(lats)
-            #     different_station_lons = np.unique(lons)
-            # print(f"there are {len(different_station_lons)} different latitudes for the station: {different_station_lons}")
+        # Get the latitude and longitude of each station
+        #     different_station_lats = np.unique(lats)
+        #     different_station_lons = np.unique(lons)
+        # print(f"there are {len(different_station_lons)} different latitudes for the station: {different_station_lons}")
 
-            # Get the average lat,lon
-            meanlon = lons.mean()
-            if meanlon < 0:
-                meanlon = meanlon + 360
-            station_latlonalt = {'lat': lats.mean(), 'lon': meanlon, 'alts': alts.mean()}
-            _logger.debug("  %s" % station_latlonalt)
+        # Get the average lat,lon
+        meanlon = lons.mean()
+        if meanlon < 0:
+            meanlon = meanlon + 360
+        station_latlonalt = {'lat': lats.mean(), 'lon': meanlon, 'alts': alts.mean()}
+        _logger.debug("  %s" % station_latlonalt)
 
-            station_dict[stationcode].update(station_latlonalt)
+        station_dict[stationcode].update(station_latlonalt)
 
         # Wrangle -- Do the things to the Obs dataset.
-        _logger.debug("Converting datetime format and units...")
-        for i, (k, v) in enumerate(ds_obs_dict.items()):
-            _logger.debug('  %s', k)
-            ds_obs_dict[k] = (v
-                              .set_coords(['time', 'time_decimal', 'latitude', 'longitude', 'altitude'])
-                              .sortby(['time'])
-                              .swap_dims({"obs": "time"})
-                              .pipe(ensure_dataset_datetime64)
-                              .rename({'value': 'co2'})
-                              .pipe(co2_molfrac_to_ppm, co2_var_name='co2')
-                              )
-            if i == 0:
-                _logger.debug("  the first DataSet has a time range of <%s> to <%s>.",
-                              np.datetime_as_string(ds_obs_dict[k]['time'].values[0], unit='D'),
-                              np.datetime_as_string(ds_obs_dict[k]['time'].values[-1], unit='D'))
-        _logger.debug("Converting is done.")
+        if not store_path:
+            _logger.debug("Converting datetime format and units...")
+            ds_obs = wrangle_station_dataset(ds_obs)
 
-        return ds_obs_dict
+        return ds_obs
+
+    def get_ragged_dataset(self) -> xr.Dataset:
+        """Combine the loaded stations into one CF contiguous ragged array Dataset
+
+        Returns
+        -------
+        An xr.Dataset with 'station' and 'obs' dimensions (see ragged.ragged_dataset_from_stations())
+        """
+        datasets = dict(self.stepA_original_datasets.items())
+        return ragged_dataset_from_stations(datasets, station_info=self.station_dict)
 
     def plot_station_time_series(self, stationshortname: str) -> (plt.Figure, plt.Axes, tuple):
         """Make timeseries plot of co2 concentration for each surface observing station.
@@ -392,5 +516,6 @@ def add_surface_station_collection_args_to_parser(parser: argparse.ArgumentParse
     parser
     """
     add_shared_arguments_for_recipes(parser)
+    add_obspack_arguments_for_recipes(parser)
     parser.add_argument('--station_code', default='mlo',
                         type=str, choices=station_dict.keys())
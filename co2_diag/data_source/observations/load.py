@@ -1,71 +1,324 @@
 from co2_diag.operations.time import ensure_dataset_datetime64
 from co2_diag.operations.datasetdict import DatasetDict
 from co2_diag.operations.convert import co2_molfrac_to_ppm
+from co2_diag.data_source.observations.gvplus_manifest import load_manifest, metadata_of_files
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Callable, Union
 import numpy as np
 import xarray as xr
-import os, logging
+import os, atexit, logging
 
 _logger = logging.getLogger(__name__)
 
+# These are the default variables to keep if not overridden by a passed parameter.
+default_vars_to_keep = ['value', 'nvalue', 'value_std_dev',
+                        'time', 'start_time', 'datetime', 'time_decimal',
+                        'latitude', 'longitude', 'altitude', 'pressure',
+                        'qcflag', 'dataset_platform', 'dataset_project',
+                        'obspack_num', 'obspack_id']
+
+# If the following variables are not present, continue loading and just make them blank (NaN) arrays
+#    Otherwise, we will raise an error
+possible_missing_vars = ['pressure', 'qcflag', 'value_std_dev', 'nvalue']
+
+# File attributes that are copied to every data point, as categorical (flag) variables
+categorical_attrs = ['dataset_platform', 'dataset_project']
+
+# Pools of worker processes for opening files, by number of workers.
+#   A pool is started on first use and reused by later calls (e.g. for every station).
+#   A broken pool is replaced, and every pool is shut down when the interpreter exits.
+_executors = {}
+
 
 def dataset_from_filelist(file_list: list,
                           vars_to_keep: list = None,
-                          decode_times: bool = False):
+                          decode_times: bool = False,
+                          max_workers: int = 1,
+                          row_filter: Callable[[xr.Dataset], np.ndarray] = None):
     """Load ObsPack NetCDF files specified in a list and create one Dataset from them.
 
+    Each file is pruned to the variables to keep, and to the observations accepted by the row_filter, as it is opened.
+    It is read into memory before the next one is opened, so unused variables and observations are never concatenated.
+    With max_workers > 1, the files are opened concurrently in worker processes
+    (threads are not used, because the netCDF/HDF5 libraries are not thread-safe in general).
+    The worker processes are started once, and reused by later calls with the same max_workers.
+    If a worker process dies (e.g. killed when out of memory), the files are opened once more by a new pool.
+
     Parameters
     ----------
     file_list
     vars_to_keep: list
     decode_times: parameter passed to Xarray.open_dataset()
+    max_workers: int
+        maximum number of files that are opened at the same time. Default is 1.
+    row_filter: Callable
+        a function of the Dataset of one file (with all of its variables) that returns
+        a boolean array of the observations to keep, e.g. qcflag_filter('...').
+        With max_workers > 1, it must be picklable, e.g. a module-level function or a functools.partial.
 
     Returns
     -------
     An xr.Dataset
     """
     if vars_to_keep is None:
-        # These are the default variables to keep if not overridden by a passed parameter.
-        vars_to_keep = ['value', 'nvalue', 'value_std_dev',
-                        'time', 'start_time', 'datetime', 'time_decimal',
-                        'latitude', 'longitude', 'altitude', 'pressure',
-                        'qcflag', 'dataset_platform', 'dataset_project',
-                        'obspack_num', 'obspack_id']
+        vars_to_keep = default_vars_to_keep
+    if len(file_list) == 0:
+        raise ValueError('no ObsPack files to load')
+
+    open_one = partial(_open_obspack_file, vars_to_keep=vars_to_keep, decode_times=decode_times,
+                       row_filter=row_filter)
+    if (max_workers > 1) and (len(file_list) > 1):
+        try:
+            ds_list = list(file_executor(max_workers).map(open_one, file_list))
+        except BrokenProcessPool:
+            _logger.warning('a worker process stopped unexpectedly. Opening the files again with a new pool.')
+            _discard_file_executor(max_workers)
+            try:
+                ds_list = list(file_executor(max_workers).map(open_one, file_list))
+            except BrokenProcessPool:
+                _discard_file_executor(max_workers)
+                raise
+    else:
+        ds_list = [open_one(f) for f in file_list]
+
+    return concat_along_obs(ds_list)
+
+
+def file_executor(max_workers: int) -> ProcessPoolExecutor:
+    """Get the shared pool of worker processes for opening files, starting it on first use."""
+    executor = _executors.get(max_workers)
+    if executor is None:
+        executor = _executors[max_workers] = ProcessPoolExecutor(max_workers=max_workers)
+    return executor
+
+
+def _discard_file_executor(max_workers: int) -> None:
+    """Remove a (broken) pool of worker processes, so the next call of file_executor() starts a new one."""
+    executor = _executors.pop(max_workers, None)
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+@atexit.register
+def shutdown_file_executors() -> None:
+    """Shut down every pool of worker processes for opening files. This is also done when the interpreter exits."""
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown()
+
+
+def _open_obspack_file(filename: str,
+                       vars_to_keep: list,
+                       decode_times: bool = False,
+                       row_filter: Callable[[xr.Dataset], np.ndarray] = None) -> xr.Dataset:
+    """Open one ObsPack NetCDF file, prepare it for concatenation, and read it into memory.
+
+    The observations are selected before the file is read, so rejected observations are never loaded.
+    """
+    with xr.open_dataset(filename, decode_times=decode_times) as thisds:
+        if row_filter is not None:
+            keep = np.asarray(row_filter(thisds), dtype=bool)
+            _logger.debug('%s: keeping %d of %d observations', os.path.basename(filename), keep.sum(), keep.size)
+            thisds = thisds.isel(obs=np.flatnonzero(keep))
+        newds = preprocess_obspack_dataset(thisds, vars_to_keep=vars_to_keep).load()
+    return newds
+
+
+def _qcflag_is_accepted(thisds: xr.Dataset, accepted: tuple) -> np.ndarray:
+    if ('qcflag' not in thisds) or (thisds['qcflag'].dtype.kind not in 'SU'):
+        # Without QC flags, every observation is kept.
+        return np.ones(thisds.sizes['obs' if 'obs' in thisds.sizes else 'time'], dtype=bool)
+    qcflag = thisds['qcflag'].values
+    if qcflag.dtype.kind == 'S':
+        accepted = [a.encode() for a in accepted]
+    return np.isin(qcflag, accepted)
+
+
+def qcflag_filter(accepted: Union[str, list] = '...') -> Callable[[xr.Dataset], np.ndarray]:
+    """Make a row_filter for dataset_from_filelist() that keeps the observations with an accepted QC flag
+
+    Observations from files without a 'qcflag' variable are all kept.
+
+    Parameters
+    ----------
+    accepted
+        one or more 'qcflag' values, e.g. '...' for observations that passed every check
+
+    Returns
+    -------
+    A picklable function of a Dataset, which returns a boolean array along 'obs'
+    """
+    if isinstance(accepted, str):
+        accepted = [accepted]
+    return partial(_qcflag_is_accepted, accepted=tuple(accepted))
+
+
+def preprocess_obspack_dataset(thisds: xr.Dataset,
+                               vars_to_keep: list = None) -> xr.Dataset:
+    """Prepare the Dataset of one ObsPack file for concatenation with others along the 'obs' dimension.
+
+    Only the specified variables are retained, missing optional variables are filled with NaN,
+    and the Dataset attributes 'platform' and 'project' are copied to every data point
+    as CF flag variables (see encode_flag_variable()).
+    The Dataset can still be lazily loaded, so it can be used as the preprocess function of xr.open_mfdataset().
+
+    Parameters
+    ----------
+    thisds: xr.Dataset
+    vars_to_keep: list
+
+    Returns
+    -------
+    An xr.Dataset
+    """
+    if vars_to_keep is None:
+        vars_to_keep = default_vars_to_keep
+    n_obs = thisds.sizes['obs']
+
+    # Only the specified variables are retained.
+    newds = thisds[[vname for vname in thisds.keys() if vname in vars_to_keep]]
 
-    ds_list = []
-    for i, f in enumerate(file_list):
-        thisds = xr.open_dataset(f, decode_times=decode_times)
+    new_vars = {pmv: ('obs', np.full(n_obs, np.nan))
+                for pmv in possible_missing_vars
+                if (pmv not in thisds.keys()) and (pmv in vars_to_keep)}
 
-        # If the following variables are not present, continue loading and just make them blank DataArrays
-        #    Otherwise, we will raise an error
-        possible_missing_vars = ['pressure', 'qcflag', 'value_std_dev', 'nvalue']
-        for pmv in possible_missing_vars:
-            if not (pmv in thisds.keys()):
-                blankarray = xr.DataArray(data=[np.nan], dims='obs', name=pmv).squeeze()
-                thisds = thisds.assign({pmv: blankarray})
+    # Dataset attributes 'platform' and 'project' are copied to every data point along the 'obs' dimension,
+    #   as integer codes with a CF flag_values/flag_meanings lookup table.
+    for attr_name in categorical_attrs:
+        new_vars[attr_name] = encode_flag_variable(np.zeros(n_obs, dtype=np.uint8), [thisds.attrs[attr_name]])
+
+    newds = newds.assign(new_vars)
+
+    return newds
+
+
+def encode_flag_variable(codes: np.ndarray,
+                         meanings: list,
+                         dim: str = 'obs') -> xr.Variable:
+    """Make a categorical variable, stored as small integer codes with a CF flag-style lookup table.
+
+    Parameters
+    ----------
+    codes: np.ndarray
+        integers from 0 to len(meanings) - 1
+    meanings: list
+        of str, the category of each code. Blanks are replaced by underscores,
+        because 'flag_meanings' is a blank separated list.
+    dim: str
+
+    Returns
+    -------
+    An xr.Variable with 'flag_values' and 'flag_meanings' attributes
+    """
+    dtype = np.min_scalar_type(max(len(meanings) - 1, 0))
+    return xr.Variable(dim, codes.astype(dtype),
+                       attrs={'flag_values': np.arange(len(meanings), dtype=dtype),
+                              'flag_meanings': ' '.join(str(m).replace(' ', '_') for m in meanings)})
+
+
+def _flag_lookups(parts: list) -> tuple:
+    """Merge the lookup tables of flag variables.
+
+    Returns
+    -------
+    A 2-tuple
+        the merged list of flag meanings, and for each variable an array that maps its codes to the merged codes
+    """
+    part_meanings = [p.attrs['flag_meanings'].split() for p in parts]
+    meanings = list(dict.fromkeys(m for pm in part_meanings for m in pm))
+    index = {m: i for i, m in enumerate(meanings)}
+    return meanings, [np.array([index[m] for m in pm], dtype=int) for pm in part_meanings]
 
-        # Only the specified variables are retained.
-        to_drop = []
-        for vname in thisds.keys():
-            if not (vname in vars_to_keep):
-                to_drop.append(vname)
-        newds = thisds.drop_vars(to_drop)
 
-        # Dataset attributes 'platform' and 'project' are copied to every data point along the 'obs' dimension.
-        n_obs = len(thisds['obs'])
-        newds = newds.assign(dataset_platform=xr.DataArray([thisds.attrs['dataset_platform']] * n_obs, dims='obs'))
-        newds = newds.assign(dataset_project=xr.DataArray([thisds.attrs['dataset_project']] * n_obs, dims='obs'))
+def _unify_flag_meanings(ds_list: list) -> list:
+    """Recode the flag variables of each Dataset so that they all share one lookup table."""
+    for name in ds_list[0].data_vars:
+        if 'flag_meanings' in ds_list[0][name].attrs:
+            meanings, lookups = _flag_lookups([ds[name] for ds in ds_list])
+            ds_list = [ds.assign({name: encode_flag_variable(lookup[ds[name].values], meanings, dim=ds[name].dims[0])})
+                       for ds, lookup in zip(ds_list, lookups)]
 
-        ds_list.append(newds)
-        #     if i > 100:
-        #         break
+    return ds_list
 
-    ds = xr.concat(ds_list, dim='obs')
 
-    return ds
+def concat_along_obs(ds_list: list) -> xr.Dataset:
+    """Concatenate in-memory Datasets along the 'obs' dimension.
+
+    Each variable is copied into one array that is allocated at its final size.
+    Flag variables (see encode_flag_variable()) are recoded to share one lookup table.
+    Variables that do not all have 'obs' as their first dimension, or whose data types differ in kind,
+    are left to xr.concat().
+
+    Parameters
+    ----------
+    ds_list: list
+        of xr.Dataset
+
+    Returns
+    -------
+    An xr.Dataset, with the attributes of the first Dataset
+    """
+    first = ds_list[0]
+    names = list(first.variables)
+    if any(set(ds.variables) != set(names) for ds in ds_list):
+        return xr.concat(_unify_flag_meanings(ds_list), dim='obs')
+
+    bounds = np.cumsum([0] + [ds.sizes['obs'] for ds in ds_list])
+    variables = {}
+    for name in names:
+        parts = [ds.variables[name] for ds in ds_list]
+        if (any(p.dims[:1] != ('obs',) or p.dims != parts[0].dims or p.shape[1:] != parts[0].shape[1:]
+                for p in parts)
+                or len({p.dtype.kind for p in parts}) > 1):
+            return xr.concat(_unify_flag_meanings(ds_list), dim='obs')
+
+        if 'flag_meanings' in parts[0].attrs:
+            meanings, lookups = _flag_lookups(parts)
+            data = np.empty(bounds[-1], dtype=int)
+            for p, lookup, start, stop in zip(parts, lookups, bounds[:-1], bounds[1:]):
+                data[start:stop] = lookup[p.values]
+            variables[name] = encode_flag_variable(data, meanings, dim=parts[0].dims[0])
+            continue
+
+        data = np.empty((bounds[-1],) + parts[0].shape[1:], dtype=np.result_type(*[p.dtype for p in parts]))
+        for p, start, stop in zip(parts, bounds[:-1], bounds[1:]):
+            data[start:stop] = p.values
+        variables[name] = xr.Variable(parts[0].dims, data, attrs=parts[0].attrs, encoding=parts[0].encoding)
+
+    return xr.Dataset({name: variables[name] for name in first.data_vars},
+                      coords={name: variables[name] for name in first.coords},
+                      attrs=first.attrs)
+
+
+def wrangle_station_dataset(ds: xr.Dataset) -> xr.Dataset:
+    """Index a station's observations by time, with time as datetime64 and CO2 in ppm
+
+    Parameters
+    ----------
+    ds: xr.Dataset
+        as made by dataset_from_filelist()
+
+    Returns
+    -------
+    An xr.Dataset, sorted along a 'time' dimension, with the CO2 values renamed to 'co2'
+    """
+    # Coordinates that were not loaded (see the vars_to_keep of dataset_from_filelist()) are skipped.
+    coord_names = [v for v in ['time', 'time_decimal', 'latitude', 'longitude', 'altitude'] if v in ds.variables]
+    return (ds
+            .set_coords(coord_names)
+            .sortby(['time'])
+            .swap_dims({"obs": "time"})
+            .pipe(ensure_dataset_datetime64)
+            .rename({'value': 'co2'})
+            .pipe(co2_molfrac_to_ppm, co2_var_name='co2')
+            )
 
 
 def load_data_with_regex(datadir: str,
                          compiled_regex_pattern=None,
+                         max_workers: int = 1
                          ) -> DatasetDict:
     """Load into memory the data from regex-defined files of Globalview+.
 
@@ -74,6 +327,8 @@ def load_data_with_regex(datadir: str,
     datadir
         directory containing the Globalview+ NetCDF files.
     compiled_regex_pattern
+    max_workers
+        maximum number of files that are opened at the same time (see dataset_from_filelist())
 
     Returns
     -------
@@ -82,8 +337,9 @@ def load_data_with_regex(datadir: str,
     """
     # --- Go through files and extract all files found via the regex pattern search ---
     # file_dict = {s.group(1): f for f in os.listdir(datadir) if (s := compiled_regex_pattern.search(f))}
+    manifest = load_manifest(datadir)
     file_dict = dict()
-    for f in os.listdir(datadir):
+    for f in sorted(manifest['files']):
         if s := compiled_regex_pattern.search(f):
             if s.group(1) not in file_dict.keys():
                 file_dict[s.group(1)] = [f]
@@ -96,28 +352,18 @@ def load_data_with_regex(datadir: str,
                                   )
                   )
 
+    manifest_files = manifest['files']
     ds_obs_dict = {}
     site_dict = {}
     for i, (sitecode, file_list) in enumerate(file_dict.items()):
-        ds_obs_dict[sitecode] = dataset_from_filelist([os.path.join(datadir, f) for f in file_list])
-        site_dict[sitecode] = {'name': ds_obs_dict[sitecode].site_name}
-
-        lats = ds_obs_dict[sitecode]['latitude'].values
-        lons = ds_obs_dict[sitecode]['longitude'].values
-        # Get the latitude and longitude of each station
-        #     different_station_lats = np.unique(lats)
-        #     different_station_lons = np.unique(lons)
-        # print(f"there are {len(different_station_lons)} different latitudes for the station: {different_station_lons}")
-
-        # Get the average lat,lon
-        meanlon = lons.mean()
-        if meanlon < 0:
-            meanlon = meanlon + 360
-        SiteLatLon = {'lat': lats.mean(), 'lon': meanlon}
-        _logger.info("%s. %s - %s", str(i).rjust(2), sitecode.ljust(12), SiteLatLon)
-
-        site_dict[sitecode]['lat'] = lats.mean()
-        site_dict[sitecode]['lon'] = meanlon
+        ds_obs_dict[sitecode] = dataset_from_filelist([os.path.join(datadir, f) for f in file_list],
+                                                         max_workers=max_workers)
+
+        # The name and average lat,lon of each station are taken from the cached file metadata.
+        site_metadata = metadata_of_files([manifest_files[f] for f in file_list])
+        site_dict[sitecode] = {'name': site_metadata['name'], 'lat': site_metadata['lat'], 'lon': site_metadata['lon']}
+        _logger.info("%s. %s - %s", str(i).rjust(2), sitecode.ljust(12),
+                     {'lat': site_metadata['lat'], 'lon': site_metadata['lon']})
 
     # Wrangle -- Do the things to the Obs dataset.
     _logger.debug("Converting datetime format and units..")
@@ -132,7 +378,7 @@ def load_data_with_regex(datadir: str,
                           .pipe(co2_molfrac_to_ppm, co2_var_name='co2')
                           .set_index(obs=['time', 'longitude', 'latitude', 'altitude'])
                           )
-    #### Concatenate all sites into one large dataset, for mapping or other combined analysis purposes
-    ds_all = xr.concat(ds_obs_dict.values(), dim=('obs'))
+    # For mapping or other combined analysis purposes, all sites can be combined with
+    #   ragged.ragged_dataset_from_stations(), which keeps each site's observations contiguous.
 
     return DatasetDict(ds_obs_dict)
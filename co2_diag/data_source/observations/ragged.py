@@ -0,0 +1,153 @@
+""" All-station observations as one CF contiguous ragged array Dataset
+
+The observations of every station are stored one station after another along a single 'obs' dimension,
+with a 'station' dimension for station variables, following the CF conventions
+for a 'timeSeries' featureType with a contiguous ragged array representation:
+    - 'row_size' (station) is the number of observations of each station, with a 'sample_dimension' attribute,
+    - 'station_id' (station) identifies each station, with a 'cf_role' attribute.
+
+A station's observations are a slice along 'obs', and network-wide calculations can be vectorized
+over the flat observation arrays, using the station index of each observation.
+"""
+from co2_diag.data_source.observations.load import concat_along_obs
+import numpy as np
+import xarray as xr
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Station properties that are taken from the station dictionary, and the variable name for each.
+station_info_vars = {'name': 'station_name', 'lat': 'station_latitude',
+                     'lon': 'station_longitude', 'alts': 'station_altitude'}
+
+
+def ragged_dataset_from_stations(datasets: dict,
+                                 station_info: dict = None
+                                 ) -> xr.Dataset:
+    """Combine the Datasets of several stations into one contiguous ragged array Dataset
+
+    Each variable is copied once, into an array allocated at its final size.
+
+    Parameters
+    ----------
+    datasets
+        (keys) station codes, and (values) station Datasets along a single dimension, e.g. 'time'
+    station_info
+        (keys) station codes, and (values) dicts that may have 'name', 'lat', 'lon', and 'alts' of each station
+
+    Returns
+    -------
+    An xr.Dataset with 'station' and 'obs' dimensions
+    """
+    station_codes = list(datasets.keys())
+    if not station_codes:
+        raise ValueError('no station Datasets to combine')
+
+    obs_datasets = []
+    for code in station_codes:
+        ds = datasets[code]
+        dim = ds['co2'].dims[0] if 'co2' in ds else list(ds.dims)[0]
+        # The observation variables are rewrapped along 'obs', without copying their data.
+        obs_datasets.append(xr.Dataset({name: xr.Variable('obs', var.values, attrs=var.attrs)
+                                        for name, var in ds.variables.items()
+                                        if (var.dims == (dim,)) and (var.dtype.kind != 'O')},
+                                       attrs=ds.attrs))
+
+    # Only the variables that every station has are kept.
+    common_vars = set.intersection(*[set(ds.variables) for ds in obs_datasets])
+    dropped = set.union(*[set(ds.variables) for ds in obs_datasets]) - common_vars
+    if dropped:
+        _logger.debug('Variables missing from some stations are not kept: %s', sorted(dropped))
+    obs_datasets = [ds[[name for name in ds.data_vars if name in common_vars]] for ds in obs_datasets]
+
+    ds_ragged = concat_along_obs(obs_datasets)
+    ds_ragged.attrs = {'featureType': 'timeSeries'}
+
+    row_size = np.array([ds.sizes['obs'] for ds in obs_datasets])
+    ds_ragged['station_id'] = xr.Variable('station', np.array(station_codes), attrs={'cf_role': 'timeseries_id'})
+    ds_ragged['row_size'] = xr.Variable('station', row_size,
+                                        attrs={'long_name': 'number of observations for this station',
+                                               'sample_dimension': 'obs'})
+    if station_info:
+        for key, name in station_info_vars.items():
+            if all(key in station_info.get(code, {}) for code in station_codes):
+                ds_ragged[name] = xr.Variable('station', np.array([station_info[code][key] for code in station_codes]))
+
+    return ds_ragged.set_coords('station_id')
+
+
+def station_row_bounds(ds_ragged: xr.Dataset) -> tuple:
+    """Get the first and (one past the) last observation index of each station
+
+    Returns
+    -------
+    A 2-tuple of np.ndarrays, with one element per station
+    """
+    stop = np.cumsum(ds_ragged['row_size'].values)
+    return stop - ds_ragged['row_size'].values, stop
+
+
+def station_index_of_obs(ds_ragged: xr.Dataset) -> np.ndarray:
+    """Get the station index of each observation, for vectorized calculations over the whole network."""
+    return np.repeat(np.arange(ds_ragged.sizes['station']), ds_ragged['row_size'].values)
+
+
+def select_station(ds_ragged: xr.Dataset, station_code: str) -> xr.Dataset:
+    """Get the observations and station variables of one station
+
+    Parameters
+    ----------
+    ds_ragged
+        as made by ragged_dataset_from_stations()
+    station_code
+
+    Returns
+    -------
+    An xr.Dataset with a 'station' dimension of size one, and that station's slice of the 'obs' dimension
+    """
+    i = np.flatnonzero(ds_ragged['station_id'].values == station_code)
+    if i.size == 0:
+        raise KeyError(f"station <{station_code}> is not in the Dataset")
+    start, stop = station_row_bounds(ds_ragged)
+    return ds_ragged.isel(station=slice(i[0], i[0] + 1), obs=slice(start[i[0]], stop[i[0]]))
+
+
+def reduce_by_station(ds_ragged: xr.Dataset,
+                      var_name: str = 'co2',
+                      how: str = 'mean'
+                      ) -> xr.DataArray:
+    """Reduce an observation variable to one value per station, ignoring NaNs, in one vectorized pass
+
+    Parameters
+    ----------
+    ds_ragged
+        as made by ragged_dataset_from_stations()
+    var_name
+    how
+        one of 'mean', 'sum', 'count', 'min', or 'max'
+
+    Returns
+    -------
+    An xr.DataArray along the 'station' dimension (NaN for stations without valid observations)
+    """
+    values = ds_ragged[var_name].values.astype(float)
+    valid = ~np.isnan(values)
+    station_index = station_index_of_obs(ds_ragged)
+    n_station = ds_ragged.sizes['station']
+
+    count = np.bincount(station_index, weights=valid, minlength=n_station)
+    if how in ('mean', 'sum', 'count'):
+        total = np.bincount(station_index, weights=np.where(valid, values, 0), minlength=n_station)
+        result = {'mean': total / np.where(count > 0, count, np.nan), 'sum': total, 'count': count}[how]
+    elif how in ('min', 'max'):
+        ufunc = np.fmin if how == 'min' else np.fmax
+        result = np.full(n_station, np.nan)
+        start, _ = station_row_bounds(ds_ragged)
+        has_obs = ds_ragged['row_size'].values > 0
+        if has_obs.any():
+            result[has_obs] = ufunc.reduceat(values, start[has_obs])
+    else:
+        raise ValueError(f"unexpected reduction <{how}>")
+
+    return xr.DataArray(result, dims='station', coords={'station_id': ds_ragged['station_id']},
+                        name=var_name, attrs=ds_ragged[var_name].attrs if how != 'count' else {})
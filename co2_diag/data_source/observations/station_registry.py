@@ -0,0 +1,136 @@
+""" A spatial index of Globalview+ surface stations
+
+The latitude and longitude of every station are taken from the cached file manifest
+(see gvplus_manifest.station_metadata()), so stations can be selected by location without opening any data file,
+and only the files of the selected stations are then loaded.
+
+Example usage:
+    >> registry = StationRegistry.from_datadir(datadir)
+    >> registry.bbox(lat_min=15, lat_max=50, lon_min=190, lon_max=310)
+    >> registry.region('Boreal North America')
+    >> registry.nearest(lat=40.0, lon=254.7, n=3)
+"""
+from co2_diag import load_config_file
+from co2_diag.data_source.observations.gvplus_manifest import station_metadata
+from sklearn.neighbors import BallTree
+import numpy as np
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Mean radius of the Earth (km), for distances of the nearest() query
+EARTH_RADIUS_KM = 6371.0
+
+
+def load_region_bounds(region_name: str) -> tuple:
+    """Get the bounds of a named region from the [regions] section of the config file
+
+    Each region is defined as 'lat_min, lat_max, lon_min, lon_max', with longitudes from 0 to 360.
+    Region names are not case-sensitive.
+
+    Returns
+    -------
+    A 4-tuple of floats: lat_min, lat_max, lon_min, lon_max
+    """
+    config = load_config_file()
+    # Values are read raw, and the environment variables (the config defaults) are left out.
+    regions = {k: v for k, v in config.items('regions', raw=True) if k not in config.defaults()}
+    key = region_name.strip().lower()
+    if key not in regions:
+        raise ValueError(f"unexpected region <{region_name}>. Choose from: {sorted(regions)}")
+    bounds = tuple(float(x) for x in regions[key].split(','))
+    if len(bounds) != 4:
+        raise ValueError(f"region <{region_name}> should have 4 bounds, not <{regions[key]}>")
+    return bounds
+
+
+class StationRegistry:
+    """Station codes with their latitudes and longitudes, indexed for spatial queries
+
+    Stations are kept sorted by latitude, so latitude bands and bounding boxes are found by binary search.
+    A BallTree (haversine metric) is built for the nearest-station queries when it is first needed.
+    Every query returns station codes in the order of the codes given to the registry,
+    except nearest(), which returns them from nearest to farthest.
+    """
+    def __init__(self, codes: list, lat, lon):
+        self.codes = np.asarray(codes)
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float) % 360
+        if not (self.codes.shape == self.lat.shape == self.lon.shape):
+            raise ValueError('codes, lat, and lon should have the same length')
+
+        self._lat_order = np.argsort(self.lat, kind='stable')
+        self._sorted_lat = self.lat[self._lat_order]
+        self._tree = None
+
+    @classmethod
+    def from_datadir(cls, datadir: str, cache_dir: str = None) -> 'StationRegistry':
+        """Make a registry of the stations with files in a Globalview+ data directory
+
+        Stations whose files have no readable location are left out.
+        """
+        metadata = station_metadata(datadir, cache_dir)
+        located = {code: m for code, m in metadata.items() if (m['lat'] is not None) and (m['lon'] is not None)}
+        if len(located) < len(metadata):
+            _logger.debug('Stations without a location are not indexed: %s', sorted(set(metadata) - set(located)))
+        codes = sorted(located)
+        return cls(codes, [located[c]['lat'] for c in codes], [located[c]['lon'] for c in codes])
+
+    def __len__(self) -> int:
+        return self.codes.size
+
+    def __contains__(self, code) -> bool:
+        return code in self.codes
+
+    def _codes_of(self, mask_or_index) -> list:
+        return self.codes[np.sort(np.asarray(mask_or_index))].tolist()
+
+    def _latitude_band_index(self, lat_min: float, lat_max: float) -> np.ndarray:
+        start = np.searchsorted(self._sorted_lat, lat_min, side='left')
+        stop = np.searchsorted(self._sorted_lat, lat_max, side='right')
+        return self._lat_order[start:stop]
+
+    def latitude_band(self, lat_min: float, lat_max: float) -> list:
+        """Get the stations from lat_min to lat_max (inclusive)."""
+        return self._codes_of(self._latitude_band_index(lat_min, lat_max))
+
+    def bbox(self,
+             lat_min: float, lat_max: float,
+             lon_min: float, lon_max: float
+             ) -> list:
+        """Get the stations inside a latitude-longitude box (inclusive)
+
+        Longitudes can be given from -180 to 180 or from 0 to 360.
+        A box with lon_min greater than lon_max crosses the prime meridian, e.g. lon_min=350, lon_max=40.
+        """
+        index = self._latitude_band_index(lat_min, lat_max)
+        if lon_max - lon_min >= 360:
+            return self._codes_of(index)
+        lon = self.lon[index]
+        lon_min, lon_max = lon_min % 360, lon_max % 360
+        if lon_min <= lon_max:
+            in_lon = (lon >= lon_min) & (lon <= lon_max)
+        else:
+            in_lon = (lon >= lon_min) | (lon <= lon_max)
+        return self._codes_of(index[in_lon])
+
+    def region(self, region_name: str) -> list:
+        """Get the stations inside a region defined in the config file (see load_region_bounds())."""
+        return self.bbox(*load_region_bounds(region_name))
+
+    def nearest(self, lat: float, lon: float, n: int = 1) -> list:
+        """Get the n stations nearest to a location, from nearest to farthest."""
+        return self.nearest_with_distance(lat, lon, n)[0]
+
+    def nearest_with_distance(self, lat: float, lon: float, n: int = 1) -> tuple:
+        """Get the n stations nearest to a location, and their great-circle distances (km)
+
+        Returns
+        -------
+        A 2-tuple: a list of station codes, and an np.ndarray of distances, from nearest to farthest
+        """
+        if self._tree is None:
+            self._tree = BallTree(np.radians(np.column_stack([self.lat, self.lon])), metric='haversine')
+        n = min(n, len(self))
+        distance, index = self._tree.query(np.radians([[lat, lon % 360]]), k=n)
+        return self.codes[index[0]].tolist(), distance[0] * EARTH_RADIUS_KM
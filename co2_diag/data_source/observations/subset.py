@@ -148,6 +148,72 @@ def by_datetime(dataset: xr.Dataset,
     return ds_year
 
 
+def decode_flag_meanings(data_array: xr.DataArray) -> np.ndarray:
+    """Get the category of each data point of a flag variable, e.g. 'dataset_platform' or 'dataset_project'
+
+    Parameters
+    ----------
+    data_array
+        with 'flag_values' and 'flag_meanings' attributes
+
+    Returns
+    -------
+    An array of str, with the same shape as the data_array
+    """
+    meanings = np.array(data_array.attrs['flag_meanings'].split())
+    flag_values = np.asarray(data_array.attrs['flag_values'])
+    return meanings[np.searchsorted(flag_values, data_array.values.astype(flag_values.dtype))]
+
+
+def by_flag_meaning(dataset: xr.Dataset,
+                    var_name: str,
+                    meanings: Union[str, list]) -> xr.Dataset:
+    """Select the data points whose flag variable has one of the given categories
+
+    Parameters
+    ----------
+    dataset
+    var_name
+        name of a flag variable, e.g. 'dataset_platform' or 'dataset_project'
+    meanings
+        one or more categories, e.g. 'insitu' or ['flask', 'pfp'].
+        Blanks are replaced by underscores, as in the 'flag_meanings' attribute.
+
+    Returns
+    -------
+    The subset of the dataset, along the dimension of the flag variable
+
+    Raises
+    ------
+    ValueError if none of the meanings is one of the variable's 'flag_meanings'
+    """
+    if isinstance(meanings, str):
+        meanings = [meanings]
+    meanings = [str(m).replace(' ', '_') for m in meanings]
+    flag_var = dataset[var_name]
+    all_meanings = flag_var.attrs['flag_meanings'].split()
+    flag_values = np.asarray(flag_var.attrs['flag_values'])
+    if not set(meanings) & set(all_meanings):
+        raise ValueError(f"unexpected {var_name} <{meanings}>. Choose from: {all_meanings}")
+
+    keep_values = [v for v, m in zip(flag_values, all_meanings) if m in meanings]
+    keep_mask = np.isin(flag_var.values, keep_values)
+
+    return dataset.isel({flag_var.dims[0]: np.flatnonzero(keep_mask)})
+
+
+def by_platform(dataset: xr.Dataset,
+                platforms: Union[str, list]) -> xr.Dataset:
+    """Select the data points from one or more platforms, e.g. 'fixed'"""
+    return by_flag_meaning(dataset, 'dataset_platform', platforms)
+
+
+def by_project(dataset: xr.Dataset,
+               projects: Union[str, list]) -> xr.Dataset:
+    """Select the data points from one or more projects, e.g. 'insitu' or ['flask', 'pfp']"""
+    return by_flag_meaning(dataset, 'dataset_project', projects)
+
+
 def binLonLat(dataset: xr.Dataset,
               n_latitude: int = 10, n_longitude: int = 10,
               var_name: str = 'co2'):
@@ -1,5 +1,5 @@
 import co2_diag.graphics
-from ccgcrv.ccg_filter import ccgFilter
+from ccgcrv.ccg_filter import ccgFilter, ccgFilterBatch
 from co2_diag import set_verbose
 from co2_diag.data_source.models.cmip.cmip_collection import Collection as cmipCollection
 from co2_diag.graphics.single_source_plots import plot_filter_components
@@ -8,7 +8,8 @@ from co2_diag.operations.geographic import get_closest_mdl_cell_dict
 from co2_diag.operations.utils import assert_expected_dimensions
 from co2_diag.formatters import append_before_extension
 from co2_diag.data_source.observations import gvplus_surface as obspack_surface_collection_module
-from ccgcrv.ccg_dates import decimalDateFromDatetime
+from co2_diag.data_source.observations.load import qcflag_filter
+from ccgcrv.ccg_dates import decimalDateFromDatetime64, calendarDateArray
 from sklearn.metrics import mean_squared_error
 from datetime import datetime
 import numpy as np
@@ -73,36 +74,30 @@ class Confrontation:
         processed_station_metadata = dict(lat=[], lon=[], code=[], fullname=[])
         data_dict = dict(ref=[], mdl=[])  # each key will contain a list of Dataframes.
         num_stations = [len(self.stations_to_analyze)]
+
+        # --- Optionally, a single reference record is fit once, and its trend is used to detrend every station ---
+        reference_filters = None
+        if (how == 'seasonal') and self.opts.use_mlo_for_detrending:
+            reference_filters = self.fit_detrending_reference(self.opts.detrending_station)
+
         for station in self.stations_to_analyze:
             _logger.info("Station %s of %s: %s", counter['current'], num_stations[0], station)
-            obs_collection = obspack_surface_collection_module.Collection(verbose=self.verbose)
-            obs_collection.preprocess(datadir=self.opts.ref_data, station_name=station)
-            ds_obs = obs_collection.stepA_original_datasets[station]
-            _logger.info('  %s', obs_collection.station_dict.get(station))
-
             # Apply time bounds, and get the relevant model output.
             try:
-                if self.compare_against_model:
-                    ds_obs, da_mdl = make_comparable(ds_obs, self.ds_mdl,
-                                                     time_limits=(
-                                                     np.datetime64(self.opts.start_yr), np.datetime64(self.opts.end_yr)),
-                                                     latlon=(
-                                                     ds_obs['latitude'].values[0], ds_obs['longitude'].values[0]),
-                                                     altitude=ds_obs['altitude'].values[0], altitude_method='lowest',
-                                                     global_mean=self.opts.globalmean, verbose=self.verbose)
-                else:
-                    ds_obs, _, _, _, _ = apply_time_bounds(ds_obs, time_limits=(np.datetime64(self.opts.start_yr),
-                                                                          np.datetime64(self.opts.end_yr)))
-                    da_mdl = None
+                obs_collection, ds_obs, da_mdl = self.load_station(station)
             except (RuntimeError, AssertionError) as re:
                 update_for_skipped_station(re, station, num_stations, counter)
                 continue
             #
             if how == 'seasonal':
                 try:
-                    ref_dt, ref_vals, mdl_dt, mdl_vals = get_seasonal_by_curve_fitting(self.compare_against_model,
-                                                                                       da_mdl, ds_obs,
-                                                                                       self.opts, station)
+                    if reference_filters:
+                        ref_dt, ref_vals, mdl_dt, mdl_vals = get_seasonal_by_reference_detrending(
+                            self.compare_against_model, da_mdl, ds_obs, reference_filters, station)
+                    else:
+                        ref_dt, ref_vals, mdl_dt, mdl_vals = get_seasonal_by_curve_fitting(self.compare_against_model,
+                                                                                           da_mdl, ds_obs,
+                                                                                           self.opts, station)
                 except RuntimeError as re:
                     update_for_skipped_station(re, station, num_stations, counter)
                     continue
@@ -141,7 +136,8 @@ class Confrontation:
             # --- Optional binning by latitude ---
             if self.opts.latitude_bin_size:
                 concatenated_dfs, df_station_metadata = bin_by_latitude(self.compare_against_model, concatenated_dfs,
-                                                                       df_station_metadata, self.opts.latitude_bin_size)
+                                                                       df_station_metadata, self.opts.latitude_bin_size,
+                                                                       self.opts.longitude_bin_size)
 
         # --- FORMAT DATA FOR OUTPUT ---
 
@@ -249,6 +245,80 @@ class Confrontation:
                xdata_gv, xdata_mdl, ydata_gv, ydata_mdl, \
                rmse_y_true, rmse_y_pred
 
+    def load_station(self, station: str, time_limits: tuple = None) -> tuple:
+        """Load the observations at a station, and the model output at the same location, within the time bounds.
+
+        Parameters
+        ----------
+        station : str
+        time_limits : tuple, default None
+            the (start, end) times as numpy.datetime64. Default is the start_yr and end_yr of the options.
+
+        Raises
+        ------
+        RuntimeError, AssertionError
+            if the data cannot be made comparable
+
+        Returns
+        -------
+        tuple
+            the observation collection, the observation Dataset, and the model DataArray (None without a model)
+        """
+        obs_collection = obspack_surface_collection_module.Collection(verbose=self.verbose)
+        obs_collection.preprocess(datadir=self.opts.ref_data, station_name=station, store_path=self.opts.gvplus_store,
+                                  row_filter=qcflag_filter(self.opts.qcflags) if self.opts.qcflags else None,
+                                  max_workers=self.opts.max_workers)
+        ds_obs = obs_collection.stepA_original_datasets[station]
+        _logger.info('  %s', obs_collection.station_dict.get(station))
+
+        if time_limits is None:
+            time_limits = (np.datetime64(self.opts.start_yr), np.datetime64(self.opts.end_yr))
+        if self.compare_against_model:
+            ds_obs, da_mdl = make_comparable(ds_obs, self.ds_mdl,
+                                             time_limits=time_limits,
+                                             latlon=(
+                                             ds_obs['latitude'].values[0], ds_obs['longitude'].values[0]),
+                                             altitude=ds_obs['altitude'].values[0], altitude_method='lowest',
+                                             global_mean=self.opts.globalmean, verbose=self.verbose)
+        else:
+            ds_obs, _, _, _, _ = apply_time_bounds(ds_obs, time_limits=time_limits)
+            da_mdl = None
+
+        return obs_collection, ds_obs, da_mdl
+
+    def fit_detrending_reference(self, station: str = 'mlo') -> dict:
+        """Fit the curve to the reference station record once, for detrending all stations.
+
+        Parameters
+        ----------
+        station : str, default 'mlo'
+
+        Raises
+        ------
+        RuntimeError
+            if the reference station data cannot be loaded or fit
+
+        Returns
+        -------
+        dict
+            with a ccgFilter for the observations ('ref'), and if comparing against a model,
+            for the model output at the reference station ('mdl')
+        """
+        _logger.info('*Fitting the detrending reference station <%s>*', station)
+        try:
+            _, ds_obs, da_mdl = self.load_station(station)
+        except (RuntimeError, AssertionError) as re:
+            raise RuntimeError('detrending reference station <%s> could not be loaded: %s' % (station, re))
+
+        reference_filters = {'ref': ccgFilter(xp=ds_obs['time_decimal'].values, yp=ds_obs['co2'].values,
+                                              numpolyterms=3, numharmonics=4,
+                                              timezero=int(ds_obs['time_decimal'].values[0]))}
+        if self.compare_against_model:
+            reference_filters['mdl'] = ccgFilter(xp=da_mdl['time_decimal'].values, yp=da_mdl.values,
+                                                 numpolyterms=3, numharmonics=4,
+                                                 timezero=int(da_mdl['time_decimal'].values[0]))
+        return reference_filters
+
     def concatenate_stations_and_months(self, data_dict, processed_station_metadata) -> (dict, pd.DataFrame):
         """
 
@@ -417,9 +487,7 @@ def mutual_time_bounds(com: xr.Dataset, ref: xr.Dataset, time_limits) -> (xr.Dat
                                                                                                            new_limits)
     # decimal years are added as a coordinate if not already there.
     if not ('time_decimal' in ds_com.coords):
-        ds_com = ds_com.assign_coords(time_decimal=('time',
-                                                    [decimalDateFromDatetime(x) for x in
-                                                     pd.DatetimeIndex(ds_com['time'].values)]))
+        ds_com = ds_com.assign_coords(time_decimal=('time', decimalDateFromDatetime64(ds_com['time'].values)))
     _logger.info('  -- time>=%s  &  time<=%s', time_limits[0], time_limits[1])
     return ds_com, ds_ref
 
@@ -607,8 +675,7 @@ def load_cmip_model_output(model_name: str,
                                                   load_method=cmip_load_method, skip_selections=True,
                                                   pickle_file=None)
         ds_mdl = new_self.stepB_preprocessed_datasets[model_name]
-        ds_mdl = ds_mdl.assign_coords(time_decimal=('time', [decimalDateFromDatetime(x)
-                                                             for x in pd.DatetimeIndex(ds_mdl['time'].values)]))
+        ds_mdl = ds_mdl.assign_coords(time_decimal=('time', decimalDateFromDatetime64(ds_mdl['time'].values)))
     else:
         ds_mdl = None
     return compare_against_model, ds_mdl
@@ -617,7 +684,8 @@ def load_cmip_model_output(model_name: str,
 def bin_by_latitude(compare_against_model: bool,
                     data_dict: dict,
                     df_metadata: pd.DataFrame,
-                    latitude_bin_size: int
+                    latitude_bin_size: float,
+                    longitude_bin_size: float = None
                     ) -> tuple:
     """
 
@@ -627,7 +695,9 @@ def bin_by_latitude(compare_against_model: bool,
     data_dict : dict
         each key contains a list of Dataframes
     df_metadata : pandas.Dataframe
-    latitude_bin_size : int
+    latitude_bin_size : float
+    longitude_bin_size : float, default None
+        if given, stations are binned by both latitude and longitude
 
     Returns
     -------
@@ -635,15 +705,14 @@ def bin_by_latitude(compare_against_model: bool,
     pandas.Dataframe
     """
     # We determine bins to which each station is assigned.
-    def to_bin(x):
-        return np.floor(x / latitude_bin_size) * latitude_bin_size
-
-    df_metadata["latbin"] = df_metadata['lat'].map(to_bin)
-    df_metadata["lonbin"] = df_metadata['lon'].map(to_bin)
+    df_metadata["latbin"] = np.floor(df_metadata['lat'] / latitude_bin_size) * latitude_bin_size
+    lon_size = longitude_bin_size if longitude_bin_size else latitude_bin_size
+    df_metadata["lonbin"] = np.floor(df_metadata['lon'] / lon_size) * lon_size
     #
-    data_dict['ref'] = calc_binned_means(data_dict['ref'], df_metadata)
+    bin_columns = ('latbin', 'lonbin') if longitude_bin_size else ('latbin',)
+    data_dict['ref'] = calc_binned_means(data_dict['ref'], df_metadata, bin_columns)
     if compare_against_model:
-        data_dict['mdl'] = calc_binned_means(data_dict['mdl'], df_metadata)
+        data_dict['mdl'] = calc_binned_means(data_dict['mdl'], df_metadata, bin_columns)
 
     return data_dict, df_metadata
 
@@ -716,41 +785,290 @@ def get_seasonal_by_curve_fitting(compare_against_model: bool,
     return ref_dt, ref_vals, mdl_dt, mdl_vals
 
 
+def get_seasonal_by_reference_detrending(compare_against_model: bool,
+                                         da_mdl, ds_obs,
+                                         reference_filters: dict, station: str):
+    """Calculate the seasonal cycle by removing the trend of a reference record that was fit once.
+
+    The trend of the reference station (from Confrontation.fit_detrending_reference) is interpolated to the
+    times of this station and subtracted. The detrended values are averaged by month, and the
+    annual mean offset from the reference is removed. No curve is fit to this station's data.
+
+    Parameters
+    ----------
+    compare_against_model : bool
+    da_mdl : xarray.DataArray
+    ds_obs : xarray.Dataset
+    reference_filters : dict
+        with a ccgFilter for the observations ('ref'), and for the model ('mdl') if comparing against a model
+    station : str
+
+    Raises
+    ------
+    RuntimeError
+
+    Returns
+    -------
+    tuple
+    """
+    # Check that there is at least one year's worth of data for this station.
+    if (ds_obs.time.values.max().astype('datetime64[M]') - ds_obs.time.values.min().astype('datetime64[M]')) < 12:
+        raise RuntimeError('  insufficient number of months of data for station <%s>' % station)
+
+    def detrended_cycle(filt, x, y):
+        detrended = y - filt.getTrendValue(x)
+        okay = np.isfinite(detrended)
+        if not okay.any():
+            raise RuntimeError('  no data within the detrending reference record for station <%s>' % station)
+        month_dt, vals = make_cycle(x0=x[okay], smooth_cycle=detrended[okay])
+        return month_dt, vals - vals.mean()
+
+    #   (i) Globalview+ data
+    ref_dt, ref_vals = detrended_cycle(reference_filters['ref'], ds_obs['time_decimal'].values, ds_obs['co2'].values)
+    #   (ii) CMIP data
+    mdl_dt, mdl_vals = None, None
+    if compare_against_model:
+        mdl_dt, mdl_vals = detrended_cycle(reference_filters['mdl'], da_mdl['time_decimal'].values, da_mdl.values)
+
+    return ref_dt, ref_vals, mdl_dt, mdl_vals
+
+
+def get_seasonal_maps_by_curve_fitting(da: xr.DataArray,
+                                       chunk_size: int = 1000,
+                                       numpolyterms: int = 3,
+                                       numharmonics: int = 4
+                                       ) -> xr.Dataset:
+    """Decompose the time series at every grid cell with the curve fitting, and summarize the seasonal cycle.
+
+    Grid cells are fit together in batches of at most chunk_size cells (see ccgFilterBatch),
+    as dask chunks, so that memory use depends on the chunk size and not on the size of the grid.
+    Cells with any missing values (e.g., pressure levels below the surface) are given NaN.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        with a 'time' dimension, and any other dimensions (e.g., member_id, plev, lat, lon)
+    chunk_size : int, default 1000
+        maximum number of grid cells fit together in each batch
+    numpolyterms : int, default 3
+    numharmonics : int, default 4
+
+    Returns
+    -------
+    xarray.Dataset
+        (lazy, if dask is used) with the following variables on the non-time dimensions of da:
+            seasonal_amplitude : peak-to-trough amplitude of the mean smoothed, detrended seasonal cycle
+            upward_crossing_doy : mean day of year when the seasonal cycle crosses the trend going up
+            downward_crossing_doy : mean day of year when the seasonal cycle crosses the trend going down
+            growth_rate : mean growth rate of the trend (units per year)
+    """
+    if 'time_decimal' in da.coords:
+        x = da['time_decimal'].values
+    else:
+        x = decimalDateFromDatetime64(da['time'].values)
+
+    # Chunks are filled from the last dimension backwards, with the time dimension kept whole.
+    chunks = {'time': -1}
+    remaining = chunk_size
+    for dim in reversed([d for d in da.dims if d != 'time']):
+        chunks[dim] = max(1, min(da.sizes[dim], remaining))
+        remaining = max(1, remaining // chunks[dim])
+    da = da.chunk(chunks)
+
+    names = ['seasonal_amplitude', 'upward_crossing_doy', 'downward_crossing_doy', 'growth_rate']
+    results = xr.apply_ufunc(_seasonal_metrics_for_block, da,
+                             kwargs=dict(x=x, numpolyterms=numpolyterms, numharmonics=numharmonics),
+                             input_core_dims=[['time']], output_core_dims=[[] for _ in names],
+                             dask='parallelized', output_dtypes=[float for _ in names])
+
+    ds = xr.Dataset(dict(zip(names, results)))
+    units = da.attrs.get('units', '')
+    ds['seasonal_amplitude'].attrs.update(units=units, long_name='amplitude of mean seasonal cycle')
+    ds['upward_crossing_doy'].attrs.update(units='day of year', long_name='upward trend crossing date')
+    ds['downward_crossing_doy'].attrs.update(units='day of year', long_name='downward trend crossing date')
+    ds['growth_rate'].attrs.update(units=f'{units} per year'.strip(), long_name='mean growth rate of trend')
+    ds.attrs.update(numpolyterms=numpolyterms, numharmonics=numharmonics,
+                    start_time=float(x.min()), end_time=float(x.max()))
+    return ds
+
+
+def _seasonal_metrics_for_block(y: np.ndarray, x: np.ndarray,
+                                numpolyterms: int, numharmonics: int) -> tuple:
+    """Curve fit every series in a block (time is the last axis) and summarize the seasonal cycles.
+
+    Returns
+    -------
+    tuple
+        seasonal amplitude, upward and downward trend crossing day of year, and growth rate,
+        each with the shape of the block without the time axis.
+    """
+    shape = y.shape[:-1]
+    y = y.reshape(-1, y.shape[-1])
+    metrics = np.full((4, y.shape[0]), np.nan)
+
+    valid = np.all(np.isfinite(y), axis=1)
+    if valid.any():
+        filt = ccgFilterBatch(x, y[valid], numpolyterms=numpolyterms, numharmonics=numharmonics)
+        cycle = filt.getSmoothCycle()
+
+        # Mean seasonal cycle, from the monthly means of the smoothed detrended cycle
+        month = calendarDateArray(filt.xinterp)[1] - 1
+        counts = np.bincount(month, minlength=12)
+        onehot = np.zeros((month.size, 12))
+        onehot[np.arange(month.size), month] = 1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            monthly = np.dot(cycle, onehot) / counts
+        monthly = monthly[:, counts > 0]
+        metrics[0, valid] = monthly.max(axis=1) - monthly.min(axis=1)
+
+        # Trend crossing dates, found the same way as ccgFilter.getTrendCrossingDates(),
+        # averaged as angles around the year so that dates near new year are handled.
+        prev, curr = cycle[:, :-1], cycle[:, 1:]
+        angle = 2 * np.pi * (filt.xinterp[1:] % 1)
+        for i, crossing in ((1, (prev < 0.0) & (curr >= 0.0)), (2, (prev > 0.0) & (curr <= 0.0))):
+            mean_angle = np.arctan2(np.dot(crossing, np.sin(angle)), np.dot(crossing, np.cos(angle)))
+            doy = (mean_angle / (2 * np.pi) % 1) * 365
+            metrics[i, valid] = np.where(crossing.any(axis=1), doy, np.nan)
+
+        metrics[3, valid] = filt.deriv.mean(axis=1)
+
+    return tuple(m.reshape(shape) for m in metrics)
+
+
+def get_seasonal_metrics_for_sweep(series: dict,
+                                   year_windows: list,
+                                   numharmonics: list,
+                                   cutoffs: list
+                                   ) -> pd.DataFrame:
+    """Calculate seasonal cycle metrics for every combination of curve fitting parameters.
+
+    The data are loaded once and only subset in time for each window.
+    For each series and window, the function is fit once for each number of harmonics,
+    and the residuals are then filtered again for each pair of cutoffs (see ccgFilter.refilter()).
+
+    Parameters
+    ----------
+    series : dict
+        station name -> {'obs': (decimal times, values), 'mdl': (decimal times, values) or None}
+    year_windows : list
+        (start year, end year) pairs, with the same meaning as start_yr and end_yr
+    numharmonics : list
+        numbers of harmonics
+    cutoffs : list
+        (shortterm, longterm) pairs of filter cutoffs in days
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row for each station, source, window, number of harmonics and cutoff pair, with the
+        amplitude, month of the maximum and minimum of the mean monthly cycle, the mean growth rate,
+        and for the model, the root mean square difference from the observed monthly cycle.
+    """
+    rows = []
+    for station, data in series.items():
+        for start_yr, end_yr in year_windows:
+            t1, t2 = decimalDateFromDatetime64(np.array([np.datetime64(str(start_yr)), np.datetime64(str(end_yr))]))
+            windowed = {}
+            for source, xy in data.items():
+                if xy is None:
+                    continue
+                x, y = xy
+                keep = (x >= t1) & (x <= t2) & np.isfinite(y)
+                # Check that there is at least one year's worth of data.
+                if np.count_nonzero(keep) > 1 and (x[keep][-1] - x[keep][0]) >= 11 / 12:
+                    windowed[source] = (x[keep], y[keep])
+            if 'obs' not in windowed:
+                _logger.info('  skipping station <%s> for %s-%s: insufficient number of months of data',
+                             station, start_yr, end_yr)
+                continue
+
+            for nh in numharmonics:
+                results = {}
+                for source, (x, y) in windowed.items():
+                    filt = ccgFilter(xp=x, yp=y, shortterm=cutoffs[0][0], longterm=cutoffs[0][1],
+                                     numpolyterms=3, numharmonics=nh, timezero=int(x[0]))
+                    # These do not depend on the cutoffs.
+                    month = calendarDateArray(filt.xinterp)[1] - 1
+                    counts = np.bincount(month, minlength=12)
+                    harmonic = filt.getHarmonicValue(filt.xinterp)
+                    for shortterm, longterm in cutoffs:
+                        if (filt.shortterm, filt.longterm) != (shortterm, longterm):
+                            filt.refilter(shortterm, longterm)
+                        with np.errstate(invalid='ignore', divide='ignore'):
+                            cycle = np.bincount(month, weights=harmonic + filt.smooth - filt.trend,
+                                                minlength=12) / counts
+                        results[(source, shortterm, longterm)] = (cycle, np.mean(filt.deriv))
+
+                for (source, shortterm, longterm), (cycle, growth_rate) in results.items():
+                    # Model cycles are compared against the observed cycle with the same parameters.
+                    rmse = np.nan
+                    if source != 'obs':
+                        diff = cycle - results[('obs', shortterm, longterm)][0]
+                        rmse = np.sqrt(np.nanmean(diff * diff))
+                    rows.append({'station': station, 'source': source,
+                                 'start_yr': start_yr, 'end_yr': end_yr,
+                                 'numharmonics': nh, 'shortterm': shortterm, 'longterm': longterm,
+                                 'amplitude': np.nanmax(cycle) - np.nanmin(cycle),
+                                 'max_month': np.nanargmax(cycle) + 1,
+                                 'min_month': np.nanargmin(cycle) + 1,
+                                 'growth_rate': growth_rate,
+                                 'rmse': rmse})
+
+    return pd.DataFrame(rows, columns=['station', 'source', 'start_yr', 'end_yr', 'numharmonics',
+                                       'shortterm', 'longterm', 'amplitude', 'max_month', 'min_month',
+                                       'growth_rate', 'rmse'])
+
+
 def calc_binned_means(df_cycles_for_all_stations_ref: pd.DataFrame,
-                      df_station_metadata: pd.DataFrame
+                      df_station_metadata: pd.DataFrame,
+                      bin_columns: tuple = ('latbin',)
                       ) -> pd.DataFrame:
     """Calculate means for each bin
 
-    Note, this function expects a DataFrame column titled "latbin" designating bin assignments.
+    Note, this function expects DataFrame column(s) titled "latbin" (and "lonbin") designating bin assignments.
+    Each station is given an integer bin code, and the means of the month x station array are computed
+    for all bins at once. Missing values are left out of the means.
 
     Parameters
     ----------
     df_cycles_for_all_stations_ref : pandas.Dataframe
+        a 'month' column, and one column of values for each station code
     df_station_metadata : pandas.Dataframe
+    bin_columns : tuple, default ('latbin',)
+        metadata columns that define the bins
 
     Returns
     -------
     pandas.Dataframe
+        a 'month' column, and one column for each bin, in ascending order. Bins of more than one
+        column are labeled with their values separated by commas, e.g. '30, -120'.
     """
-    # Add the coordinates and binning information to the dataframe with seasonal cycle values
-    new_df = df_cycles_for_all_stations_ref.transpose()
-    new_df.columns = new_df.loc['month']  # .map(lambda x: x.strftime('%m'))
-    new_df = (new_df
-              .drop(labels='month', axis=0, inplace=False)
-              .apply(pd.to_numeric, axis=0)
-              .reset_index()
-              .rename(columns={'index': 'code'})
-              .merge(df_station_metadata.loc[:, ['code', 'fullname', 'lat', 'latbin']], on='code'))
-
-    # Take the means of each latitude bin and transpose dataframe
-    groups = new_df.groupby(["latbin"], as_index=False)
-    binned_df = (groups.mean()
-                 .drop('lat', axis=1)
-                 .sort_values(by='latbin', ascending=True)
-                 .set_index('latbin')
-                 .transpose()
-                 .reset_index()
-                 .rename(columns={'index': 'month'}))
+    codes = df_cycles_for_all_stations_ref.columns[df_cycles_for_all_stations_ref.columns != 'month']
+    station_bins = (df_station_metadata
+                    .drop_duplicates(subset='code')
+                    .set_index('code')
+                    .loc[codes, list(bin_columns)]
+                    .to_numpy(dtype=float))
+    bin_values, bin_code = np.unique(station_bins, axis=0, return_inverse=True)
+    bin_code = bin_code.ravel()
+
+    # Sum the values and count the non-missing values of each month and bin
+    values = df_cycles_for_all_stations_ref[codes].to_numpy(dtype=float)
+    okay = np.isfinite(values)
+    num_months, num_bins = values.shape[0], bin_values.shape[0]
+    group = (np.arange(num_months)[:, None] * num_bins + bin_code).ravel()
+    sums = np.bincount(group, weights=np.where(okay, values, 0).ravel(), minlength=num_months * num_bins)
+    counts = np.bincount(group, weights=okay.ravel(), minlength=num_months * num_bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (sums / counts).reshape(num_months, num_bins)
+
+    if len(bin_columns) == 1:
+        labels = bin_values[:, 0]
+    else:
+        labels = [', '.join(f'{v:g}' for v in row) for row in bin_values]
+    binned_df = pd.DataFrame(means, columns=labels)
+    binned_df.insert(0, 'month', df_cycles_for_all_stations_ref['month'].values)
+    binned_df.columns.name = bin_columns[0] if len(bin_columns) == 1 else 'bin'
     return binned_df
 
 
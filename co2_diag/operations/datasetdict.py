@@ -1,5 +1,6 @@
 import xarray as xr
 from dask.diagnostics import ProgressBar
+from collections import OrderedDict
 import pickle, logging
 
 _datasetdict_logger = logging.getLogger("{0}.{1}".format(__name__, "loader"))
@@ -184,3 +185,111 @@ class DatasetDict(dict):
                 self[k] = v
         else:
             return le_datasets
+
+
+class _NotLoaded:
+    """Placeholder for the value of a LazyDatasetDict key that has not been loaded yet."""
+    def __repr__(self):
+        return '<not loaded>'
+
+
+_NOT_LOADED = _NotLoaded()
+
+
+class LazyDatasetDict(DatasetDict):
+    """A DatasetDict whose keys are known up front, but whose Datasets are loaded only when first accessed.
+
+    Each key has a loader function (with no arguments) that returns its Dataset.
+    With maxsize, at most that many loaded Datasets are kept; the least recently used one is dropped
+    (to be loaded again if needed). Datasets that are assigned directly, e.g. by an inplace operation,
+    are never dropped.
+
+    Example
+    -------
+    dsd = LazyDatasetDict({'mlo': lambda: load_station('mlo'),
+                           'brw': lambda: load_station('brw')}, maxsize=1)
+    dsd['mlo']  # only now is the 'mlo' Dataset loaded
+    """
+    def __init__(self, loaders: dict = None, maxsize: int = None):
+        """
+        Parameters
+        ----------
+        loaders : dict
+            keys, and for each key a function that returns its Dataset
+        maxsize : int, default None
+            maximum number of loaded Datasets to keep. Default is no limit.
+        """
+        loaders = dict(loaders) if loaders else {}
+        super(LazyDatasetDict, self).__init__({k: _NOT_LOADED for k in loaders})
+        self._loaders = loaders
+        self.maxsize = maxsize
+        self._recently_used = OrderedDict()
+
+    def is_loaded(self, key) -> bool:
+        return dict.__getitem__(self, key) is not _NOT_LOADED
+
+    def __getitem__(self, key) -> xr.Dataset:
+        value = dict.__getitem__(self, key)
+        if key in self._loaders:
+            if value is _NOT_LOADED:
+                _datasetdict_logger.debug("Loading <%s> on first access.", key)
+                value = self._loaders[key]()
+                dict.__setitem__(self, key, value)
+            self._recently_used[key] = None
+            self._recently_used.move_to_end(key)
+            self._evict()
+        return value
+
+    def _evict(self) -> None:
+        """Unload the least recently used Datasets that are beyond maxsize."""
+        if self.maxsize is None:
+            return
+        while len(self._recently_used) > self.maxsize:
+            key, _ = self._recently_used.popitem(last=False)
+            _datasetdict_logger.debug("Unloading <%s>, the least recently used.", key)
+            dict.__setitem__(self, key, _NOT_LOADED)
+
+    def __setitem__(self, key, value) -> None:
+        # A directly assigned Dataset can't be reloaded, so it is no longer managed lazily.
+        self._loaders.pop(key, None)
+        self._recently_used.pop(key, None)
+        super(LazyDatasetDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key) -> None:
+        self._loaders.pop(key, None)
+        self._recently_used.pop(key, None)
+        super(LazyDatasetDict, self).__delitem__(key)
+
+    def update(self, *args, **kwargs) -> None:
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = self[key]
+        del self[key]
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        return (self[k] for k in list(self.keys()))
+
+    def items(self):
+        return ((k, self[k]) for k in list(self.keys()))
+
+    def copy(self) -> 'DatasetDict':
+        """Generate a new (not lazy) DatasetDict with each dataset loaded and copied"""
+        new_datasetdict = DatasetDict()
+        for k, v in self.items():
+            new_datasetdict[k] = v.copy(deep=True)
+        return new_datasetdict
+
+    def __reduce__(self):
+        # Loader functions can't always be pickled, so a plain DatasetDict of all of the Datasets is pickled instead.
+        return DatasetDict, (dict(self.items()),)
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, dict.__repr__(self))
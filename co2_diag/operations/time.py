@@ -145,6 +145,81 @@ def select_between(dataset: xr.Dataset,
     return ds_sub.where(tempmask, drop=drop)
 
 
+def select_between_arrays(time: np.ndarray,
+                          values: np.ndarray,
+                          timestart,
+                          timeend) -> tuple:
+    """Select the values between two times (inclusive), keeping the first value of any duplicate time
+
+    This is the array counterpart of select_between(..., drop_dups=True), which uses binary search
+    on the sorted times instead of copying and masking a Dataset.
+
+    Parameters
+    ----------
+    time : numpy.ndarray
+        of type datetime64. If it is not sorted, it is sorted first (stably).
+    values : numpy.ndarray
+        of the same length as time
+    timestart : numpy.datetime64
+    timeend : numpy.datetime64
+
+    Returns
+    -------
+    A 2-tuple of numpy.ndarrays: the sorted unique times, and their values
+    """
+    time = np.asarray(time)
+    values = np.asarray(values)
+    if (time.size > 1) and (time[1:] < time[:-1]).any():
+        order = np.argsort(time, kind='stable')
+        time, values = time[order], values[order]
+
+    start = np.searchsorted(time, np.datetime64(timestart), side='left')
+    stop = np.searchsorted(time, np.datetime64(timeend), side='right')
+    time, values = time[start:stop], values[start:stop]
+
+    if time.size > 1:
+        first_of_each_time = np.concatenate(([True], time[1:] != time[:-1]))
+        if not first_of_each_time.all():
+            time, values = time[first_of_each_time], values[first_of_each_time]
+    return time, values
+
+
+def monthly_means_and_counts(time: np.ndarray,
+                             values: np.ndarray) -> tuple:
+    """Compute the mean and number of valid (non-NaN) values of each calendar month
+
+    The months are found from integer month codes of the sorted times, and the means from grouped sums,
+    as with xarray's resample(time="1MS").mean(), but without intermediate copies of the data.
+
+    Parameters
+    ----------
+    time : numpy.ndarray
+        of type datetime64, sorted
+    values : numpy.ndarray
+        of the same length as time
+
+    Returns
+    -------
+    A 3-tuple of numpy.ndarrays, for each month that has valid values:
+        the first day of the month (datetime64[ns]), the mean, and the number of values
+    """
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return np.array([], dtype='datetime64[ns]'), np.array([]), np.array([], dtype=int)
+
+    month_code = np.asarray(time).astype('datetime64[M]').astype(np.int64)
+    month_index = month_code - month_code[0]
+    n_months = month_index[-1] + 1
+
+    valid = ~np.isnan(values)
+    counts = np.bincount(month_index, weights=valid, minlength=n_months).astype(int)
+    sums = np.bincount(month_index, weights=np.where(valid, values, 0), minlength=n_months)
+
+    has_values = counts > 0
+    month_start = (month_code[0] + np.flatnonzero(has_values)).astype('datetime64[M]').astype('datetime64[ns]')
+    return month_start, sums[has_values] / counts[has_values], counts[has_values]
+
+
 def monthlist(dates) -> list:
     """Generate a list of months between two dates
 
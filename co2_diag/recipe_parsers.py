@@ -31,6 +31,24 @@ def add_shared_arguments_for_recipes(parser: argparse.ArgumentParser) -> None:
                         type=valid_writable_path, help='Filepath for saving generated figures')
 
 
+def add_obspack_arguments_for_recipes(parser: argparse.ArgumentParser) -> None:
+    """Add arguments for loading Globalview+ observations to a parser object
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+    """
+    parser.add_argument('--gvplus_store', default=None, type=valid_writable_path,
+                        help='Directory of a consolidated Globalview+ station store (see the "store" subcommand). '
+                             'If given, stations are read from the store, which is updated when source files change.')
+    parser.add_argument('--qcflags', nargs='+', default=None,
+                        help="keep only the observations with one of these QC flag values, e.g. '...'. "
+                             "Default is to keep every observation.")
+    parser.add_argument('--max_workers', default=1, type=int,
+                        help='maximum number of Globalview+ files opened at the same time, by worker processes. '
+                             'Default is 1.')
+
+
 def parse_recipe_options(options: Union[dict, argparse.Namespace],
                          recipe_specific_argument_adder: Callable[[argparse.ArgumentParser], None]
                          ) -> argparse.Namespace:
@@ -81,6 +99,7 @@ def add_surface_trends_args_to_parser(parser: argparse.ArgumentParser) -> None:
     parser : argparse.ArgumentParser
     """
     add_shared_arguments_for_recipes(parser)
+    add_obspack_arguments_for_recipes(parser)
     parser.add_argument('--model_name', default='CMIP.NOAA-GFDL.GFDL-ESM4.esm-hist.Amon.gr1',
                         type=matched_model_and_experiment, choices=cmip_model_choices)
     parser.add_argument('--cmip_load_method', default='pangeo',
@@ -98,17 +117,30 @@ def add_seasonal_cycle_args_to_parser(parser: argparse.ArgumentParser) -> None:
     parser : argparse.ArgumentParser
     """
     add_shared_arguments_for_recipes(parser)
+    add_obspack_arguments_for_recipes(parser)
     parser.add_argument('--model_name', default='',
                         type=matched_model_and_experiment, choices=cmip_model_choices)
     parser.add_argument('--cmip_load_method', default='pangeo',
                         type=str, choices=['pangeo', 'local'])
     parser.add_argument('--difference', action='store_true')
     parser.add_argument('--latitude_bin_size', default=None, type=float)
+    parser.add_argument('--longitude_bin_size', default=None, type=float,
+                        help='with --latitude_bin_size, bin stations by both latitude and longitude.')
     parser.add_argument('--plot_filter_components', action='store_true')
     parser.add_argument('--globalmean', action='store_true')
-    parser.add_argument('--use_mlo_for_detrending', action='store_true')
+    parser.add_argument('--use_mlo_for_detrending', action='store_true',
+                        help='detrend every station with the trend of one reference record (see --detrending_station), '
+                             'which is fit once, instead of fitting each station separately.')
+    parser.add_argument('--detrending_station', default='mlo', type=valid_surface_stations,
+                        help="reference station for --use_mlo_for_detrending. Default is 'mlo'.")
     parser.add_argument('--run_all_stations', action='store_true')
     parser.add_argument('--station_list', nargs='*', type=valid_surface_stations, default=['mlo'])
+    parser.add_argument('--region_name', default=None, type=str,
+                        help="analyze the stations inside a region of the config file, e.g., 'Boreal North America', "
+                             "instead of the station_list.")
+    parser.add_argument('--bbox', nargs=4, type=float, default=None,
+                        metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'),
+                        help='analyze the stations inside this latitude-longitude box, instead of the station_list.')
 
 
 def add_meridional_args_to_parser(parser: argparse.ArgumentParser) -> None:
@@ -119,17 +151,101 @@ def add_meridional_args_to_parser(parser: argparse.ArgumentParser) -> None:
     parser : argparse.ArgumentParser
     """
     add_shared_arguments_for_recipes(parser)
+    add_obspack_arguments_for_recipes(parser)
     parser.add_argument('--model_name', default='',
                         type=matched_model_and_experiment, choices=cmip_model_choices)
     parser.add_argument('--cmip_load_method', default='pangeo',
                         type=str, choices=['pangeo', 'local'])
     parser.add_argument('--difference', action='store_true')
     parser.add_argument('--latitude_bin_size', default=None, type=float)
+    parser.add_argument('--longitude_bin_size', default=None, type=float,
+                        help='with --latitude_bin_size, bin stations by both latitude and longitude.')
     parser.add_argument('--region_name', default=None, type=str,
-                        help="use the same name as in the config file, e.g., 'Boreal North America'.")
+                        help="analyze the stations inside a region of the config file, e.g., 'Boreal North America', "
+                             "instead of the station_list.")
+    parser.add_argument('--bbox', nargs=4, type=float, default=None,
+                        metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'),
+                        help='analyze the stations inside this latitude-longitude box, instead of the station_list.')
 
     parser.add_argument('--plot_filter_components', action='store_true')
     parser.add_argument('--globalmean', action='store_true')
-    parser.add_argument('--use_mlo_for_detrending', action='store_true')
+    parser.add_argument('--use_mlo_for_detrending', action='store_true',
+                        help='detrend every station with the trend of one reference record (see --detrending_station), '
+                             'which is fit once, instead of fitting each station separately.')
+    parser.add_argument('--detrending_station', default='mlo', type=valid_surface_stations,
+                        help="reference station for --use_mlo_for_detrending. Default is 'mlo'.")
     parser.add_argument('--run_all_stations', action='store_true')
     parser.add_argument('--station_list', nargs='*', type=valid_surface_stations, default=['mlo'])
+
+
+def add_seasonal_maps_args_to_parser(parser: argparse.ArgumentParser) -> None:
+    """Add recipe arguments to a parser object
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+    """
+    add_shared_arguments_for_recipes(parser)
+    parser.add_argument('--model_name', default='CMIP.NOAA-GFDL.GFDL-ESM4.esm-hist.Amon.gr1',
+                        type=matched_model_and_experiment, choices=cmip_model_choices)
+    parser.add_argument('--cmip_load_method', default='pangeo',
+                        type=str, choices=['pangeo', 'local'])
+    parser.add_argument('--plev', nargs='*', type=int, default=None,
+                        help='pressure levels (Pa) to include. Default is all levels.')
+    parser.add_argument('--chunk_size', default=1000, type=int,
+                        help='maximum number of grid cells that are curve fit together in each batch.')
+    parser.add_argument('--netcdf_savepath', default=None, type=valid_writable_path,
+                        help='Filepath for the NetCDF map product. Default is next to the figure_savepath.')
+
+
+def add_seasonal_sweep_args_to_parser(parser: argparse.ArgumentParser) -> None:
+    """Add recipe arguments to a parser object
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+    """
+    add_shared_arguments_for_recipes(parser)
+    add_obspack_arguments_for_recipes(parser)
+    parser.add_argument('--model_name', default='',
+                        type=matched_model_and_experiment, choices=cmip_model_choices)
+    parser.add_argument('--cmip_load_method', default='pangeo',
+                        type=str, choices=['pangeo', 'local'])
+    parser.add_argument('--globalmean', action='store_true')
+    parser.add_argument('--run_all_stations', action='store_true')
+    parser.add_argument('--station_list', nargs='*', type=valid_surface_stations, default=['mlo'])
+    parser.add_argument('--region_name', default=None, type=str,
+                        help="analyze the stations inside a region of the config file, e.g., 'Boreal North America', "
+                             "instead of the station_list.")
+    parser.add_argument('--bbox', nargs=4, type=float, default=None,
+                        metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'),
+                        help='analyze the stations inside this latitude-longitude box, instead of the station_list.')
+    parser.add_argument('--shortterm', nargs='+', type=int, default=[80],
+                        help='short-term filter cutoffs (days) to evaluate. Default is 80.')
+    parser.add_argument('--longterm', nargs='+', type=int, default=[667],
+                        help='long-term filter cutoffs (days) to evaluate. Default is 667.')
+    parser.add_argument('--numharmonics', nargs='+', type=int, default=[4],
+                        help='numbers of harmonics to evaluate. Default is 4.')
+    parser.add_argument('--sweep_start_yr', nargs='+', type=valid_year_string, default=None,
+                        help='initial years of the time windows to evaluate. Default is start_yr.')
+    parser.add_argument('--sweep_end_yr', nargs='+', type=valid_year_string, default=None,
+                        help='final years of the time windows to evaluate. Default is end_yr.')
+
+
+def add_gvplus_store_args_to_parser(parser: argparse.ArgumentParser) -> None:
+    """Add arguments for building a consolidated Globalview+ station store to a parser object
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+    """
+    parser.add_argument('ref_data', nargs='?', default=None, type=valid_existing_path,
+                        help='Filepath to the reference data folder')
+    parser.add_argument('--gvplus_store', default=None, type=valid_writable_path,
+                        help="Directory of the store. "
+                             "Default is a 'gdess_store' folder inside the reference data folder.")
+    parser.add_argument('--station_list', nargs='*', type=valid_surface_stations, default=None,
+                        help='Default is every station with files in the reference data folder.')
+    parser.add_argument('--max_workers', default=1, type=int,
+                        help='maximum number of Globalview+ files opened at the same time, by worker processes. '
+                             'Default is 1.')
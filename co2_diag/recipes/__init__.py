@@ -1,3 +1,5 @@
 from .surface_trends import surface_trends
 from .seasonal_cycles import seasonal_cycles
 from .meridional_gradient import meridional_gradient
+from .seasonal_maps import seasonal_maps
+from .seasonal_sweep import seasonal_sweep
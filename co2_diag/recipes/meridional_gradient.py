@@ -41,6 +41,8 @@ def meridional_gradient(options: Union[dict, argparse.Namespace],
             start_yr : str, default '1960'
             end_yr : str, default '2015'
             latitude_bin_size : numeric, default None
+            longitude_bin_size : numeric, default None
+                if given with latitude_bin_size, stations are binned by both latitude and longitude
             figure_savepath : str, default None
             difference : str, default None
             globalmean : str
@@ -49,6 +51,10 @@ def meridional_gradient(options: Union[dict, argparse.Namespace],
             station_list : str, default 'mlo'
                 a sequence of three letter codes (space-delimited) to specify
                 the desired surface observing station
+            use_mlo_for_detrending : str
+                detrend every station with the trend of a single reference station fit, instead of a fit per station
+            detrending_station : str, default 'mlo'
+                three letter code of the reference station used with use_mlo_for_detrending
     verbose : Union[bool, str]
         can be either True, False, or a string for level such as "INFO, DEBUG, etc."
 
@@ -66,7 +72,8 @@ def meridional_gradient(options: Union[dict, argparse.Namespace],
     _logger.debug("Parsing diagnostic parameters...")
     opts = parse_recipe_options(options, add_meridional_args_to_parser)
 
-    stations_to_analyze = populate_station_list(opts.run_all_stations, opts.station_list)
+    stations_to_analyze = populate_station_list(opts.run_all_stations, opts.station_list,
+                                                region_name=opts.region_name, bbox=opts.bbox, datadir=opts.ref_data)
 
     # --- Load CMIP model output ---
     compare_against_model, ds_mdl = load_cmip_model_output(opts.model_name, opts.cmip_load_method, verbose=verbose)
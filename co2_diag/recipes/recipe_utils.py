@@ -1,24 +1,38 @@
-from co2_diag import load_stations_dict
+from co2_diag import load_stations_dict, load_config_file
+from co2_diag.data_source.observations.station_registry import StationRegistry
 from typing import Union
-import logging
+import os, logging
 
 _logger = logging.getLogger(__name__)
 
 
 def populate_station_list(run_all_stations: bool,
-                          station_list: Union[list, str]) -> list:
+                          station_list: Union[list, str],
+                          region_name: str = None,
+                          bbox: list = None,
+                          datadir: str = None) -> list:
     """The list of stations to analyze is populated.
 
     Parameters
     ----------
     run_all_stations : bool
     station_list : Union[list, str]
+    region_name : str
+        a region of the config file (see station_registry.load_region_bounds()).
+        If given (or a bbox), the stations inside it are analyzed instead of the station_list.
+    bbox : list
+        lat_min, lat_max, lon_min, lon_max
+    datadir : str
+        directory containing the Globalview+ NetCDF files, for the station locations of a region_name or bbox.
+        Default is the 'NOAA_Globalview' source of the config file.
 
     Returns
     -------
     list
     """
-    if run_all_stations:
+    if region_name or bbox:
+        stations_to_analyze = stations_in_region(region_name=region_name, bbox=bbox, datadir=datadir)
+    elif run_all_stations:
         stations_dict = load_stations_dict()
         stations_to_analyze = list(stations_dict.keys())
     elif station_list:
@@ -29,3 +43,37 @@ def populate_station_list(run_all_stations: bool,
     return stations_to_analyze
 
 
+def stations_in_region(region_name: str = None,
+                       bbox: list = None,
+                       datadir: str = None) -> list:
+    """Get the known stations that are inside a named region and/or a bounding box
+
+    Parameters
+    ----------
+    region_name : str
+    bbox : list
+        lat_min, lat_max, lon_min, lon_max
+    datadir : str
+
+    Returns
+    -------
+    list
+    """
+    if not datadir:
+        config = load_config_file()
+        datadir = config.get('NOAA_Globalview', 'source', vars=os.environ)
+    registry = StationRegistry.from_datadir(datadir)
+
+    known_stations = load_stations_dict()
+    selected = [k for k in registry.codes.tolist() if k in known_stations]
+    if region_name:
+        in_region = set(registry.region(region_name))
+        selected = [k for k in selected if k in in_region]
+    if bbox:
+        in_bbox = set(registry.bbox(*bbox))
+        selected = [k for k in selected if k in in_bbox]
+
+    if not selected:
+        raise ValueError(f"No stations found in region <{region_name}> / bbox <{bbox}>")
+    _logger.info('%d stations selected by region: %s', len(selected), selected)
+    return selected
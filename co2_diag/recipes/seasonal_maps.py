@@ -0,0 +1,81 @@
+""" This produces maps of seasonal cycle amplitude, phase and growth rate of atmospheric CO2
+This function parses:
+ - model output from CMIP6
+================================================================================
+"""
+from co2_diag import set_verbose, benchmark_recipe
+from co2_diag.recipe_parsers import parse_recipe_options, add_seasonal_maps_args_to_parser
+from co2_diag.operations.Confrontation import load_cmip_model_output, apply_time_bounds, \
+    get_seasonal_maps_by_curve_fitting
+from co2_diag.formatters import append_before_extension
+from dask.diagnostics import ProgressBar
+from typing import Union
+import numpy as np
+import xarray as xr
+import argparse, os, logging
+
+_logger = logging.getLogger(__name__)
+
+
+@benchmark_recipe
+def seasonal_maps(options: Union[dict, argparse.Namespace],
+                  verbose: Union[bool, str] = False,
+                  ) -> xr.Dataset:
+    """Execute a series of preprocessing steps and generate a diagnostic result.
+
+    The curve fitting is applied to the CO2 time series at every grid cell (and pressure level)
+    of a CMIP model, in batches of grid cells, and the resulting maps are written to a NetCDF file.
+
+    Parameters
+    ----------
+    options : Union[dict, argparse.Namespace]
+        Recipe options specified as key:value pairs. It can contain the following keys:
+            model_name : str, default 'CMIP.NOAA-GFDL.GFDL-ESM4.esm-hist.Amon.gr1'
+            cmip_load_method : str, default 'pangeo'
+                either 'pangeo' (which uses a stored url),
+                or 'local' (which uses the path defined in config file)
+            start_yr : str, default '1958'
+            end_yr : str, default '2014'
+            plev : int, default None
+                a sequence of pressure levels (Pa) to include. All levels are included by default.
+            chunk_size : int, default 1000
+                maximum number of grid cells that are curve fit together in each batch
+            figure_savepath : str, default None
+            netcdf_savepath : str, default None
+                if not given, the file is named after the figure_savepath
+    verbose : Union[bool, str]
+        can be either True, False, or a string for level such as "INFO, DEBUG, etc."
+
+    Returns
+    -------
+    xarray.Dataset
+        the map product, opened from the saved NetCDF file
+    """
+    set_verbose(_logger, verbose)
+    if verbose:
+        ProgressBar().register()
+    _logger.debug("Parsing diagnostic parameters...")
+    opts = parse_recipe_options(options, add_seasonal_maps_args_to_parser)
+
+    # --- Load CMIP model output ---
+    compare_against_model, ds_mdl = load_cmip_model_output(opts.model_name, opts.cmip_load_method, verbose=verbose)
+    if not compare_against_model:
+        raise ValueError('A model_name is required to make seasonal maps.')
+    ds_mdl, _, _, _, _ = apply_time_bounds(ds_mdl, time_limits=(np.datetime64(opts.start_yr),
+                                                                np.datetime64(opts.end_yr)))
+    if opts.plev:
+        ds_mdl = ds_mdl.sel(plev=opts.plev)
+
+    # --- Curve fitting at every grid cell, in batches ---
+    _logger.info('*Curve fitting at %s grid cells*', ds_mdl['co2'].size // ds_mdl.sizes['time'])
+    ds_maps = get_seasonal_maps_by_curve_fitting(ds_mdl['co2'], chunk_size=opts.chunk_size)
+    ds_maps.attrs.update(model_name=opts.model_name)
+
+    # The computation happens chunk by chunk as the file is written.
+    savepath = opts.netcdf_savepath
+    if savepath is None:
+        savepath = os.path.splitext(append_before_extension(opts.figure_savepath, 'seasonal_maps'))[0] + '.nc'
+    ds_maps.to_netcdf(savepath)
+
+    _logger.info("Saved at <%s>" % savepath)
+    return xr.open_dataset(savepath)
@@ -0,0 +1,127 @@
+""" This evaluates seasonal cycle metrics of atmospheric CO2 over a grid of curve fitting parameters
+This function parses:
+ - observational data from Globalview+ surface stations
+ - model output from CMIP6
+================================================================================
+"""
+from co2_diag import set_verbose, benchmark_recipe
+from co2_diag.recipe_parsers import parse_recipe_options, add_seasonal_sweep_args_to_parser
+from co2_diag.recipes.recipe_utils import populate_station_list
+from co2_diag.operations.Confrontation import Confrontation, load_cmip_model_output, get_seasonal_metrics_for_sweep
+from co2_diag.formatters import append_before_extension
+from dask.diagnostics import ProgressBar
+from datetime import datetime
+from itertools import product
+from typing import Union
+import numpy as np
+import pandas as pd
+import argparse, logging
+
+_logger = logging.getLogger(__name__)
+
+
+@benchmark_recipe
+def seasonal_sweep(options: Union[dict, argparse.Namespace],
+                   verbose: Union[bool, str] = False,
+                   ) -> pd.DataFrame:
+    """Execute a series of preprocessing steps and generate a diagnostic result.
+
+    Observations (and model output, if a model_name is given) are loaded and aligned once for each station,
+    over the widest time window. Seasonal cycle metrics are then calculated for every combination of
+    time window, number of harmonics and filter cutoffs, and written to a single table.
+
+    Parameters
+    ----------
+    options : Union[dict, argparse.Namespace]
+        Recipe options specified as key:value pairs. It can contain the following keys:
+            ref_data : str
+                (required) directory containing the NOAA Obspack NetCDF files
+            model_name : str, default ''
+            cmip_load_method : str, default 'pangeo'
+                either 'pangeo' (which uses a stored url),
+                or 'local' (which uses the path defined in config file)
+            start_yr : str, default '1958'
+            end_yr : str, default '2014'
+            figure_savepath : str, default None
+            globalmean : str
+                either 'station', which requires specifying the <station_code> parameter,
+                or 'global', which will calculate a global mean
+            station_list : str, default 'mlo'
+                a sequence of three letter codes (space-delimited) to specify
+                the desired surface observing station
+            shortterm : str, default '80'
+                a sequence of short-term filter cutoffs in days (space-delimited)
+            longterm : str, default '667'
+                a sequence of long-term filter cutoffs in days (space-delimited)
+            numharmonics : str, default '4'
+                a sequence of numbers of harmonics (space-delimited)
+            sweep_start_yr : str, default start_yr
+                a sequence of initial years of the time windows (space-delimited)
+            sweep_end_yr : str, default end_yr
+                a sequence of final years of the time windows (space-delimited)
+    verbose : Union[bool, str]
+        can be either True, False, or a string for level such as "INFO, DEBUG, etc."
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row of metrics for each station, source, and combination of parameters
+    """
+    set_verbose(_logger, verbose)
+    if verbose:
+        ProgressBar().register()
+    _logger.debug("Parsing diagnostic parameters...")
+    opts = parse_recipe_options(options, add_seasonal_sweep_args_to_parser)
+
+    start_yrs = opts.sweep_start_yr or [opts.start_yr]
+    end_yrs = opts.sweep_end_yr or [opts.end_yr]
+    year_windows = [(s, e) for s, e in product(start_yrs, end_yrs) if int(s) < int(e)]
+    if not year_windows:
+        raise ValueError('No time window has a start year before its end year.')
+    cutoffs = list(product(opts.shortterm, opts.longterm))
+    time_limits = (np.datetime64(min(start_yrs, key=int)), np.datetime64(max(end_yrs, key=int)))
+
+    stations_to_analyze = populate_station_list(opts.run_all_stations, opts.station_list,
+                                                region_name=opts.region_name, bbox=opts.bbox, datadir=opts.ref_data)
+
+    # --- Load CMIP model output ---
+    compare_against_model, ds_mdl = load_cmip_model_output(opts.model_name, opts.cmip_load_method, verbose=verbose)
+
+    # --- Load the data of each station once ---
+    conf = Confrontation(compare_against_model, ds_mdl, opts, stations_to_analyze, verbose)
+    series = _load_station_series(conf, time_limits)
+
+    _logger.info('*Evaluating %s parameter combinations at %s stations*',
+                 len(year_windows) * len(opts.numharmonics) * len(cutoffs), len(series))
+    df_metrics = get_seasonal_metrics_for_sweep(series, year_windows, opts.numharmonics, cutoffs)
+
+    filename = append_before_extension(opts.figure_savepath + '.csv',
+                                       'seasonal_sweep_metrics_' + datetime.now().strftime('%Y%m%d_%H%M%S'))
+    df_metrics.to_csv(filename, index=False)
+
+    _logger.info("Saved at <%s>" % filename)
+    return df_metrics
+
+
+def _load_station_series(conf: Confrontation,
+                         time_limits: tuple
+                         ) -> dict:
+    """Load the observations, and the model output at the same location, for each station of a Confrontation.
+
+    Returns
+    -------
+    dict
+        station name -> {'obs': (decimal times, values), 'mdl': (decimal times, values) or None}
+    """
+    series = {}
+    for station in conf.stations_to_analyze:
+        try:
+            _, ds_obs, da_mdl = conf.load_station(station, time_limits=time_limits)
+        except (RuntimeError, AssertionError) as re:
+            _logger.info('  skipping station <%s>: %s', station, re)
+            continue
+
+        series[station] = {'obs': (ds_obs['time_decimal'].values, ds_obs['co2'].values),
+                           'mdl': None if da_mdl is None else (da_mdl['time_decimal'].values, da_mdl.values)}
+
+    return series
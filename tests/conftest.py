@@ -5,3 +5,38 @@ import pytest
 @pytest.fixture
 def rootdir():
     return os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def obspack_dir(tmp_path, monkeypatch):
+    """A directory of small, synthetic ObsPack surface files: three for 'mlo' and one for 'brw'."""
+    import numpy as np
+    import xarray as xr
+
+    # File manifests are cached next to the test data, instead of in the user's cache directory.
+    monkeypatch.setenv('GDESS_CACHE_DIR', str(tmp_path / 'cache'))
+    tmp_path = tmp_path / 'globalview'
+    tmp_path.mkdir()
+    rng = np.random.default_rng(0)
+    for i, (station, project, n) in enumerate([('mlo', 'surface-flask', 30), ('mlo', 'surface-insitu', 40),
+                                               ('mlo', 'surface-pfp', 20), ('brw', 'surface-flask', 25)]):
+        time = np.sort(rng.integers(315532800, 1420070400, n))  # between 1980 and 2015
+        ds = xr.Dataset({'value': ('obs', (400 + rng.normal(0, 1, n)) * 1e-6,
+                                   {'units': 'mol mol-1', 'long_name': 'measured CO2 mole fraction'}),
+                         'time': ('obs', time, {'units': 'seconds since 1970-01-01T00:00:00Z'}),
+                         'start_time': ('obs', time, {'units': 'seconds since 1970-01-01T00:00:00Z'}),
+                         'time_decimal': ('obs', 1970 + time / 31556952),
+                         'latitude': ('obs', np.full(n, 71.3 if station == 'brw' else 19.5)),
+                         'longitude': ('obs', np.full(n, -156.6 if station == 'brw' else -155.6)),
+                         'altitude': ('obs', np.full(n, 11.0 if station == 'brw' else 3397.0), {'units': 'm'}),
+                         'qcflag': ('obs', np.array([b'...', b'.P.'] * n)[:n]),
+                         'obspack_num': ('obs', np.arange(n)),
+                         'obspack_id': ('obs', np.array([f'{station}~{project}~{j}'.encode() for j in range(n)])),
+                         'intake_height': ('obs', np.full(n, 40.0))},
+                        attrs={'site_name': 'Barrow' if station == 'brw' else 'Mauna Loa',
+                               'dataset_platform': 'fixed', 'dataset_project': project})
+        if project != 'surface-pfp':
+            ds['value_std_dev'] = ('obs', rng.random(n) * 1e-6)
+            ds['nvalue'] = ('obs', np.ones(n, dtype='int32'))
+        ds.to_netcdf(tmp_path / f'co2_{station}_{project}_1_representative.nc')
+    return tmp_path
@@ -1,13 +1,17 @@
 import pytest
-import os, datetime, tempfile
+import os, io, shutil, datetime, tempfile
 import numpy as np
 import pandas as pd
 import datacompy
 
-from ccgcrv.ccgcrv import ccgcrv
+from ccgcrv import ccg_benchmark
+from ccgcrv.ccgcrv import ccgcrv, ccgcrv_batch, read_data, write_columns
+from ccgcrv.ccg_benchmark import _benchmark_parser
+from ccgcrv.ccg_filter import ccgFilter, ccgFilterBatch, ccgFilterWindows, ccgFilterResult
 from ccgcrv.ccg_dates import datesOk, intDate, \
     getDate, toMonthDay, getDatetime, getTime, dec2date,\
-    dateFromDecimalDate, datetimeFromDateAndTime
+    dateFromDecimalDate, datetimeFromDateAndTime, calendarDate, decimalDate, decimalDateFromDatetime, datetimeFromDecimalDate, \
+    calendarDateArray, decimalDateArray, decimalDateFromDatetime64, datetime64FromDecimalDate
 
 
 @pytest.fixture
@@ -81,6 +85,82 @@ def test_curve_fitting_results_process_with_no_error(curvefilter):
         assert False, f"'run_recipe_for_timeseries' raised an exception {exc}"
 
 
+def test_binary_and_npy_input_match_text_input(rootdir):
+    mlotestdata_path = os.path.join(rootdir, 'test_data', 'mlotestdata.txt')
+    x, y = read_data(mlotestdata_path)
+
+    with tempfile.TemporaryDirectory() as td:
+        npy_file = os.path.join(td, 'mlotestdata.npy')
+        np.save(npy_file, np.column_stack((x, y)))
+        bin_file = os.path.join(td, 'mlotestdata.bin')
+        np.column_stack((x, y)).astype('<f8').tofile(bin_file)
+
+        for xb, yb in (read_data(npy_file), read_data(bin_file, binary=True)):
+            np.testing.assert_array_equal(xb, x)
+            np.testing.assert_array_equal(yb, y)
+
+
+def test_write_columns_matches_per_value_formatting():
+    x = np.array([1969.634922, 1969.6543190, 2001.0])
+    y = np.array([323.17, -1.5e-3, np.nan])
+    with io.StringIO() as fp:
+        write_columns(fp, "%4d %13.8f%13.6e", [np.array([1, 22, 333]), x, y], blocksize=2)
+        text = fp.getvalue()
+
+    expected = "".join("%4d %13.8f%13.6e\n" % (i, a, b) for i, a, b in zip([1, 22, 333], x, y))
+    assert text == expected
+
+
+def test_export_at_more_dates_than_data_points():
+    x = 2000 + np.arange(40) / 12
+    y = 370 + 1.5 * (x - 2000) + 3 * np.sin(2 * np.pi * x)
+
+    with tempfile.TemporaryDirectory() as td:
+        data_file = os.path.join(td, 'data.txt')
+        np.savetxt(data_file, np.column_stack((x, y)))
+        user_file = os.path.join(td, 'dates.txt')
+        np.savetxt(user_file, np.linspace(x[0], x[-1], 200))
+        output_file = os.path.join(td, 'output.txt')
+        sample_file = os.path.join(td, 'sample.txt')
+
+        for options in ({'file': output_file, 'trend': '', 'res': ''},
+                        {'file': output_file, 'samplefile': sample_file, 'sample': '',
+                         'orig': '', 'trend': '', 'detrend': ''}):
+            ccgcrv({'npoly': 2, 'nharm': 2, 'user': user_file, **options}, data_file)
+            # Columns are fixed width, and negative values leave no space between them.
+            assert np.genfromtxt(output_file, delimiter=13).shape[0] == 200
+
+        np.testing.assert_allclose(np.genfromtxt(sample_file, delimiter=13)[:, 1], y, rtol=1e-6)
+
+
+def test_batch_outputs_match_single_file_fits(rootdir):
+    mlotestdata_path = os.path.join(rootdir, 'test_data', 'mlotestdata.txt')
+    options = {'npoly': 2, 'nharm': 2, 'equal': '', 'showheader': '', 'smooth': '', 'trend': ''}
+
+    with tempfile.TemporaryDirectory() as td:
+        indir = os.path.join(td, 'in')
+        os.mkdir(indir)
+        for name in ('mlo1.txt', 'mlo2.txt'):
+            shutil.copy(mlotestdata_path, os.path.join(indir, name))
+
+        single_file = os.path.join(td, 'single.txt')
+        ccgcrv({**options, 'file': single_file}, mlotestdata_path)
+        combined_file = os.path.join(td, 'combined.txt')
+        nfailed = ccgcrv_batch(options, [indir], workers=2,
+                               outdir=os.path.join(td, 'out'), combined=combined_file)
+
+        assert nfailed == 0
+        with open(single_file) as f:
+            expected = f.read()
+        for name in ('mlo1.txt', 'mlo2.txt'):
+            with open(os.path.join(td, 'out', name)) as f:
+                assert f.read() == expected
+        df_combined = pd.read_csv(combined_file, sep='\s+')
+
+    assert list(df_combined.columns) == ['file', 'date', 'smooth', 'trend']
+    assert (df_combined['file'].value_counts() == len(expected.splitlines()) - 1).all()
+
+
 def test_dates_ok_bad_month():
     with pytest.raises(ValueError):
         datesOk(year=2021, month=0, day=10)
@@ -187,3 +267,224 @@ def test_decimal_dates():
     assert np.array_equal(dec2date(np.array([2021.3411]))[0, 0:5],
                           np.array([2021, 5, 5, 12, 2])
                           )
+
+
+def test_monthly_means_match_calendar_dates(curvefilter):
+    filt, _ = curvefilter
+
+    mm = filt.getMonthlyMeans()
+    ysmooth = filt.getSmoothValue(filt.xinterp)
+    months = np.array([(d.year, d.month) for d in map(filt.calendarDate, filt.xinterp)])
+    for (year, month, val, std, n) in mm:
+        w = (months[:, 0] == year) & (months[:, 1] == month)
+        assert n == w.sum()
+        assert np.isclose(val, ysmooth[w].mean())
+
+
+def test_trend_crossing_dates_bracket_sign_changes(curvefilter):
+    filt, _ = curvefilter
+
+    tcup, tcdown = filt.getTrendCrossingDates()
+    ycycle = filt.getHarmonicValue(filt.xinterp) + filt.smooth - filt.trend
+    for x in tcup:
+        i = np.searchsorted(filt.xinterp, x)
+        assert ycycle[i - 1] < 0 <= ycycle[i]
+    for x in tcdown:
+        i = np.searchsorted(filt.xinterp, x)
+        assert ycycle[i - 1] > 0 >= ycycle[i]
+
+
+def test_array_dates_match_scalar_dates():
+    decyears = np.array([1900.1643, 1958.2031, 2000.9999, 2020.1612, 2021.3411])
+    cal = np.column_stack(calendarDateArray(decyears))
+    for d, row in zip(decyears, cal):
+        assert tuple(row) == calendarDate(d)
+        assert decimalDateArray(*row) == decimalDate(*[int(v) for v in row])
+
+    dt = np.array(['1958-03-29T12:30:45', '2000-02-29T00:00:00', '2100-03-01T23:59:59'], dtype='datetime64[s]')
+    expected = [decimalDateFromDatetime(x) for x in dt.astype(datetime.datetime)]
+    assert np.array_equal(decimalDateFromDatetime64(dt), expected)
+    assert np.array_equal(datetime64FromDecimalDate(decyears),
+                          [np.datetime64(datetimeFromDecimalDate(d), 's') for d in decyears])
+
+
+def test_lin_interp_averages_duplicates_and_fills_gaps(curvefilter):
+    filt, _ = curvefilter
+
+    x = np.array([0.0, 0.1, 0.1, 0.2, 1.0, 1.1])
+    y = np.array([1.0, 2.0, 4.0, 3.0, 5.0, 6.0])
+    xi, yi = filt._lin_interp(x, y, gap=0)
+    assert np.allclose(yi, np.interp(xi, [0.0, 0.1, 0.2, 1.0, 1.1], [1.0, 3.0, 3.0, 5.0, 6.0]))
+
+    xi, yi = filt._lin_interp(x, y, gap=60)
+    in_gap = (xi > 0.2) & (xi < 1.0)
+    assert np.all(yi[in_gap] == 0)
+    assert np.all(yi[~in_gap] != 0)
+
+
+def test_update_with_appended_points_matches_full_refit():
+    rng = np.random.default_rng(0)
+    x = 1980 + np.arange(0, 30*365, 3) / 365.
+    y = 340 + 1.8*(x - 1980) + 3*np.sin(2*np.pi*x) + rng.normal(0, 0.5, x.size)
+    n = x.size - 10
+
+    filt = ccgFilter(x[:n], y[:n])
+    filt.update(x[n:], y[n:])
+    full = ccgFilter(x, y, timezero=filt.timezero, sampleinterval=filt.sampleinterval)
+
+    assert filt.np == x.size
+    assert np.array_equal(filt.xinterp, full.xinterp)
+    assert np.allclose(filt.params, full.params, rtol=1e-5, atol=1e-6)
+    for name in ('getSmoothValue', 'getTrendValue'):
+        diff = getattr(filt, name)(full.xinterp) - getattr(full, name)(full.xinterp)
+        assert np.nanmax(np.abs(diff)) < 0.02 * full.rsd1
+
+    with pytest.raises(ValueError):
+        filt.update(x[:1], y[:1])
+
+
+@pytest.mark.parametrize("suffix", ['.npz', '.nc', ''])
+def test_saved_fit_result_gives_same_values_as_filter(curvefilter, suffix):
+    filt, _ = curvefilter
+    x = np.linspace(filt.xp[0] - 1, filt.xp[-1] + 1, 500)
+
+    with tempfile.TemporaryDirectory() as td:
+        filename = os.path.join(td, 'result' + suffix)
+        filt.getResult().save(filename)
+        assert os.listdir(td) == [os.path.basename(filename)]
+        result = ccgFilterResult.load(filename)
+
+    assert np.array_equal(result.xinterp, filt.xinterp)
+    for name in ('getFunctionValue', 'getPolyValue', 'getHarmonicValue', 'getSmoothValue', 'getTrendValue'):
+        assert np.array_equal(getattr(result, name)(x), getattr(filt, name)(x), equal_nan=True)
+    assert np.allclose(result.getGrowthRateValue(filt.xinterp), filt.getGrowthRateValue(filt.xinterp))
+
+
+def test_fit_result_without_curves_has_only_function_values(curvefilter):
+    filt, _ = curvefilter
+    result = filt.getResult(curves=False)
+
+    assert np.array_equal(result.getFunctionValue(filt.xp), filt.getFunctionValue(filt.xp))
+    with pytest.raises(ValueError):
+        result.getTrendValue(filt.xp)
+
+
+def test_batch_filter_matches_single_series_filters():
+    rng = np.random.default_rng(0)
+    x = 1980 + (np.arange(12*30) + 0.5) / 12.
+    amplitude = np.array([[1.0], [4.0], [8.0]])
+    y = 340 + 1.5*(x - 1980) + amplitude*np.sin(2*np.pi*x) + rng.normal(0, 0.3, (3, x.size))
+
+    batch = ccgFilterBatch(x, y, numpolyterms=2, numharmonics=2)
+    xs = batch.xinterp[1:-1]
+    for i in range(y.shape[0]):
+        filt = ccgFilter(x, y[i], numpolyterms=2, numharmonics=2)
+        assert np.array_equal(batch.xinterp, filt.xinterp)
+        assert np.allclose(batch.params[i], filt.params, rtol=1e-5, atol=1e-5)
+        assert np.allclose(batch.getSmoothCycle()[i],
+                           filt.getHarmonicValue(filt.xinterp) + filt.smooth - filt.trend, atol=1e-4)
+        for name in ('getSmoothValue', 'getTrendValue', 'getGrowthRateValue'):
+            assert np.allclose(getattr(batch, name)(xs)[i], getattr(filt, name)(xs), atol=1e-4)
+        assert np.allclose(batch.getResult(i).getTrendValue(xs), filt.getTrendValue(xs), atol=1e-4)
+
+    y[1, 10] = np.nan
+    with pytest.raises(ValueError):
+        ccgFilterBatch(x, y)
+
+
+@pytest.mark.parametrize("numpoly, numharm", [(0, 2), (2, 0)])
+def test_batch_filter_without_poly_or_harmonic_terms(numpoly, numharm):
+    x = 1980 + (np.arange(12*10) + 0.5) / 12.
+    y = 340 + 1.5*(x - 1980) + np.array([[1.0], [4.0]])*np.sin(2*np.pi*x)
+
+    batch = ccgFilterBatch(x, y, numpolyterms=numpoly, numharmonics=numharm)
+    without_terms, with_terms = ('getPolyValue', 'getHarmonicValue')[::1 if numpoly == 0 else -1]
+    assert np.array_equal(getattr(batch, without_terms)(x), np.zeros(y.shape))
+    assert np.allclose(getattr(batch, with_terms)(x), batch.getFunctionValue(x))
+
+
+def test_sliding_windows_match_single_window_filters():
+    rng = np.random.default_rng(0)
+    step = 7 / 365.
+    x = 1980 + np.arange(int(20 / step)) * step
+    amplitude = 3 + 0.1*(x - 1980)
+    y = 350 + 1.5*(x - 1980) + amplitude*np.sin(2*np.pi*x) + rng.normal(0, 0.5, x.size)
+
+    windows = ccgFilterWindows(x, y, window=10, stride=2, sampleinterval=7)
+    assert windows.nwindows == 6
+    assert np.allclose(windows.xstart - windows.xstart[0], np.arange(6) * 2, atol=step)
+    for k in (0, windows.nwindows - 1):
+        xw = x[windows.start[k]:windows.end[k]]
+        filt = ccgFilter(xw, y[windows.start[k]:windows.end[k]], sampleinterval=7)
+        assert windows.timezero[k] == filt.timezero
+        assert np.allclose(windows.params[0, k], filt.params, atol=1e-4)
+        assert np.allclose(windows.getResult(0, k).getSmoothValue(xw[1:-1]), filt.getSmoothValue(xw[1:-1]), atol=1e-4)
+    # the cycle is a sine wave with the amplitude at the middle of the window
+    assert np.allclose(windows.amplitude[0], 2*(3 + 0.1*(windows.xcenter - 1980)), rtol=0.05)
+    assert np.allclose(windows.maxphase[0], 0.25, atol=0.03)
+
+    with pytest.raises(ValueError):
+        ccgFilterWindows(x, y, window=30)
+
+
+def test_bootstrap_bands_are_reproducible_and_bracket_the_fit():
+    rng = np.random.default_rng(1)
+    x = 1980 + (np.arange(12*20) + 0.5) / 12.
+    y = 340 + 1.5*(x - 1980) + 3*np.sin(2*np.pi*x) + rng.normal(0, 0.5, x.size)
+    filt = ccgFilter(x, y)
+
+    bands = filt.getBootstrapBands(nsamples=200, seed=42)
+    again = filt.getBootstrapBands(nsamples=200, seed=42)
+    chunked = filt.getBootstrapBands(nsamples=200, seed=42, chunksize=30)
+    for key in bands:
+        assert np.array_equal(bands[key], again[key])
+        assert np.allclose(bands[key], chunked[key])
+
+    assert bands['cycle'].shape == (3, 12)
+    assert np.all(np.diff(bands['cycle'], axis=0) >= 0)
+    assert np.all(np.diff(bands['growth_rate'], axis=0) >= 0)
+    assert np.array_equal(bands['xinterp'], filt.xinterp)
+    trend = filt.getTrendValue(filt.xinterp)
+    assert np.all((bands['trend'][0] <= trend) & (trend <= bands['trend'][-1]))
+
+
+def test_benchmark_checks_outputs_against_saved_reference():
+    with tempfile.TemporaryDirectory() as td:
+        reference = os.path.join(td, 'reference.npz')
+        out = io.StringIO()
+        assert ccg_benchmark._main(_benchmark_parser().parse_args(['--sizes', '800', '--repeat', '1', '--save', reference]), out) == 0
+        assert 'getMonthlyMeans' in out.getvalue()
+        assert 'mlotestdata.txt: output matches expected_curvefit_results.txt' in out.getvalue()
+
+        options = _benchmark_parser().parse_args(['--sizes', '800', '--repeat', '1', '--check', reference])
+        assert ccg_benchmark._main(options, io.StringIO()) == 0
+
+        values = dict(np.load(reference))
+        values['800/trend'] = values['800/trend'] + 1e-3
+        np.savez(reference, **values)
+        out = io.StringIO()
+        assert ccg_benchmark._main(options, out) == 1
+        assert 'differ from reference: trend' in out.getvalue()
+
+
+def test_benchmark_checks_expected_curvefit_results(rootdir):
+    assert ccg_benchmark.check_expected_results() == []
+
+    expected_results_path = os.path.join(rootdir, 'test_data', 'expected_curvefit_results.txt')
+    df_expected = pd.read_csv(expected_results_path, sep='\s+')
+    df_expected['trend'] += 1e-2
+    with tempfile.TemporaryDirectory() as td:
+        changed = os.path.join(td, 'expected.txt')
+        df_expected.to_csv(changed, sep=' ', index=False)
+        assert ccg_benchmark.check_expected_results(expected_file=changed) == ['trend']
+        assert ccg_benchmark.check_expected_results(expected_file=changed, rtol=1e-3) == []
+
+
+def test_refilter_matches_new_filter_with_the_same_cutoffs(rootdir):
+    data = np.loadtxt(os.path.join(rootdir, 'test_data', 'mlotestdata.txt'))
+    filt = ccgFilter(data[:, 0], data[:, 1])
+    other = ccgFilter(data[:, 0], data[:, 1], 40, 300)
+    filt.refilter(40, 300)
+    for name in ('params', 'xinterp', 'smooth', 'trend', 'deriv'):
+        assert np.array_equal(getattr(filt, name), getattr(other, name))
+    assert filt.rsd2 == other.rsd2
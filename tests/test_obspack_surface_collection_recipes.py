@@ -1,9 +1,23 @@
 import os
+import glob
 import pytest
+import numpy as np
 import xarray as xr
+from concurrent.futures.process import BrokenProcessPool
 
 from co2_diag import load_stations_dict
 from co2_diag.data_source.observations.gvplus_surface import Collection
+from co2_diag.data_source.observations.load import dataset_from_filelist, preprocess_obspack_dataset, qcflag_filter, \
+    file_executor, shutdown_file_executors, encode_flag_variable
+from co2_diag.data_source.observations.gvplus_manifest import load_manifest, manifest_path, files_by_station, \
+    station_files, station_metadata
+from co2_diag.data_source.observations.gvplus_name_utils import get_dict_of_station_codes_and_names
+from co2_diag.data_source.observations.gvplus_store import build_store, load_station_from_store
+from co2_diag.data_source.observations.ragged import select_station, reduce_by_station
+from co2_diag.operations.datasetdict import LazyDatasetDict
+from co2_diag.data_source.observations.subset import decode_flag_meanings, by_flag_meaning, by_platform, by_project
+from co2_diag.data_source.observations.station_registry import StationRegistry
+from co2_diag.recipes.recipe_utils import populate_station_list
 
 
 @pytest.fixture
@@ -60,3 +74,247 @@ def test_timeseries_recipe_completes_with_no_errors(rootdir, newEmptySurfaceStat
         newEmptySurfaceStation.run_recipe_for_timeseries(verbose='DEBUG', options=recipe_options)
     except Exception as exc:
         assert False, f"'run_recipe_for_timeseries' raised an exception {exc}"
+
+
+def test_dataset_from_filelist_prunes_and_fills_variables(obspack_dir):
+    file_list = sorted(glob.glob(os.path.join(obspack_dir, 'co2_mlo_*.nc')))
+    ds = dataset_from_filelist(file_list)
+
+    assert ds.sizes['obs'] == 90
+    assert 'intake_height' not in ds
+    assert ds['pressure'].isnull().all()
+    # the 'pfp' file has no 'nvalue' or 'value_std_dev'
+    assert ds['nvalue'].isnull().sum() == 20
+    assert set(decode_flag_meanings(ds['dataset_project'])) == {'surface-flask', 'surface-insitu', 'surface-pfp'}
+    assert ds['altitude'].attrs['units'] == 'm'
+    assert ds.attrs['site_name'] == 'Mauna Loa'
+
+
+def test_dataset_from_filelist_matches_concat_and_workers(obspack_dir):
+    file_list = sorted(glob.glob(os.path.join(obspack_dir, 'co2_mlo_*.nc')))
+    ds = dataset_from_filelist(file_list)
+
+    expected = xr.concat([preprocess_obspack_dataset(xr.open_dataset(f, decode_times=False)) for f in file_list],
+                         dim='obs')
+    flag_vars = ['dataset_platform', 'dataset_project']
+    xr.testing.assert_identical(ds.drop_vars(flag_vars), expected.drop_vars(flag_vars))
+    projects = np.concatenate([[os.path.basename(f).split('_')[2]] * n for f, n in zip(file_list, [30, 40, 20])])
+    np.testing.assert_array_equal(decode_flag_meanings(ds['dataset_project']), projects)
+    xr.testing.assert_identical(dataset_from_filelist(file_list, max_workers=2), ds)
+
+
+def test_preprocess_with_workers_shares_one_process_pool(obspack_dir):
+    serial = Collection()
+    serial.preprocess(datadir=str(obspack_dir), station_name=['mlo', 'brw'])
+
+    executor = file_executor(2)
+    concurrent = Collection()
+    concurrent.preprocess(datadir=str(obspack_dir), station_name=['mlo', 'brw'], max_workers=2)
+    for k in ['mlo', 'brw']:
+        xr.testing.assert_identical(concurrent.stepA_original_datasets[k], serial.stepA_original_datasets[k])
+    assert file_executor(2) is executor
+
+
+def test_broken_process_pool_is_replaced(obspack_dir):
+    file_list = sorted(glob.glob(os.path.join(obspack_dir, 'co2_mlo_*.nc')))
+    broken = file_executor(2)
+    with pytest.raises(BrokenProcessPool):
+        broken.submit(os._exit, 1).result()
+
+    xr.testing.assert_identical(dataset_from_filelist(file_list, max_workers=2), dataset_from_filelist(file_list))
+    replacement = file_executor(2)
+    assert replacement is not broken
+
+    shutdown_file_executors()
+    assert file_executor(2) is not replacement
+
+
+def test_dataset_platform_and_project_are_flag_encoded(obspack_dir):
+    file_list = sorted(glob.glob(os.path.join(obspack_dir, 'co2_mlo_*.nc')))
+    ds = dataset_from_filelist(file_list)
+
+    assert ds['dataset_project'].dtype == 'uint8'
+    assert ds['dataset_project'].attrs['flag_meanings'] == 'surface-flask surface-insitu surface-pfp'
+    assert list(ds['dataset_project'].attrs['flag_values']) == [0, 1, 2]
+    assert list(np.bincount(ds['dataset_project'].values)) == [30, 40, 20]
+
+    insitu = by_project(ds, 'surface-insitu')
+    assert insitu.sizes['obs'] == 40
+    assert (decode_flag_meanings(insitu['dataset_project']) == 'surface-insitu').all()
+    assert by_project(ds, ['surface-flask', 'surface-pfp']).sizes['obs'] == 50
+    assert by_platform(ds, 'fixed').sizes['obs'] == 90
+    with pytest.raises(ValueError, match='surface-flask'):
+        by_project(ds, 'aircraft-pfp')
+
+
+def test_flag_meaning_query_with_blanks_matches_encoded_meaning():
+    ds = xr.Dataset({'category': encode_flag_variable(np.array([0, 1, 1, 0], dtype='uint8'),
+                                                      ['tall tower', 'ship'], 'obs')})
+
+    assert ds['category'].attrs['flag_meanings'] == 'tall_tower ship'
+    assert by_flag_meaning(ds, 'category', 'tall tower').sizes['obs'] == 2
+    assert by_flag_meaning(ds, 'category', ['tall_tower', 'ship']).sizes['obs'] == 4
+
+
+def test_gvplus_store_matches_files_and_rebuilds_on_change(obspack_dir, tmp_path):
+    store_path = os.path.join(tmp_path, 'store')
+    assert build_store(str(obspack_dir), store_path, ['mlo', 'brw']) == ['mlo', 'brw']
+    assert build_store(str(obspack_dir), store_path, ['mlo', 'brw']) == []
+
+    from_files = Collection()
+    from_files.preprocess(datadir=str(obspack_dir), station_name=['mlo', 'brw'])
+    from_store = Collection()
+    from_store.preprocess(datadir=str(obspack_dir), station_name=['mlo', 'brw'], store_path=store_path)
+    for station in ['mlo', 'brw']:
+        expected = from_files.stepA_original_datasets[station]
+        stored = from_store.stepA_original_datasets[station]
+        xr.testing.assert_equal(stored, expected)
+        assert stored['co2'].attrs['units'] == 'ppm'
+        assert from_store.station_dict[station]['lat'] == from_files.station_dict[station]['lat']
+
+    # A changed source file causes that station, and only that station, to be rebuilt.
+    file_list = sorted(glob.glob(os.path.join(obspack_dir, 'co2_brw_*.nc')))
+    ds = xr.load_dataset(file_list[0])
+    xr.concat([ds, ds.isel(obs=[0])], dim='obs').to_netcdf(file_list[0])
+    ds_brw = load_station_from_store(store_path, str(obspack_dir), 'brw')
+    assert ds_brw.sizes['time'] == ds.sizes['obs']  # the duplicate record is dropped
+    assert build_store(str(obspack_dir), store_path, ['mlo', 'brw']) == []
+
+
+def test_gvplus_manifest_is_cached_and_revalidated(obspack_dir, tmp_path):
+    cache_dir = os.path.join(tmp_path, 'manifests')
+    manifest = load_manifest(str(obspack_dir), cache_dir)
+
+    assert os.path.isfile(manifest_path(str(obspack_dir), cache_dir))
+    entry = manifest['files']['co2_brw_surface-flask_1_representative.nc']
+    assert entry['station'] == 'brw'
+    assert '1980-01-01' <= entry['time_start'] <= entry['time_end'] <= '2015-01-01'
+    assert sorted(files_by_station(str(obspack_dir), cache_dir)) == ['brw', 'mlo']
+    assert [os.path.basename(f) for f in station_files(str(obspack_dir), 'mlo')] == \
+           sorted(os.path.basename(f) for f in glob.glob(os.path.join(obspack_dir, 'co2_mlo*.nc')))
+
+    # Later loads in the session reuse the manifest, without listing the directory again.
+    xr.open_dataset(os.path.join(obspack_dir, 'co2_brw_surface-flask_1_representative.nc')).to_netcdf(
+        os.path.join(obspack_dir, 'co2_spo_surface-flask_1_representative.nc'))
+    assert load_manifest(str(obspack_dir), cache_dir) is manifest
+
+    # With a refresh, a new file is found, without re-reading the headers of the unchanged files.
+    updated = load_manifest(str(obspack_dir), cache_dir, refresh=True)
+    assert 'spo' in files_by_station(str(obspack_dir), cache_dir)
+    assert updated['files']['co2_brw_surface-flask_1_representative.nc'] is entry
+
+    # A file rewritten in place (which leaves the directory's modification time unchanged) is read again.
+    filename = os.path.join(obspack_dir, 'co2_spo_surface-flask_1_representative.nc')
+    with xr.open_dataset(filename) as ds:
+        ds_south = ds.load().isel(obs=slice(10))
+    ds_south['latitude'][:] = -89.98
+    ds_south.to_netcdf(filename)
+    metadata = station_metadata(str(obspack_dir), cache_dir, refresh=True)['spo']
+    assert (metadata['nobs'], metadata['lat']) == (10, pytest.approx(-89.98))
+
+
+def test_lazy_preprocess_loads_stations_on_first_access(obspack_dir):
+    eager = Collection()
+    eager.preprocess(datadir=str(obspack_dir), station_name=['mlo', 'brw'])
+
+    lazy = Collection()
+    lazy.preprocess(datadir=str(obspack_dir), station_name=['mlo', 'brw'], lazy=True, max_loaded=1)
+    datasets = lazy.stepA_original_datasets
+    assert isinstance(datasets, LazyDatasetDict)
+    assert list(datasets.keys()) == ['mlo', 'brw']
+    assert not datasets.is_loaded('mlo') and not datasets.is_loaded('brw')
+
+    xr.testing.assert_identical(datasets['brw'], eager.stepA_original_datasets['brw'])
+    assert datasets.is_loaded('brw') and not datasets.is_loaded('mlo')
+    assert lazy.station_dict['brw']['lat'] == eager.station_dict['brw']['lat']
+
+    # With max_loaded=1, loading 'mlo' drops 'brw', which is loaded again when needed.
+    xr.testing.assert_identical(datasets['mlo'], eager.stepA_original_datasets['mlo'])
+    assert datasets.is_loaded('mlo') and not datasets.is_loaded('brw')
+    assert dict(datasets.items()).keys() == {'mlo', 'brw'}
+
+
+def test_qcflag_and_variable_pushdown_at_load_time(obspack_dir, tmp_path):
+    unfiltered = Collection()
+    unfiltered.preprocess(datadir=str(obspack_dir), station_name='mlo')
+    n_accepted = int((unfiltered.stepA_original_datasets['mlo']['qcflag'] == b'...').sum())
+
+    filtered = Collection()
+    filtered.preprocess(datadir=str(obspack_dir), station_name='mlo',
+                        vars_to_keep=['value', 'time', 'qcflag', 'latitude', 'longitude', 'altitude'],
+                        row_filter=qcflag_filter('...'))
+    ds = filtered.stepA_original_datasets['mlo']
+    assert 0 < ds.sizes['time'] == n_accepted < unfiltered.stepA_original_datasets['mlo'].sizes['time']
+    assert (ds['qcflag'] == b'...').all()
+    assert 'obspack_id' not in ds
+
+    # With a store, the filter is applied to the stored station.
+    stored = Collection()
+    stored.preprocess(datadir=str(obspack_dir), station_name='mlo',
+                      store_path=str(tmp_path / 'store'), row_filter=qcflag_filter('...'))
+    assert stored.stepA_original_datasets['mlo'].sizes['time'] == n_accepted
+
+
+def test_ragged_dataset_of_all_stations(obspack_dir):
+    collection = Collection()
+    collection.preprocess(datadir=str(obspack_dir), station_name=['mlo', 'brw'])
+    ds = collection.get_ragged_dataset()
+
+    assert ds.attrs['featureType'] == 'timeSeries'
+    assert list(ds['station_id'].values) == ['mlo', 'brw']
+    assert list(ds['row_size'].values) == [90, 25]
+    assert ds.sizes['obs'] == 115
+    assert ds['station_latitude'].values[1] == collection.station_dict['brw']['lat']
+
+    for station in ['mlo', 'brw']:
+        original = collection.stepA_original_datasets[station]
+        one = select_station(ds, station)
+        np.testing.assert_array_equal(one['co2'].values, original['co2'].values)
+        np.testing.assert_array_equal(one['time'].values, original['time'].values)
+        np.testing.assert_array_equal(decode_flag_meanings(one['dataset_project']),
+                                      decode_flag_meanings(original['dataset_project']))
+
+    means = reduce_by_station(ds, 'co2', 'mean')
+    np.testing.assert_allclose(means.values, [collection.stepA_original_datasets[s]['co2'].mean().item()
+                                              for s in ['mlo', 'brw']])
+    np.testing.assert_array_equal(reduce_by_station(ds, 'co2', 'max').values,
+                                  [collection.stepA_original_datasets[s]['co2'].max().item() for s in ['mlo', 'brw']])
+
+
+def test_station_metadata_from_the_manifest(obspack_dir):
+    metadata = station_metadata(str(obspack_dir))
+    assert sorted(metadata) == ['brw', 'mlo']
+    assert metadata['mlo']['name'] == 'Mauna Loa'
+    assert (metadata['mlo']['nfiles'], metadata['mlo']['nobs']) == (3, 90)
+    assert metadata['brw']['lat'] == pytest.approx(71.3)
+    assert metadata['brw']['lon'] == pytest.approx(360 - 156.6)
+
+    collection = Collection()
+    collection.preprocess(datadir=str(obspack_dir), station_name='mlo')
+    ds = collection.stepA_original_datasets['mlo']
+    assert metadata['mlo']['alts'] == pytest.approx(collection.station_dict['mlo']['alts'])
+    assert metadata['mlo']['time_start'] == str(ds['time'].values[0].astype('datetime64[s]'))
+    assert metadata['mlo']['time_end'] == str(ds['time'].values[-1].astype('datetime64[s]'))
+
+    assert get_dict_of_station_codes_and_names(str(obspack_dir)) == {'brw': {'name': 'Barrow'},
+                                                                     'mlo': {'name': 'Mauna Loa'}}
+
+
+def test_station_registry_spatial_queries():
+    registry = StationRegistry(['alt', 'mhd', 'mlo', 'smo', 'spo'],
+                               lat=[82.5, 53.3, 19.5, -14.2, -90.0],
+                               lon=[-62.5, -9.9, -155.6, -170.6, -24.8])
+    assert registry.latitude_band(-30, 60) == ['mhd', 'mlo', 'smo']
+    assert registry.bbox(0, 90, 180, 310) == ['alt', 'mlo']
+    # A box that crosses the prime meridian, with longitudes from -180 to 180
+    assert registry.bbox(40, 60, -20, 10) == ['mhd']
+    assert registry.region('Arctic') == ['alt']
+    assert registry.nearest(lat=20.0, lon=204.0, n=2) == ['mlo', 'smo']
+    with pytest.raises(ValueError):
+        registry.region('Atlantis')
+
+
+def test_region_selects_stations_from_the_manifest(obspack_dir):
+    assert populate_station_list(False, ['mlo'], region_name='Arctic', datadir=str(obspack_dir)) == ['brw']
+    assert populate_station_list(True, None, bbox=[0, 30, 180, 250], datadir=str(obspack_dir)) == ['mlo']
+    assert populate_station_list(False, ['mlo']) == ['mlo']
@@ -1,11 +1,14 @@
-from co2_diag.operations.time import ensure_datetime64_array, ensure_cftime_array, monthlist, dt2t
+from co2_diag.operations.time import ensure_datetime64_array, ensure_cftime_array, monthlist, dt2t, select_between, \
+    select_between_arrays, monthly_means_and_counts
 from co2_diag.operations.convert import co2_kgfrac_to_ppm
 from co2_diag.operations.utils import print_var_summary, assert_expected_dimensions
-from co2_diag.operations.Confrontation import extract_site_data_from_dataset
+from co2_diag.operations.Confrontation import extract_site_data_from_dataset, get_seasonal_maps_by_curve_fitting, \
+    get_seasonal_metrics_for_sweep, get_seasonal_by_reference_detrending, get_seasonal_by_curve_fitting, bin_by_latitude
+from ccgcrv.ccg_filter import ccgFilter
 import numpy as np
 import pandas as pd
 import xarray as xr
-import cftime, pytest, logging
+import argparse, cftime, pytest, logging
 
 
 @pytest.fixture
@@ -91,6 +94,26 @@ def test_month_list_generation():
     assert monthlist(['2020-11-01', '2021-05-05']) == expected
 
 
+def test_monthly_means_and_counts_match_xarray_resample():
+    np.random.seed(0)
+    time = np.sort(np.datetime64('2000-01-01') + np.random.randint(0, 400, 300).astype('timedelta64[D]'))
+    co2 = 400 + np.random.rand(300)
+    co2[:5] = np.nan
+    ds = xr.Dataset({'co2': ('time', co2)}, coords={'time': time})
+
+    timestart, timeend = np.datetime64('2000-02-10'), np.datetime64('2000-12-31')
+    time_sub, co2_sub = select_between_arrays(time, co2, timestart=timestart, timeend=timeend)
+    expected_sub = select_between(ds, timestart=timestart, timeend=timeend, varlist=['time', 'co2'])
+    np.testing.assert_array_equal(time_sub, expected_sub['time'].values)
+    np.testing.assert_array_equal(co2_sub, expected_sub['co2'].values)
+
+    month_start, means, counts = monthly_means_and_counts(time_sub, co2_sub)
+    expected = expected_sub.resample(time='1MS').mean().dropna(dim='time')
+    np.testing.assert_array_equal(month_start, expected['time'].values)
+    np.testing.assert_allclose(means, expected['co2'].values)
+    assert counts.sum() == np.count_nonzero(~np.isnan(co2_sub))
+
+
 def test_unit_conversion_dataset(dataset_withco2andzg):
     an_original_value = dataset_withco2andzg['co2'].isel(lon=0, lat=0, plev=0, time=0).values
 
@@ -145,3 +168,93 @@ def test_extract_site_data(dataset_withco2andzg):
     assert assert_expected_dimensions(da,
                                       expected_dims=['plev', 'time'],
                                       expected_shape={'plev': 3, 'time': 4})
+
+
+def test_seasonal_maps_match_single_cell_curve_fit():
+    rng = np.random.default_rng(0)
+    time = pd.date_range("1980-01-01", periods=12*20, freq="MS") + pd.Timedelta(days=14)
+    x = (time.year + (time.dayofyear - 0.5) / 365).values
+    lat = [-45, 0, 45]
+    lon = [0, 90, 180, 270]
+    co2 = 340 + 1.7*(x - 1980) + 3*np.sin(2*np.pi*(x - 0.25)) + rng.normal(0, 0.3, (3, 4, x.size))
+    co2[0, 0, 10] = np.nan
+    da = xr.DataArray(co2, dims=["lat", "lon", "time"], coords=dict(lat=lat, lon=lon, time=time),
+                      attrs={'units': 'ppm'})
+    da = da.assign_coords(time_decimal=('time', x))
+
+    ds = get_seasonal_maps_by_curve_fitting(da, chunk_size=5)
+    assert ds['growth_rate'].chunks == ((1, 1, 1), (4,))
+    ds = ds.compute()
+
+    assert np.isnan(ds['seasonal_amplitude'].values[0, 0])
+    filt = ccgFilter(x, co2[1, 2], timezero=int(x[0]))
+    tcup, tcdown = filt.getTrendCrossingDates()
+    assert np.isclose(ds['growth_rate'].values[1, 2], filt.deriv.mean())
+    assert np.isclose(ds['upward_crossing_doy'].values[1, 2], np.mean(np.array(tcup) % 1) * 365, atol=1)
+    assert 5 < ds['seasonal_amplitude'].values[1, 2] < 7
+
+
+def test_seasonal_sweep_metrics_match_separate_fits():
+    rng = np.random.default_rng(0)
+    x = 1980 + (np.arange(12*20) + 0.5) / 12
+    y_obs = 340 + 1.7*(x - 1980) + 3*np.sin(2*np.pi*x) + rng.normal(0, 0.3, x.size)
+    y_mdl = y_obs + 0.5*np.cos(2*np.pi*x)
+    series = {'mlo': {'obs': (x, y_obs), 'mdl': (x, y_mdl)},
+              'brw': {'obs': (x[:6], y_obs[:6]), 'mdl': None}}
+
+    df = get_seasonal_metrics_for_sweep(series, [("1980", "1990"), ("1985", "2000")], [2, 4], [(80, 667), (40, 300)])
+    # the station with less than a year of data is skipped
+    assert len(df) == 2 * 2 * 2 * 2
+    assert df.loc[df['source'] == 'obs', 'rmse'].isnull().all()
+    assert (df.loc[df['source'] == 'mdl', 'rmse'] > 0).all()
+
+    row = df.query("source == 'obs' and start_yr == '1985' and numharmonics == 2 and shortterm == 40").iloc[0]
+    keep = (x >= 1985) & (x <= 2000)
+    filt = ccgFilter(x[keep], y_obs[keep], shortterm=40, longterm=300, numharmonics=2, timezero=1985)
+    assert np.isclose(row['growth_rate'], filt.deriv.mean())
+    assert 5.5 < row['amplitude'] < 6.5
+
+
+def test_reference_detrending_cycle_matches_station_curve_fit():
+    rng = np.random.default_rng(1)
+    time = pd.date_range("1980-01-01", periods=12*20, freq="MS") + pd.Timedelta(days=14)
+    x = (time.year + (time.dayofyear - 0.5) / 365).values
+    trend = 340 + 1.7*(x - 1980) + 0.01*(x - 1980)**2
+
+    def station_dataset(offset, amplitude):
+        co2 = trend + offset + amplitude*np.sin(2*np.pi*x) + rng.normal(0, 0.2, x.size)
+        return xr.Dataset({'co2': ('time', co2)}, coords={'time': time, 'time_decimal': ('time', x)})
+
+    ds_ref = station_dataset(0, 3)
+    reference_filters = {'ref': ccgFilter(x, ds_ref['co2'].values, timezero=int(x[0]))}
+
+    ds_obs = station_dataset(2.5, 8)
+    ref_dt, ref_vals, mdl_dt, mdl_vals = get_seasonal_by_reference_detrending(False, None, ds_obs,
+                                                                              reference_filters, 'brw')
+    fit_dt, fit_vals, _, _ = get_seasonal_by_curve_fitting(False, None, ds_obs,
+                                                           argparse.Namespace(plot_filter_components=False), 'brw')
+    assert mdl_vals is None
+    assert ref_dt.equals(fit_dt)
+    assert np.isclose(ref_vals.mean(), 0)
+    assert np.allclose(ref_vals, fit_vals, atol=0.5)
+
+
+def test_bin_by_latitude_means_stations_in_each_bin():
+    months = pd.to_datetime(np.arange(1, 13), format='%m')
+    codes = ['aaa', 'bbb', 'ccc', 'ddd']
+    cycles = pd.DataFrame({'month': months, 'aaa': 1.0, 'bbb': 2.0, 'ccc': 4.0, 'ddd': 8.0})
+    cycles.loc[3, 'ccc'] = np.nan
+    metadata = pd.DataFrame({'lat': [10., -35., 12., 71.], 'lon': [100., 20., -150., -156.],
+                             'code': codes, 'fullname': codes})
+
+    binned, _ = bin_by_latitude(False, {'ref': cycles.copy(), 'mdl': None}, metadata.copy(), 30)
+    binned = binned['ref']
+    assert list(binned.columns) == ['month', -60.0, 0.0, 60.0]
+    assert binned['month'].equals(cycles['month'])
+    assert np.allclose(binned[0.0].drop(index=3), 2.5)
+    assert binned.loc[3, 0.0] == 1.0
+
+    binned, df_metadata = bin_by_latitude(False, {'ref': cycles.copy(), 'mdl': None}, metadata.copy(), 30, 180)
+    assert list(binned['ref'].columns) == ['month', '-60, 0', '0, -180', '0, 0', '60, -180']
+    assert np.allclose(binned['ref']['0, -180'].drop(index=3), 4.0)
+    assert list(df_metadata['lonbin']) == [0., 0., -180., -180.]
@@ -0,0 +1,34 @@
+import pytest
+
+from co2_diag.recipes import seasonal_maps
+
+
+def test_recipe_input_year_error():
+    recipe_options = {
+        'model_name': 'BCC.esm-hist',
+        'start_yr': "198012",
+        'end_yr': "201042",
+        'figure_savepath': './outputs'}
+    with pytest.raises(SystemExit):
+        seasonal_maps(verbose='DEBUG', options=recipe_options)
+
+
+def test_recipe_input_model_error():
+    recipe_options = {
+        'model_name': 'BCasdasdjkhgC',
+        'start_yr': "1980",
+        'end_yr': "2010",
+        'figure_savepath': './outputs'}
+    with pytest.raises(SystemExit):
+        seasonal_maps(verbose='DEBUG', options=recipe_options)
+
+
+def test_recipe_input_obspack_option_error():
+    recipe_options = {
+        'model_name': 'BCC.esm-hist',
+        'start_yr': "1980",
+        'end_yr': "2010",
+        'max_workers': 2,
+        'figure_savepath': './outputs'}
+    with pytest.raises(SystemExit):
+        seasonal_maps(verbose='DEBUG', options=recipe_options)
@@ -0,0 +1,44 @@
+import os
+import pytest
+
+from co2_diag.recipes import seasonal_sweep
+
+
+@pytest.fixture
+def globalview_test_data_path(rootdir):
+    return os.path.join(rootdir, 'test_data', 'globalview')
+
+
+def test_recipe_input_year_error(globalview_test_data_path):
+    recipe_options = {
+        'ref_data': globalview_test_data_path,
+        'start_yr': "1980",
+        'end_yr': "2010",
+        'sweep_start_yr': "1980 198012",
+        'figure_savepath': './outputs',
+        'station_list': 'mlo'}
+    with pytest.raises(SystemExit):
+        seasonal_sweep(verbose='DEBUG', options=recipe_options)
+
+
+def test_recipe_input_cutoff_error(globalview_test_data_path):
+    recipe_options = {
+        'ref_data': globalview_test_data_path,
+        'start_yr': "1980",
+        'end_yr': "2010",
+        'shortterm': "40 eighty",
+        'figure_savepath': './outputs',
+        'station_list': 'mlo'}
+    with pytest.raises(SystemExit):
+        seasonal_sweep(verbose='DEBUG', options=recipe_options)
+
+
+def test_recipe_empty_year_windows_error(globalview_test_data_path):
+    recipe_options = {
+        'ref_data': globalview_test_data_path,
+        'sweep_start_yr': "2000",
+        'sweep_end_yr': "1990",
+        'figure_savepath': './outputs',
+        'station_list': 'mlo'}
+    with pytest.raises(ValueError):
+        seasonal_sweep(verbose='DEBUG', options=recipe_options)